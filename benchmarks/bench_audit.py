@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# Benchmark of the parallel fleet audit on many synthetic homes
+#
+# Creates homes with a device-volumes TDB and default sink/source files
+# each, one of them with a corrupted entry, then audits all of them with 1,
+# 2, 4... processes up to the number of CPUs. Checks that every run gives
+# the same report and prints the speedup over one process. Needs the tdb
+# module, the DBs have to be real files for the worker processes.
+#
+# usage: python3 benchmarks/bench_audit.py [homes] [devices per home]
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import synthetic
+from pa_resto import fleet
+
+def make_homes(directory, homes, devices):
+	for i in range(homes):
+		config_dir = os.path.join(directory, 'user%d' % i, '.config', 'pulse')
+		os.makedirs(config_dir)
+		machine_id = '%032x' % i
+		db = synthetic.open_db(config_dir, machine_id+'-device-volumes')
+		synthetic.store_all(db, synthetic.make_device_entries(devices, 4, 2, 1, seed=i))
+		if i == 0:
+			db.store(b'sink:broken:port', b'B\x01', 0)
+		db.close()
+		open(os.path.join(config_dir, machine_id+'-default-sink'), 'w').write(synthetic.device_name('sink', i % devices))
+		open(os.path.join(config_dir, machine_id+'-default-source'), 'w').write(synthetic.device_name('source', 0))
+
+def main():
+	homes = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+	devices = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+	try:
+		import tdb
+	except ImportError:
+		print("skipped: the tdb module isn't installed")
+		return
+	directory = tempfile.mkdtemp()
+	try:
+		make_homes(directory, homes, devices)
+		paths = [os.path.join(directory, 'user%d' % i) for i in range(homes)]
+		cpus = os.cpu_count() or 1
+		jobs = [1]
+		while jobs[-1]*2 <= cpus:
+			jobs.append(jobs[-1]*2)
+		if jobs[-1] != cpus:
+			jobs.append(cpus)
+		reference = None
+		single = None
+		for count in jobs:
+			start = time.perf_counter()
+			report = fleet.audit(paths, count)
+			elapsed = time.perf_counter() - start
+			if reference is None:
+				reference = report
+				single = elapsed
+				summary = report[1]
+				print("%d seats, %d devices, %d ports, %d corrupted" % (summary['seats'],
+					summary['devices'], summary['ports'], summary['corrupted']))
+			assert report == reference, count
+			print("%2d processes: %8.1f ms  %5.2fx" % (count, elapsed*1000, single/elapsed))
+	finally:
+		shutil.rmtree(directory)
+
+if __name__ == '__main__':
+	main()
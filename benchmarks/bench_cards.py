@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# Benchmark of the card-restore codec and card_map on a DB with many cards
+#
+# Builds a card DB of synthetic docks and USB devices, checks that every
+# entry survives an encode/decode round trip, then times the full
+# refresh_card_map(), the incremental update_card_map() after a few cards
+# changed, and a bulk rewrite of the latency offsets of every card staged
+# with store_card_entries() and applied in one transaction. The DB is a real
+# TDB in a temporary directory when the tdb module is installed, kept in
+# memory otherwise and the apply isn't timed.
+#
+# usage: python3 benchmarks/bench_cards.py [cards] [ports]
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import synthetic
+import pa_resto
+from pa_resto import restore_db, card_restore_entry
+
+PROFILES = ('output:analog-stereo', 'output:analog-stereo+input:analog-stereo',
+	'output:hdmi-stereo', 'output:iec958-stereo', 'off')
+PORTS = ('analog-output', 'analog-output-headphones', 'analog-input-mic',
+	'hdmi-output-0', 'hdmi-output-1', 'iec958-stereo-output')
+
+def make_entries(cards, ports, seed=0):
+	rand = random.Random(seed)
+	entries = []
+	for i in range(cards):
+		entry = card_restore_entry('alsa_card.usb-Dock_%d_USB_Audio-%02d' % (i // 4, i % 4), None)
+		entry.profile = rand.choice(PROFILES)
+		for p in range(ports):
+			entry.ports[PORTS[p % len(PORTS)]+'-%d' % p] = {
+				'offset': rand.choice((0, 0, 20000, -15000)),
+				'profile': rand.choice(PROFILES + (None,)),
+			}
+		entry.preferred_output_port = rand.choice((None, 'analog-output-0'))
+		entry.profile_is_sticky = rand.random() < 0.3
+		entry.is_valid = True
+		entries.append(entry)
+	return entries
+
+def timed(name, func, count):
+	start = time.perf_counter()
+	result = func()
+	elapsed = time.perf_counter() - start
+	print("%-28s %8.1f ms  %6.2f us/card" % (name+":", elapsed*1000, elapsed*1e6/count))
+	return result
+
+def main():
+	cards = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+	ports = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+	entries = make_entries(cards, ports)
+	for entry in entries:
+		decoded = card_restore_entry(entry.name, bytes(entry.encode()))
+		assert decoded.is_valid and decoded.to_dict() == entry.to_dict(), entry.name
+	print("round trip ok over %d cards of %d ports" % (cards, ports))
+
+	directory = tempfile.mkdtemp()
+	restore_db.card_db = synthetic.open_db(directory, 'card-database')
+	tdb = None
+	if synthetic.is_memory_db(restore_db.card_db):
+		print("tdb isn't installed, the DB is kept in memory")
+	else:
+		import tdb
+	try:
+		db = restore_db.card_db
+		synthetic.store_all(db, entries)
+
+		timed("refresh_card_map()", pa_resto.refresh_card_map, cards)
+		assert len(pa_resto.card_map) == cards
+		changed = entries[::100]
+		for entry in changed:
+			entry.profile = 'output:analog-surround-51'
+			db.store(entry.name.encode(), bytes(entry.encode()), getattr(tdb, 'REPLACE', None))
+		keys = timed("changed_card_keys()", pa_resto.changed_card_keys, cards)
+		assert len(keys) == len(changed)
+		timed("update_card_map() 1%", lambda: pa_resto.update_card_map(keys), len(keys))
+
+		for entry in pa_resto.card_map.values():
+			for info in entry.ports.values():
+				info['offset'] = 0
+		timed("store_card_entries()", lambda: pa_resto.store_card_entries(pa_resto.card_map.values()), cards)
+		if tdb is not None:
+			timed("apply(), one transaction", pa_resto.pending_card_changes.apply, cards)
+			assert all(info['offset'] == 0 for entry in pa_resto.card_map.values() for info in entry.ports.values())
+		else:
+			pa_resto.pending_card_changes.changes.clear()
+	finally:
+		shutil.rmtree(directory)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# Micro-benchmark of the per_port_entry decoder on large multi-channel entries
+#
+# Compares the table-driven tagstruct decoder with the previous approach
+# that sliced the binary after every consumed field.
+#
+# usage: python3 benchmarks/bench_decode.py [channels] [formats] [iterations]
+import os
+import struct
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pa_resto import per_port_entry
+
+def make_entry(channels, formats):
+	output = bytearray(b'B\x011')
+	output += b'm' + bytes([channels]) + bytes(i % 50 for i in range(channels))
+	output += b'v' + bytes([channels]) + struct.pack('>%dI' % channels, *([0x4a3d] * channels))
+	output += b'10'
+	output += b'B' + bytes([formats])
+	output += b'fB\x01PN' * formats
+	return bytes(output)
+
+def slicing_decode(binary):
+	# reference: the previous decoder, every step did binary = binary[n:]
+	if binary[0] != 0x42:
+		return None
+	version = binary[1]
+	binary = binary[2:]
+	volume_valid = binary[0] == 0x31
+	binary = binary[1:]
+	if binary[0] != 0x6d:
+		return None
+	binary = binary[1:]
+	channel_map = {'channels': binary[0], 'map': []}
+	binary = binary[1:]
+	for i in range(channel_map['channels']):
+		channel_map['map'].append(binary[0])
+		binary = binary[1:]
+	if binary[0] != 0x76:
+		return None
+	binary = binary[1:]
+	volume = {'channels': binary[0], 'values': []}
+	binary = binary[1:]
+	for i in range(volume['channels']):
+		val = struct.unpack('>I', binary[:4])[0]
+		volume['values'].append(float(val)/0x10000)
+		binary = binary[4:]
+	muted_valid = binary[0] == 0x31
+	binary = binary[1:]
+	muted = binary[0] == 0x31
+	binary = binary[1:]
+	if binary[0] != 0x42:
+		return None
+	number_of_formats = binary[1]
+	binary = binary[2:]
+	formats = []
+	for i in range(number_of_formats):
+		if binary[0] != 0x66:
+			return None
+		binary = binary[1:]
+		if binary[0] != 0x42:
+			return None
+		new_format = {'encoding': binary[1], 'plist': {}}
+		binary = binary[2:]
+		if binary[0] != 0x50:
+			return None
+		binary = binary[1:]
+		if binary[0] == 0x4e:
+			binary = binary[1:]
+			formats.append(new_format)
+	return (version, volume_valid, channel_map, volume, muted_valid, muted, formats)
+
+def main():
+	channels = int(sys.argv[1]) if len(sys.argv) > 1 else 255
+	formats = int(sys.argv[2]) if len(sys.argv) > 2 else 255
+	iterations = int(sys.argv[3]) if len(sys.argv) > 3 else 2000
+	entry = make_entry(channels, formats)
+	decoded = per_port_entry('sink:bench:port', entry)
+	assert decoded.is_valid and decoded.volume['channels'] == channels
+
+	slicing = min(timeit.repeat(lambda: slicing_decode(entry), number=iterations, repeat=5))
+	table = min(timeit.repeat(lambda: decoded.decode(entry), number=iterations, repeat=5))
+	print("entry size: %d bytes, %d channels, %d formats" % (len(entry), channels, formats))
+	print("slicing decoder: %8.2f us/entry" % (slicing*1e6/iterations))
+	print("table decoder:   %8.2f us/entry" % (table*1e6/iterations))
+	print("speedup:         %8.2fx" % (slicing/table))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# Micro-benchmark of the search index on many stream rules and device ports
+#
+# Times building the index, prefix queries as they come while typing, and
+# the incremental update after a rule changes, against a linear scan of the
+# names. The results of both are checked to be the same.
+#
+# usage: python3 benchmarks/bench_search.py [rules] [devices]
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pa_resto.search import search_index, words
+
+PORTS = ('analog-output-speaker', 'analog-output-headphones', 'hdmi-output-0', 'iec958-stereo-output')
+
+def make_entries(rules, devices):
+	entries = []
+	for i in range(rules):
+		name = 'sink-input-by-media-name:Track %d of album %d' % (i, i % 97)
+		entries.append((('stream', name), (name, 'alsa_output.usb-%d.analog-stereo' % (i % 13))))
+	for i in range(devices):
+		device = 'sink:alsa_output.pci-0000_%02x_00.%d.analog-stereo' % (i % 256, i)
+		entries.append((('device', device), (device, PORTS[0])))
+		for port in PORTS:
+			entries.append((('port', device+":"+port), (device, port)))
+	return entries
+
+def scan(entries, query):
+	# reference: every word of the query has to start a word of the entry
+	prefixes = words(query)
+	result = []
+	for (entry, texts) in entries:
+		entry_words = [word for text in texts for word in words(text)]
+		if all(any(word.startswith(prefix) for word in entry_words) for prefix in prefixes):
+			result.append(entry)
+	return sorted(result)
+
+def main():
+	rules = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+	devices = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+	entries = make_entries(rules, devices)
+
+	start = time.perf_counter()
+	index = search_index()
+	for (entry, texts) in entries:
+		index.add(entry, texts)
+	print("index of %d entries built in %.1f ms" % (len(index), (time.perf_counter()-start)*1000))
+
+	# what gets searched for while typing "track 4 album 7"
+	query = "track 4 album 7"
+	typed = [query[:i] for i in range(1, len(query)+1)]
+	for text in ("hdmi", "pci 0000_1f", "usb 3", query):
+		assert index.search(text) == scan(entries, text), text
+	print("results match a linear scan")
+
+	iterations = 5
+	indexed = min(timeit.repeat(lambda: [index.search(text, 500) for text in typed], number=iterations, repeat=3))
+	scanned = min(timeit.repeat(lambda: [scan(entries, text) for text in typed[-3:]], number=1, repeat=3))
+	print("indexed search:  %8.2f ms/keystroke" % (indexed*1000/(iterations*len(typed))))
+	print("linear scan:     %8.2f ms/keystroke" % (scanned*1000/3))
+
+	rule = ('stream', 'sink-input-by-media-name:Track 4 of album 4')
+	changed = (rule[1], 'alsa_output.hdmi-stereo')
+	update = min(timeit.repeat(lambda: index.add(rule, changed), number=1000, repeat=3))
+	print("update of a rule: %7.2f us" % (update*1e6/1000))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# Startup time of the library import against launching the GUI
+#
+# Both are run in a fresh interpreter. The library import must not connect
+# to PulseAudio nor open any file, the GUI is started with
+# --exit-after-startup so it quits as soon as its main loop is idle, it
+# needs a display and a running PulseAudio.
+#
+# usage: python3 benchmarks/bench_startup.py [runs]
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+def time_command(command, runs):
+	best = None
+	for i in range(runs):
+		start = time.perf_counter()
+		result = subprocess.run(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+		elapsed = time.perf_counter() - start
+		if result.returncode != 0:
+			return (None, result.stderr.decode().strip().split('\n')[-1])
+		best = elapsed if best is None else min(best, elapsed)
+	return (best, None)
+
+def main():
+	runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+	commands = [
+		('interpreter only', [sys.executable, '-c', 'pass']),
+		('import pa_resto', [sys.executable, '-c', 'import pa_resto']),
+		('launch GUI', [sys.executable, 'pa-resto-edit.py', '--exit-after-startup']),
+	]
+	for (name, command) in commands:
+		(best, error) = time_command(command, runs)
+		if best is None:
+			print("%-17s skipped: %s" % (name+":", error))
+		else:
+			print("%-17s %8.1f ms" % (name+":", best*1000))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# Benchmark suite over synthetic restoration DBs
+#
+# Generates a device-volumes TDB and stream rules with synthetic.py, then
+# times:
+#   decode, encode         per_port_entry over every entry of the DB
+#   refresh_device_map     walking the whole DB, _cold decodes every
+#                          entry, without it they come from the decode cache
+#   refresh_restore_map    against a stand-in for the pulse client
+#   gui_*                  filling StreamRulesView and DevicePortsView and
+#                          building the main window, needs gi and pulsectl,
+#                          runs under Xvfb when there is no display
+# The results are saved as JSON, in benchmarks/results/ named after the git
+# revision unless --output is given, and --compare prints the ratio of every
+# timing to the ones of an earlier run.
+#
+# usage: python3 benchmarks/bench_suite.py [--devices N] [--ports N]
+#        [--channels N] [--formats N] [--rules N] [--repeat N] [--no-gui]
+#        [--output FILE] [--compare FILE]
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import synthetic
+from pa_resto import restore_db, per_port_entry
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+# a timing this much slower than the compared one is flagged
+REGRESSION = 1.10
+
+def measure(func, repeat, items):
+	times = []
+	for i in range(repeat):
+		start = time.perf_counter()
+		func()
+		times.append(time.perf_counter() - start)
+	return {'best': min(times), 'median': statistics.median(times), 'items': items}
+
+def report(name, result):
+	if 'skipped' in result:
+		print("%-24s skipped: %s" % (name, result['skipped']))
+		return
+	print("%-24s %9.2f ms  %9.2f us/item  (%d items)" % (name, result['best']*1000,
+		result['best']*1e6/max(result['items'], 1), result['items']))
+
+def setup(args, directory):
+	restore_db.config_dir = directory
+	restore_db.machine_id = 'bench'
+	entries = synthetic.make_device_entries(args.devices, args.ports, args.channels, args.formats)
+	db = synthetic.open_db(directory, 'bench-device-volumes')
+	synthetic.store_all(db, entries)
+	restore_db.db = db
+	for device_type in ('sink', 'source'):
+		path = restore_db.default_sink_file() if device_type == 'sink' else restore_db.default_source_file()
+		open(path, 'w').write(synthetic.device_name(device_type, 1 if device_type == 'sink' else 0))
+	restore_db.pulse = synthetic.stand_in_pulse(synthetic.make_stream_rules(args.rules, args.channels))
+	return db
+
+def library_benchmarks(args, db, results):
+	raw = [(key.decode(), db.get(key)) for key in db.keys()]
+	entries = [per_port_entry(key, value) for (key, value) in raw]
+	results['decode'] = measure(lambda: [per_port_entry(key, value) for (key, value) in raw], args.repeat, len(raw))
+	results['encode'] = measure(lambda: [entry.encode() for entry in entries], args.repeat, len(entries))
+	def cold_refresh():
+		restore_db.device_cache.clear()
+		restore_db.refresh_device_map()
+	results['refresh_device_map_cold'] = measure(cold_refresh, args.repeat, len(raw))
+	# every entry is in the decode cache from the previous refresh
+	results['refresh_device_map'] = measure(restore_db.refresh_device_map, args.repeat, len(raw))
+	results['refresh_restore_map'] = measure(restore_db.refresh_restore_map, args.repeat, args.rules)
+
+# Returns the Xvfb process started for the run, None if a display was there
+def start_display():
+	if os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'):
+		return None
+	if shutil.which('Xvfb') is None:
+		raise RuntimeError("no display and Xvfb isn't installed")
+	number = 99
+	while os.path.exists('/tmp/.X11-unix/X%d' % number):
+		number += 1
+	server = subprocess.Popen(['Xvfb', ':%d' % number, '-nolisten', 'tcp'],
+		stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+	for i in range(50):
+		if os.path.exists('/tmp/.X11-unix/X%d' % number):
+			break
+		time.sleep(0.1)
+	os.environ['DISPLAY'] = ':%d' % number
+	return server
+
+def load_gui():
+	spec = importlib.util.spec_from_file_location('pa_resto_edit', os.path.join(ROOT, 'pa-resto-edit.py'))
+	gui = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(gui)
+	return gui
+
+def gui_benchmarks(args, results):
+	names = ('gui_stream_pane', 'gui_device_panes', 'gui_main_window')
+	server = None
+	try:
+		server = start_display()
+		gui = load_gui()
+		if not gui.Gtk.init_check()[0]:
+			raise RuntimeError("GTK can't open the display")
+	except (ImportError, ValueError, RuntimeError) as e:
+		for name in names:
+			results[name] = {'skipped': str(e) or type(e).__name__}
+		if server is not None:
+			server.terminate()
+		return
+	try:
+		def flush():
+			while gui.Gtk.events_pending():
+				gui.Gtk.main_iteration()
+
+		largest = max(restore_db.restore_map.keys(), key=lambda name: len(restore_db.restore_map[name]))
+		def stream_pane():
+			view = gui.StreamRulesView()
+			view.show_map(largest)
+			view.destroy()
+		results['gui_stream_pane'] = measure(stream_pane, args.repeat, len(restore_db.restore_map[largest]))
+
+		devices = [(device_type, name, device) for device_type in restore_db.device_map.keys()
+			for name, device in restore_db.device_map[device_type].items()]
+		def device_panes():
+			view = gui.DevicePortsView()
+			for (device_type, name, device) in devices:
+				view.show_device(name, device_type, device)
+			view.destroy()
+		results['gui_device_panes'] = measure(device_panes, args.repeat, len(devices))
+
+		def main_window():
+			window = gui.RestoreDbUI()
+			window.show_all()
+			flush()
+			gui.worker.stop()
+			window.destroy()
+			flush()
+		results['gui_main_window'] = measure(main_window, args.repeat, 1)
+	finally:
+		if server is not None:
+			server.terminate()
+
+def revision():
+	try:
+		result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+			stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+	except OSError:
+		return 'unknown'
+	return result.stdout.decode().strip() or 'unknown'
+
+def compare(results, path):
+	previous = json.load(open(path))
+	print("compared to %s (%s):" % (path, previous['revision']))
+	if previous['params'] != results['params']:
+		print("  parameters differ: %s" % previous['params'])
+	for name, result in results['results'].items():
+		old = previous['results'].get(name)
+		if 'skipped' in result or old is None or 'skipped' in old:
+			continue
+		ratio = result['best']/old['best']
+		flag = "  slower" if ratio > REGRESSION else ""
+		print("  %-24s %6.2fx%s" % (name, ratio, flag))
+
+def main():
+	parser = argparse.ArgumentParser(description="Time pa_resto on synthetic restoration DBs")
+	parser.add_argument('--devices', type=int, default=500)
+	parser.add_argument('--ports', type=int, default=4, help="ports per device")
+	parser.add_argument('--channels', type=int, default=2)
+	parser.add_argument('--formats', type=int, default=1)
+	parser.add_argument('--rules', type=int, default=5000, help="stream rules")
+	parser.add_argument('--repeat', type=int, default=5)
+	parser.add_argument('--no-gui', action='store_true', help="skip the GTK panes")
+	parser.add_argument('--output', help="result file, benchmarks/results/<revision>-<time>.json by default")
+	parser.add_argument('--compare', help="earlier result file to compare with")
+	args = parser.parse_args()
+
+	directory = tempfile.mkdtemp()
+	results = {}
+	try:
+		db = setup(args, directory)
+		if synthetic.is_memory_db(db):
+			print("tdb isn't installed, the DB is kept in memory")
+		library_benchmarks(args, db, results)
+		if args.no_gui:
+			for name in ('gui_stream_pane', 'gui_device_panes', 'gui_main_window'):
+				results[name] = {'skipped': "--no-gui"}
+		else:
+			gui_benchmarks(args, results)
+	finally:
+		shutil.rmtree(directory)
+	for name, result in results.items():
+		report(name, result)
+
+	saved = {
+		'revision': revision(),
+		'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+		'python': platform.python_version(),
+		'params': {key: getattr(args, key) for key in ('devices', 'ports', 'channels', 'formats', 'rules', 'repeat')},
+		'results': results,
+	}
+	output = args.output
+	if output is None:
+		os.makedirs(RESULTS, exist_ok=True)
+		output = os.path.join(RESULTS, '%s-%s.json' % (saved['revision'], time.strftime('%Y%m%d-%H%M%S')))
+	with open(output, 'w') as f:
+		json.dump(saved, f, indent=1)
+	print("saved to "+output)
+	if args.compare:
+		compare(saved, args.compare)
+
+if __name__ == '__main__':
+	main()
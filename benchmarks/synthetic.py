@@ -0,0 +1,135 @@
+# Synthetic restoration DBs for the benchmarks
+#
+# make_device_entries() builds the entries of a device-volumes TDB, a default
+# port entry and one volume entry per port for every device, with the given
+# number of channels and formats. make_stream_rules() builds stream-restore
+# rules spread over the maps. Both are deterministic for a given seed.
+#
+#   db = open_db(directory, 'device-volumes')
+#   store_all(db, make_device_entries(devices=200, ports=4, channels=2, formats=1))
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pa_resto import per_port_entry, stream_restore_entry, restore_map_empty
+from pa_resto.stream_restore import stream_volume
+
+PORTS = ('analog-output-speaker', 'analog-output-headphones', 'analog-output-lineout',
+	'hdmi-output-0', 'hdmi-output-1', 'iec958-stereo-output', 'analog-input-mic',
+	'analog-input-linein')
+
+class memory_db:
+	"""
+	Stands for a TDB where the tdb module isn't installed, enough of it for
+	the reads and the transactions of pa_resto.
+	"""
+	def __init__(self):
+		self.entries = {}
+		self.seqnum = 0
+
+	def keys(self):
+		return iter(list(self.entries.keys()))
+
+	def get(self, key):
+		return self.entries.get(key)
+
+	def store(self, key, value, flag=None):
+		self.entries[key] = bytes(value)
+		self.seqnum += 1
+
+	def delete(self, key):
+		del self.entries[key]
+		self.seqnum += 1
+
+	def transaction_start(self):
+		pass
+
+	def transaction_commit(self):
+		pass
+
+	def transaction_cancel(self):
+		pass
+
+# A real TDB in directory when the tdb module is installed, a memory_db
+# otherwise, pa_resto's writes import tdb so they need the real one
+def open_db(directory, name):
+	try:
+		import tdb
+	except ImportError:
+		return memory_db()
+	return tdb.open(os.path.join(directory, name+'.tdb'), 0, tdb.DEFAULT, os.O_RDWR|os.O_CREAT)
+
+def is_memory_db(db):
+	return isinstance(db, memory_db)
+
+def store_all(db, entries):
+	flag = None
+	if not is_memory_db(db):
+		import tdb
+		flag = tdb.REPLACE
+	for entry in entries:
+		db.store(entry.key.encode(), bytes(entry.encode()), flag)
+
+def device_name(device_type, i):
+	kind = 'output' if device_type == 'sink' else 'input'
+	return 'alsa_%s.pci-0000_%02x_00.%d.analog-stereo' % (kind, i % 256, i)
+
+def make_device_entries(devices, ports, channels, formats, seed=0):
+	rand = random.Random(seed)
+	entries = []
+	for i in range(devices):
+		device_type = 'sink' if i % 3 else 'source'
+		name = device_type+':'+device_name(device_type, i)
+		port_names = [PORTS[p % len(PORTS)] + ('-%d' % (p // len(PORTS)) if p >= len(PORTS) else '')
+			for p in range(ports)]
+		entry = per_port_entry(name, None)
+		entry.is_port_format = True
+		entry.port_valid = len(port_names) > 0
+		entry.port = port_names[0] if port_names else None
+		entry.is_valid = True
+		entries.append(entry)
+		for port in port_names:
+			entry = per_port_entry(name+':'+port, None)
+			entry.channel_map = {'channels': channels, 'map': [c % 51 for c in range(channels)]}
+			entry.volume = {'channels': channels,
+				'values': [rand.randrange(0x10000)/entry.PA_VOLUME_NORM for c in range(channels)]}
+			entry.volume_valid = True
+			entry.muted_valid = True
+			entry.muted = rand.random() < 0.1
+			entry.formats = [{'encoding': 1 + f % 11, 'plist': {}} for f in range(formats)]
+			entry.number_of_formats = formats
+			entry.is_valid = True
+			entries.append(entry)
+	return entries
+
+def make_stream_rules(count, channels=2, seed=0):
+	rand = random.Random(seed)
+	maps = list(restore_map_empty.keys())
+	rules = []
+	for i in range(count):
+		rule = stream_restore_entry('%s:Stream %d' % (maps[i % len(maps)], i), None)
+		rule.channel_map = [c % 51 for c in range(channels)]
+		rule.volume = stream_volume([rand.randrange(0x10000)/float(rule.PA_VOLUME_NORM) for c in range(channels)])
+		rule.volume_valid = True
+		rule.mute = rand.random() < 0.1
+		rule.device = device_name('sink', rand.randrange(64)) if rand.random() < 0.5 else None
+		rule.is_valid = True
+		rules.append(rule)
+	return rules
+
+class stand_in_pulse:
+	"""
+	Answers the calls pa_resto makes to pulsectl.Pulse from a list of rules,
+	to time refresh_restore_map() without a running PulseAudio.
+	"""
+	connected = True
+
+	def __init__(self, rules):
+		self.rules = rules
+
+	def stream_restore_read(self):
+		return list(self.rules)
+
+	def close(self):
+		pass
@@ -1,564 +1,331 @@
 #!/usr/bin/env python3
 import pulsectl
-import tdb
 import os
 import sys
 import gi
-import struct
 gi.require_version("Gtk", "3.0")
-from gi.repository import Gtk, GObject
+from gi.repository import Gtk, Gdk, GObject, GLib
 import json
 
-pulse = pulsectl.Pulse('restore_manip')
+from pa_resto import (
+	per_port_entry,
+	device_map,
+	device_map_hashes,
+	refresh_device_map,
+	read_device_map,
+	apply_device_map,
+	write_default_device,
+	apply_default_devices,
+	restore_files_watcher,
+	pending_device_changes,
+	restore_map,
+	restore_map_empty,
+	refresh_restore_map,
+	clean_nones,
+)
+from pa_resto.stream_sync import copy_stream_rule, current_stream_rules, diff_stream_rules, write_stream_rules_diff, patch_restore_map
+from pa_resto.io_worker import io_worker
+from pa_resto.reconcile import keyed_diff
+from pa_resto.search import search_index
+from pa_resto import instrument
+
 currently_selected_map = 'sink-input-by-media-role'
 currently_selected_device = ''
 currently_selected_device_type = ''
-restore_map = {}
-
-# This covers the stream maps, not the devices volume restoration information.
-# It would be good to add these too
-# However, currently it is not possible to check these values or update it
-# There is nothing in the native protocol extension that allows this similar to;
-# inspire by: https://gitlab.freedesktop.org/pulseaudio/pulseaudio/-/blob/master/src/pulse/ext-stream-restore.c#L156
-# Here it only allows editing the device formats
-# https://gitlab.freedesktop.org/pulseaudio/pulseaudio/-/blob/master/src/pulse/ext-device-restore.c#L233
-# What can be done instead is manipulate the TDB directly
-# interpreting the format manually
-# Structure: https://gitlab.freedesktop.org/pulseaudio/pulseaudio/-/blob/master/src/modules/module-device-restore.c#L363
-# The list of tags is found here:
-# https://gitlab.freedesktop.org/pulseaudio/pulseaudio/-/blob/master/src/pulsecore/tagstruct.h
-# Helper methods:
-# https://gitlab.freedesktop.org/pulseaudio/pulseaudio/-/blob/master/src/pulsecore/tagstruct.c
-machine_id = open('/etc/machine-id','r').read().rstrip()
-device_volumes_db = os.environ['HOME']+'/.config/pulse/'+machine_id+'-device-volumes.tdb'
-default_sink = open(os.environ['HOME']+'/.config/pulse/'+machine_id+'-default-sink').read().rstrip()
-default_source = open(os.environ['HOME']+'/.config/pulse/'+machine_id+'-default-source').read().rstrip()
-
-db = tdb.open(device_volumes_db)
-
-
-# Examples:
-# version 1 - volume not valid (skip rest)
-# 42 01 30 4e
-#  x = db.get(b'sink:alsa_output.usb-C-Media_Electronics_Inc._Microsoft_LifeChat_LX-3000-00.iec958-stereo:iec958-stereo-output')
-# bytes(x).hex()
-# version 1 - volume valid yes - channel map 'm' - volume 'v' - muted valid yes - muted no - number of format 1
-# format: tag format 'f' - encoding 01 - proplist 'P' - value
-# '4201 31 6d020102 760200004a3d00004a3d 31 30 4201
-# 66 4201 504e'
-# mapping of device with port
-# '4201 31 746d756c74696368616e6e656c2d696e70757400')
-
-class per_port_entry(dict):
-	PA_VOLUME_NORM = 0x10000
-	def __init__(self, name, binary):
-		parts = name.split(":")
-		self.type = parts[0]
-		self.name = parts[1]
-		first_colon_loc = name.find(":")
-		self.full_name = name[first_colon_loc+1:]
-		self.port = parts[2] if len(parts) >= 3 else None
-		self.binary = binary
-		self.version = 1
-		self.hex = self.binary.hex() if self.binary else ''
-		self.is_valid = False
-		self.is_port_format = False
-		self.volume_valid = None
-		self.channel_map = {'channels':0, 'map':[]}
-		self.volume = {'channels':0, 'values':[]}
-		self.muted_valid = None
-		self.muted = None
-		self.number_of_formats = 1
-		self.formats = [{'encoding': 1 }]
-		self.port_valid = None
-		self.decode()
-		dict.__init__(self, type=self.type,
-			#name=self.name,
-			#full_name=self.full_name,
-			port = self.port,
-			#hex = self.hex,
-			#is_valid = self.is_valid,
-			#is_port_format = self.is_port_format,
-			version = self.version,
-			volume_valid = self.volume_valid,
-			channel_map = self.channel_map,
-			volume = self.volume,
-			muted_valid = self.muted_valid,
-			muted = self.muted,
-			number_of_formats = self.number_of_formats,
-			formats = self.formats,
-			port_valid = self.port_valid,
-			)
-
-	def decode(self):
-		if not self.binary:
-			return
-		actions = [self.parse_version,
-			self.parse_volume_valid,
-			self.parse_channel_map,
-			self.parse_volume,
-			self.parse_muted_valid,
-			self.parse_muted,
-			self.parse_number_of_formats,
-			self.parse_formats]
-
-		if chr(self.binary[3]) == 't' or  chr(self.binary[3]) == 'N':
-			self.is_port_format = True
-			actions = [self.parse_version,
-				self.parse_port_valid,
-				self.parse_port]
-
-		for action in actions:
-			if action() < 0:
-				return
-		self.is_valid = True
-
-	def encode(self):
-		output = bytearray()
-		if self.is_port_format:
-			output.append(0x42)
-			output.append(self.version)
-			output.append(self.set_bool(self.port_valid))
-			if self.port_valid:
-				output.append(0x74)
-				for i in self.port.encode():
-					output.append(i)
-				output.append(0x00)
-			else:
-				output.append(0x4e)
-		else:
-			output.append(0x42)
-			output.append(self.version)
-			output.append(self.set_bool(self.volume_valid))
-			output.append(0x6d)
-			output.append(self.channel_map['channels'])
-			for i in self.channel_map['map']:
-				output.append(i)
-			output.append(0x76)
-			output.append(self.volume['channels'])
-			for i in self.volume['values']:
-				v = int(i * self.PA_VOLUME_NORM)
-				output += struct.pack(">I", v)
-			output.append(self.set_bool(self.muted_valid))
-			output.append(self.set_bool(self.muted))
-			output.append(0x42)
-			output.append(self.number_of_formats)
-			for i in self.formats:
-				output.append(0x66)
-				output.append(0x42)
-				output.append(i['encoding'])
-				output.append(0x50)
-				# ignore the rest of the format for now
-				output.append(0x4e)
-		return output
-
-	def get_u8(self):
-		if chr(self.binary[0]) != 'B':
-			return (-1, None)
-		result = self.binary[1]
-		self.binary = self.binary[2:]
-		return (1, result)
-
-	def get_bool(self):
-		if chr(self.binary[0]) == '1':
-			result = True
-		elif chr(self.binary[0]) == '0':
-			result = False
-		else:
-			return (-1, None)
-		self.binary = self.binary[1:]
-		return (1, result)
-
-	def set_bool(self, val):
-		if val:
-			return 0x31
-		else:
-			return 0x30
-
-	def parse_port_valid(self):
-		(status, result) = self.get_bool()
-		self.port_valid = result
-		return status
-
-	def parse_port(self):
-		if chr(self.binary[0]) == 'N':
-			self.binary = self.binary[1:]
-			self.port = None
-			return 1
-
-		if chr(self.binary[0]) != 't':
-			return -1
-		self.binary = self.binary[1:]
-		self.port = self.binary[:-1].decode()
-		return 1
-
-	def parse_version(self):
-		(status, result) = self.get_u8()
-		self.version = result
-		return status
-
-	def parse_volume_valid(self):
-		(status, result) = self.get_bool()
-		self.volume_valid = result
-		return status
-
-	def parse_channel_map(self):
-		if chr(self.binary[0]) != 'm':
-			return -1
-		self.binary = self.binary[1:]
-		channel_map = {}
-		channel_map['channels'] = self.binary[0]
-		self.binary = self.binary[1:]
-
-		channel_map['map'] = []
-		for i in range(channel_map['channels']):
-			val = self.binary[0]
-			channel_map['map'].append(val)
-			self.binary = self.binary[1:]
-
-		self.channel_map = channel_map
-		return 1
-
-	def parse_volume(self):
-		if chr(self.binary[0]) != 'v':
-			return -1
-		self.binary = self.binary[1:]
-		volume = {}
-		volume['channels'] = self.binary[0]
-		self.binary = self.binary[1:]
-
-		volume['values'] = []
-		for i in range(volume['channels']):
-			val = struct.unpack('>I', self.binary[:4])[0]
-			val = float(val)/self.PA_VOLUME_NORM
-			volume['values'].append(val)
-			self.binary = self.binary[4:]
-		self.volume = volume
-		return 1
-
-	def parse_muted_valid(self):
-		(status, result) = self.get_bool()
-		self.muted_valid = result
-		return status
-
-	def parse_muted(self):
-		(status, result) = self.get_bool()
-		self.muted = result
-		return status
-
-	def parse_number_of_formats(self):
-		(status, result) = self.get_u8()
-		self.number_of_formats = result
-		return status
-
-	def parse_formats(self):
-		self.formats = []
-		for i in range(self.number_of_formats):
-			if self.parse_format() < 0:
-				return -1
-		return 1
-
-	def parse_format(self):
-		new_format = {}
-		if chr(self.binary[0]) != 'f':
-			return -1
-		self.binary = self.binary[1:]
-
-		(status, result) = self.get_u8()
-		if status < 0:
-			return status
-		new_format['encoding'] = result
-		new_format['plist'] = {}
-
-		if chr(self.binary[0]) != 'P':
-			return -1
-		self.binary = self.binary[1:]
-
-		if chr(self.binary[0]) != 'N' and chr(self.binary[0]) != 't':
-			return -1
-
-		# 'N'/NULL return
-		if chr(self.binary[0]) == 'N':
-			self.binary = self.binary[1:]
-			self.formats.append(new_format)
-			return 1
-
-		self.binary = self.binary[1:]
-		# TODO this is mostly unused from what I can see in the DB
-		# The only port information that make sense is the one in the name
-		# Example: sink:alsa_output.usb-C-Media_Electronics_Inc._Microsoft_LifeChat_LX-3000-00.iec958-stereo:iec958-stereo-output
-		# 't'/String, not NULL, continue parsing
-		# read string till \0
-		# length = self.get_u32
-		# get arbitrary of length: PA_TAG_ARBITRARY read_u32(len) which == length?
-		# read length len
-
-		return 1
-
-device_map = {}
-
-#| sink   | default port
-#|--------|------------------
-#| source | all ports + info
-# device_map {
-#   'sink': {
-#       'devicename': {
-#           'default_port': {default port info }
-#           'is_default_device': based on default sink/source
-#           'ports': {
-#               portname: {
-#                   { port information }
-#                   volume: [0.5,0.5]
-#               }
-#           }
-#       }
-#    }
-# }
-def refresh_device_map():
-	global device_map
-	global default_sink
-	global default_source
-	device_map.clear()
-	device_map['source'] = {}
-	device_map['sink'] = {}
-
-	default_sink = open(os.environ['HOME']+'/.config/pulse/'+machine_id+'-default-sink').read().rstrip()
-	default_source = open(os.environ['HOME']+'/.config/pulse/'+machine_id+'-default-source').read().rstrip()
-
-	for key in db.keys():
-		entry = db.get(key)
-		ppe = per_port_entry(key.decode(), entry)
-		if ppe.is_valid:
-			if ppe.name not in device_map[ppe.type].keys():
-				device_map[ppe.type][ppe.name] = {
-					'is_default_device': ppe.name == default_sink or ppe.name == default_source,
-					'default_port': None,
-					'ports': {}
-				}
-			if ppe.is_port_format:
-				device_map[ppe.type][ppe.name]['default_port'] = ppe
-			else:
-				device_map[ppe.type][ppe.name]['ports'][ppe.port] = ppe
-		else:
-			print("\e[0;31mcorrupted entry " + ppe.name + "in restoration DB\e[0;30m")
-			pass
-
-
-# DEBUG
-def clean_nones(value):
-    """
-    Recursively remove all None values from dictionaries and lists, and returns
-    the result as a new dictionary or list.
-    """
-    if isinstance(value, list):
-        return [clean_nones(x) for x in value if x is not None]
-    elif isinstance(value, dict):
-        return {
-            key: clean_nones(val)
-            for key, val in value.items()
-            if val is not None
-        }
-    else:
-        return value
-
-refresh_device_map()
-#print(json.dumps(clean_nones(device_map)))
-#sys.exit(0)
-
-# pacmd list-clients to find more information
-restore_map_empty = {
-	'source-output-by-media-role': {},
-	'source-output-by-application-name': {},
-	'source-output-by-application-id': {},
-	'source-output-by-media-name': {},
-	'sink-input-by-media-role': {},
-	'sink-input-by-application-name': {},
-	'sink-input-by-application-id': {},
-	'sink-input-by-media-name': {},
-}
-
-def refresh_restore_map():
-	global pulse
-	global restore_map
-	global restore_map_empty
-	if not pulse.connected:
-		pulse = pulsectl.Pulse('restore_manip')
-
-	restore_db = pulse.stream_restore_read()
-	restore_map = restore_map_empty
-	for a in range(len(restore_db)):
-		association_type = restore_db[a].name.split(":")[0]
-		first_colon_loc = restore_db[a].name.find(":")
-		name = restore_db[a].name[first_colon_loc+1:]
-		restore_map[association_type][name] = restore_db[a]
-
-refresh_restore_map()
-
+# rows shown for a search, more than that isn't useful to scroll through
+SEARCH_LIMIT = 500
+# all the pulse and TDB calls made after startup go through this thread,
+# created with the window. Its jobs only read and write pulse and the DBs,
+# device_map and restore_map are patched with what they hand back, here on
+# the main thread where the panes read them.
+worker = None
+
+def show_error(parent, text, error):
+	dialog = Gtk.MessageDialog(transient_for=parent, flags=0,
+		message_type=Gtk.MessageType.ERROR, buttons=Gtk.ButtonsType.OK,
+		text=text)
+	dialog.format_secondary_text(str(error))
+	dialog.run()
+	dialog.destroy()
+
+# Write the pending device changes on the worker and patch device_map with
+# what was read back. done(keys) is called either way, when the transaction
+# failed the changes are dropped and on_error gets the exception.
+def submit_device_changes(done, on_error=None):
+	def on_committed(result):
+		(keys, entries, error) = result
+		pending_device_changes.patch_map(entries)
+		if error is not None:
+			(on_error or worker.on_error)(error)
+		done(keys)
+	worker.submit(pending_device_changes.commit, on_done=on_committed)
+
+# the same, unless the changes are being staged
+def write_device_changes(done):
+	if pending_device_changes.staging:
+		done([])
+	else:
+		submit_device_changes(done)
+
+# Diff the desired rules of maps against restore_map, write the diff on the
+# worker and patch restore_map with it, then done(diff)
+def submit_stream_rules(desired, maps, done):
+	def on_written(diff):
+		patch_restore_map(diff.writes, diff.removed)
+		done(diff)
+	worker.submit(write_stream_rules_diff, diff_stream_rules(desired, maps), on_done=on_written)
 
 class ListBoxRowWithData(Gtk.ListBoxRow):
 	def __init__(self, data, extra = None):
 		super(Gtk.ListBoxRow, self).__init__()
 		self.data = data
-		label = Gtk.Label(label=data, xalign=0)
+		self.extra = extra
+		self.label = Gtk.Label(label=data, xalign=0)
+		if extra:
+			self.label.set_markup(extra)
+		self.add(self.label)
+
+	def set_extra(self, extra):
+		if extra == self.extra:
+			return
+		self.extra = extra
 		if extra:
-			label.set_markup(extra)
-		self.add(label)
+			self.label.set_markup(extra)
+		else:
+			self.label.set_text(self.data)
 
-class ListBoxRestorationInfo(Gtk.ListBoxRow):
+# Right panes, backed by a Gtk.ListStore so that only the rows on screen are
+# rendered whatever the number of rules. Edit and delete are row actions:
+# clicking the 🖊 or 🗑 cell, double-click or Enter to edit, Delete to delete.
+class RuleTreeView(Gtk.TreeView):
+	# with what changed, the stream rules diff or the device DB keys
 	__gsignals__ = {
-		'refresh': (GObject.SignalFlags.RUN_LAST, GObject.TYPE_NONE, ())
+		'refresh': (GObject.SignalFlags.RUN_LAST, GObject.TYPE_NONE, (GObject.TYPE_PYOBJECT,))
 	}
-	def __init__(self, restoration_name, restoration_row):
-		super(Gtk.ListBoxRow, self).__init__()
-		self.restoration_name = restoration_name
-		self.restoration_row = restoration_row
-
-		grid = Gtk.Grid()
-		grid.set_column_spacing(10)
-
-		label_name = Gtk.Label(label=restoration_name, xalign=0)
-		scroll = Gtk.ScrolledWindow(expand=True)
-		scroll.add(label_name)
-		grid.attach(scroll, 0, 0, 1, 1)
-
-		# TODO do we include channel_map
-		text_mute = "off" if restoration_row.mute else "on"
-		label_mute = Gtk.Label(label=text_mute, xalign=0)
-		scroll = Gtk.ScrolledWindow(expand=True)
-		scroll.add(label_mute)
-		grid.attach(scroll, 1, 0, 1, 1)
-
-		label_volume = Gtk.Label(label=str(round(restoration_row.volume.value_flat * 100, 2))+"%", xalign=0)
-		scroll = Gtk.ScrolledWindow(expand=True)
-		scroll.add(label_volume)
-		grid.attach(scroll, 2, 0, 1, 1)
-
-		label_device = Gtk.Label(label=str(restoration_row.device), xalign=0)
-		scroll = Gtk.ScrolledWindow(expand=True)
-		scroll.add(label_device)
-		grid.attach(scroll, 3, 0, 1, 1)
+	def __init__(self, titles):
+		Gtk.TreeView.__init__(self)
+		self.n_columns = len(titles)
+		# the shown values, then the key of the row in a hidden column
+		self.store = Gtk.ListStore(*([str] * (self.n_columns+1)))
+		self.set_model(self.store)
+		# key -> shown values and key -> iter, ListStore iters stay valid
+		# until their row is removed
+		self.rows = {}
+		self.iters = {}
+		# every row has the same height, lets the view skip measuring them
+		self.set_fixed_height_mode(True)
+		for i in range(len(titles)):
+			renderer = Gtk.CellRendererText(xalign=0)
+			if i == 0:
+				# markup, to show the default port in bold
+				column = Gtk.TreeViewColumn(titles[i], renderer, markup=i)
+			else:
+				column = Gtk.TreeViewColumn(titles[i], renderer, text=i)
+			column.set_sizing(Gtk.TreeViewColumnSizing.FIXED)
+			column.set_fixed_width(220 if i == 0 else 100)
+			column.set_expand(True)
+			column.set_resizable(True)
+			self.append_column(column)
+		self.edit_column = self.action_column("🖊")
+		self.delete_column = self.action_column("🗑")
+		self.connect("row-activated", self.on_row_activated)
+		self.connect("button-release-event", self.on_button_released)
+		self.connect("key-press-event", self.on_key_pressed)
+
+	def action_column(self, label):
+		renderer = Gtk.CellRendererText(xalign=0.5)
+		renderer.set_property("text", label)
+		column = Gtk.TreeViewColumn("", renderer)
+		column.set_sizing(Gtk.TreeViewColumnSizing.FIXED)
+		column.set_fixed_width(40)
+		self.append_column(column)
+		return column
+
+	# the name of the entry shown on the row
+	def row_key(self, path):
+		return self.store[path][self.n_columns]
+
+	def on_row_activated(self, widget, path, column):
+		if column is self.delete_column:
+			self.delete_row(self.row_key(path))
+		else:
+			self.edit_row(self.row_key(path))
+
+	def on_button_released(self, widget, event):
+		if event.button != 1:
+			return False
+		hit = self.get_path_at_pos(int(event.x), int(event.y))
+		if hit is None:
+			return False
+		(path, column, cell_x, cell_y) = hit
+		if column is self.edit_column:
+			self.edit_row(self.row_key(path))
+			return True
+		if column is self.delete_column:
+			self.delete_row(self.row_key(path))
+			return True
+		return False
+
+	def on_key_pressed(self, widget, event):
+		if event.keyval != Gdk.KEY_Delete:
+			return False
+		(model, tree_iter) = self.get_selection().get_selected()
+		if tree_iter is None:
+			return False
+		self.delete_row(self.row_key(model.get_path(tree_iter)))
+		return True
+
+	# Rows are (key, shown values). Only the rows that were added, removed
+	# or whose values changed are touched, the others are left as they are
+	# with their selection and scroll position.
+	@instrument.timed('gui.set_rows')
+	def set_rows(self, rows):
+		new_rows = dict(rows)
+		(removed, changed, added) = keyed_diff(self.rows, new_rows)
+		# detach the model for big batches, switching to another map, the
+		# view would otherwise update itself after every row
+		detach = len(removed) + len(added) > 100
+		if detach:
+			self.set_model(None)
+		columns = list(range(self.n_columns))
+		for key in removed:
+			self.store.remove(self.iters.pop(key))
+		for key in changed:
+			self.store.set(self.iters[key], columns, new_rows[key])
+		for key in added:
+			self.iters[key] = self.store.append(new_rows[key] + [key])
+		self.rows = new_rows
+		if detach:
+			self.set_model(self.store)
+
+	def select_key(self, key):
+		tree_iter = self.iters.get(key)
+		if tree_iter is None:
+			return
+		path = self.store.get_path(tree_iter)
+		self.set_cursor(path, None, False)
+		self.scroll_to_cell(path, None, True, 0.5, 0)
 
-		edit_button = Gtk.Button(label="🖊")
-		edit_button.connect("clicked", self.on_edit_clicked)
-		grid.attach(edit_button, 4, 0, 1, 1)
+	def edit_row(self, key):
+		pass
 
-		delete_button = Gtk.Button(label="🗑")
-		delete_button.connect("clicked", self.on_delete_clicked)
-		grid.attach(delete_button, 5, 0, 1, 1)
+	def delete_row(self, key):
+		pass
 
-		self.add(grid)
+class StreamRulesView(RuleTreeView):
+	def __init__(self):
+		super(StreamRulesView, self).__init__(["Name", "Mute", "Volume", "Device"])
 
-	def on_edit_clicked(self, widget):
+	@instrument.timed('gui.show_map')
+	def show_map(self, selected_map):
+		rows = []
+		for key in restore_map[selected_map]:
+			restoration_row = restore_map[selected_map][key]
+			# TODO do we include channel_map
+			rows.append((key, [
+				GLib.markup_escape_text(str(key)),
+				"off" if restoration_row.mute else "on",
+				str(round(restoration_row.volume.value_flat * 100, 2))+"%",
+				str(restoration_row.device),
+			]))
+		self.set_rows(rows)
+
+	def edit_row(self, restoration_name):
 		global currently_selected_map
-		global pulse
-		rule_name = currently_selected_map+":"+self.restoration_name
-		dialog = DialogEditRule(self, rule_name, self.restoration_row)
+		rule_name = currently_selected_map+":"+restoration_name
+		restoration_row = restore_map[currently_selected_map][restoration_name]
+		dialog = DialogEditRule(self, rule_name, restoration_row)
 		response = dialog.run()
 		if response == Gtk.ResponseType.OK:
 			new_volume = float(dialog.volume_entry.get_text())/100.0
+			rule = copy_stream_rule(restoration_row)
 			if dialog.device_entry.get_text() != 'None':
-				self.restoration_row.device = dialog.device_entry.get_text()
-			if self.restoration_row.channel_count == 0 and new_volume > 0.0:
+				rule.device = dialog.device_entry.get_text()
+			if rule.channel_count == 0 and new_volume > 0.0:
 				# default to 2 channels
-				self.restoration_row.channel_count = 2
-				self.restoration_row.channel_list = ['front-left', 'front-right']
-				self.restoration_row.volume = pulsectl.PulseVolumeInfo(struct_or_values=[0.50,0.50], channels=2)
+				rule.channel_count = 2
+				rule.channel_list = ['front-left', 'front-right']
+				rule.volume = pulsectl.PulseVolumeInfo(struct_or_values=[0.50,0.50], channels=2)
 			if new_volume > 0:
-				for i in range(len(self.restoration_row.volume.values)):
-					self.restoration_row.volume.values[i] = new_volume
-			self.restoration_row.mute = 1 if dialog.mute_switch.get_state() else 0
-			pulse.stream_restore_write(self.restoration_row, mode='replace')
-			self.emit("refresh")
+				for i in range(len(rule.volume.values)):
+					rule.volume.values[i] = new_volume
+			rule.mute = 1 if dialog.mute_switch.get_state() else 0
+			desired = current_stream_rules([currently_selected_map])
+			desired[rule_name] = rule
+			submit_stream_rules(desired.values(), [currently_selected_map],
+				lambda diff: self.emit("refresh", diff))
 		dialog.destroy()
 
-	def on_delete_clicked(self, widget):
+	def delete_row(self, restoration_name):
 		global currently_selected_map
-		global pulse
-		rule_name = currently_selected_map+":"+self.restoration_name
+		rule_name = currently_selected_map+":"+restoration_name
 		dialog = DialogConfirmDeleteRule(self, rule_name, "Stream Rule Deletion")
 		response = dialog.run()
 
 		if response == Gtk.ResponseType.OK:
-			pulse.stream_restore_delete(rule_name)
-			self.emit("refresh")
+			desired = current_stream_rules([currently_selected_map])
+			desired.pop(rule_name, None)
+			submit_stream_rules(desired.values(), [currently_selected_map],
+				lambda diff: self.emit("refresh", diff))
 		dialog.destroy()
 
 
-class ListBoxDevicePortInfo(Gtk.ListBoxRow):
-	__gsignals__ = {
-		'refresh': (GObject.SignalFlags.RUN_LAST, GObject.TYPE_NONE, ())
-	}
-	def __init__(self, device_name, device_type, port_name, port_info):
-		super(Gtk.ListBoxRow, self).__init__()
-		global device_map
-		# for now show only muted, volume, nb_channels
+class DevicePortsView(RuleTreeView):
+	def __init__(self):
+		super(DevicePortsView, self).__init__(["Port", "Mute", "Volume", "Channels"])
+		self.device_name = ''
+		self.device_type = ''
+
+	@instrument.timed('gui.show_device')
+	def show_device(self, device_name, device_type, device):
 		self.device_name = device_name
 		self.device_type = device_type
-		self.port_name = port_name
-		self.port_info = port_info
-
-		grid = Gtk.Grid()
-		grid.set_column_spacing(10)
-		self.add(grid)
-
-		label_name = Gtk.Label(label=port_name, xalign=0)
-		default_port = device_map[device_type][device_name]['default_port']['port'] or 'null'
-		if port_name == default_port:
-			label_name.set_markup("<b>"+port_name+"</b>")
-		scroll = Gtk.ScrolledWindow(expand=True)
-		scroll.add(label_name)
-		grid.attach(scroll, 0, 0, 1, 1)
-
-		text_mute = "off" if self.port_info.muted else "on"
-		label_mute = Gtk.Label(label=text_mute, xalign=0)
-		scroll = Gtk.ScrolledWindow(expand=True)
-		scroll.add(label_mute)
-		grid.attach(scroll, 1, 0, 1, 1)
-
-		volume = 0.0
-		if len(self.port_info.volume['values']) > 0:
-			volume = round(sum(self.port_info.volume['values'])*100/len(self.port_info.volume['values']), 2)
-		label_volume = Gtk.Label(label=str(volume)+"%", xalign=0)
-		scroll = Gtk.ScrolledWindow(expand=True)
-		scroll.add(label_volume)
-		grid.attach(scroll, 2, 0, 1, 1)
-
-		label_channels = Gtk.Label(label="#channels:"+str(self.port_info.channel_map['channels']), xalign=0)
-		scroll = Gtk.ScrolledWindow(expand=True)
-		scroll.add(label_channels)
-		grid.attach(scroll, 3, 0, 1, 1)
-
-		edit_button = Gtk.Button(label="🖊")
-		edit_button.connect("clicked", self.edit_port_button_clicked)
-		grid.attach(edit_button, 4, 0, 1, 1)
-
-		delete_button = Gtk.Button(label="🗑")
-		delete_button.connect("clicked", self.delete_port_button_clicked)
-		grid.attach(delete_button, 5, 0, 1, 1)
-
-	def delete_port_button_clicked(self, widget):
-		global db
-		global device_map
+		if device == None:
+			self.set_rows([])
+			return
+		# for now show only muted, volume, nb_channels
+		default_port = 'null'
+		if device['default_port']:
+			default_port = device['default_port']['port'] or 'null'
+		rows = []
+		for port_name, port_info in device['ports'].items():
+			label_name = GLib.markup_escape_text(port_name)
+			if port_name == default_port:
+				label_name = "<b>"+label_name+"</b>"
+			if pending_device_changes.is_deleted(device_type+":"+device_name+":"+port_name):
+				# staged, gone once the changes are applied
+				label_name = "<s>"+label_name+"</s>"
+			volume = 0.0
+			if len(port_info.volume['values']) > 0:
+				volume = round(sum(port_info.volume['values'])*100/len(port_info.volume['values']), 2)
+			rows.append((port_name, [
+				label_name,
+				"off" if port_info.muted else "on",
+				str(volume)+"%",
+				"#channels:"+str(port_info.channel_map['channels']),
+			]))
+		self.set_rows(rows)
+
+	def delete_row(self, port_name):
 		full_device_name = self.device_type+":"+self.device_name
-		dialog = DialogConfirmDeleteRule(self, full_device_name+"\nport => "+self.port_name, "Device Port Rule Deletion")
+		dialog = DialogConfirmDeleteRule(self, full_device_name+"\nport => "+port_name, "Device Port Rule Deletion")
 		response = dialog.run()
 		if response == Gtk.ResponseType.OK:
-			db.delete((full_device_name+":"+self.port_name).encode())
-			self.emit("refresh")
+			pending_device_changes.delete(full_device_name+":"+port_name)
+			write_device_changes(lambda keys: self.emit("refresh", keys))
 		dialog.destroy()
 
-	def edit_port_button_clicked(self, widget):
+	def edit_row(self, port_name):
 		# we can edit mute,volume,channel map?
-		global db
 		global device_map
-		dialog = DialogPortEditRule(self, self.device_type, self.device_name, self.port_name)
+		dialog = DialogPortEditRule(self, self.device_type, self.device_name, port_name)
 		response = dialog.run()
 		if response == Gtk.ResponseType.OK:
 			channel_map_str = dialog.channel_entry.get_text().rstrip()
 			channel_map = []
 			if channel_map_str != '':
 				channel_map = [int(element) for element in channel_map_str.split(',')]
-			port_row = device_map[self.device_type][self.device_name]['ports'][self.port_name]
+			port_row = device_map[self.device_type][self.device_name]['ports'][port_name]
 
 			port_row.muted_valid = dialog.muted_valid.get_active()
 			port_row.muted = dialog.mute_switch.get_state()
@@ -569,15 +336,15 @@ class ListBoxDevicePortInfo(Gtk.ListBoxRow):
 			vol = float(dialog.volume_entry.get_text())/100.0
 			port_row.volume['values'] = [vol for i in range(port_row.volume['channels'])]
 
-			key_of_entry = (self.device_type+":"+self.device_name+":"+self.port_name).encode()
+			key_of_entry = (self.device_type+":"+self.device_name+":"+port_name).encode()
 			to_replace = bytes(port_row.encode())
-			db.store(key_of_entry, to_replace, tdb.REPLACE)
-
-			self.emit("refresh")
+			pending_device_changes.store(key_of_entry, to_replace)
+			write_device_changes(lambda keys: self.emit("refresh", keys))
 		dialog.destroy()
 
-GObject.type_register(ListBoxRestorationInfo)
-GObject.type_register(ListBoxDevicePortInfo)
+GObject.type_register(RuleTreeView)
+GObject.type_register(StreamRulesView)
+GObject.type_register(DevicePortsView)
 
 class DialogPortEditRule(Gtk.Dialog):
 	def __init__(self, parent, device_type, device_name, port_name):
@@ -760,6 +527,7 @@ class DialogNewRoutingRule(Gtk.Dialog):
 
 
 class RestoreDbUI(Gtk.Window):
+	@instrument.timed('gui.main_window')
 	def __init__(self):
 		Gtk.Window.__init__(self, title="PulseAudio Restoration DB Editor")
 		self.set_default_size(950,500)
@@ -767,10 +535,23 @@ class RestoreDbUI(Gtk.Window):
 		box_outer = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
 		self.add(box_outer)
 
+		title_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
 		label = Gtk.Label(label="Pulse Audio Restoration DB Editor", xalign=0.5)
-		box_outer.pack_start(label, False, True, 0)
-
-		notebook = Gtk.Notebook()
+		title_box.pack_start(label, True, True, 0)
+		self.search_entry = Gtk.SearchEntry()
+		self.search_entry.set_placeholder_text("Search rules, devices, ports")
+		self.search_entry.connect("search-changed", self.on_search_changed)
+		title_box.pack_start(self.search_entry, False, True, 0)
+		# spins while pulse or the DB are being talked to
+		self.spinner = Gtk.Spinner()
+		title_box.pack_start(self.spinner, False, True, 0)
+		box_outer.pack_start(title_box, False, True, 0)
+
+		global worker
+		worker = io_worker(dispatch=GLib.idle_add, on_busy=self.on_busy, on_error=self.on_io_error)
+
+		self.notebook = Gtk.Notebook()
+		notebook = self.notebook
 		box_outer.pack_start(notebook, True, True, 0)
 
 		box_streams = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
@@ -779,6 +560,21 @@ class RestoreDbUI(Gtk.Window):
 		box_devices = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
 		notebook.append_page(box_devices, Gtk.Label(label="Device Restore Rules"))
 
+		# kind, name, then the kind and key of the entry, hidden
+		self.search_store = Gtk.ListStore(str, str, str, str)
+		self.search_view = Gtk.TreeView(model=self.search_store)
+		self.search_view.append_column(Gtk.TreeViewColumn("Kind", Gtk.CellRendererText(), text=0))
+		self.search_view.append_column(Gtk.TreeViewColumn("Name", Gtk.CellRendererText(), text=1))
+		self.search_view.connect("row-activated", self.on_search_result_activated)
+		scroll = Gtk.ScrolledWindow()
+		scroll.add(self.search_view)
+		self.search_page = notebook.append_page(scroll, Gtk.Label(label="Search"))
+
+		# word prefix index over every rule, device and port, patched after
+		# each change
+		self.search_index = search_index()
+		self.search_index.rebuild()
+
 		# Device Restoration
 
 		self.selected_device_label = Gtk.Label(label="", xalign=0.5)
@@ -789,18 +585,15 @@ class RestoreDbUI(Gtk.Window):
 		paned.set_position(240)
 		left_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
 		paned.pack1(left_box, True, False)
-		right_pane_scroll = Gtk.ScrolledWindow()
-		paned.pack2(right_pane_scroll, True, False)
-		box_devices.pack_start(paned, True, True, 10)
-
-
 		right_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
-		right_pane_scroll.add(right_box)
+		paned.pack2(right_box, True, False)
+		box_devices.pack_start(paned, True, True, 10)
 
 		left_box.pack_start(Gtk.Label(label="Sinks", xalign=0), False, True, 0)
 		scroll = Gtk.ScrolledWindow()
 		self.listbox_sink = Gtk.ListBox()
 		self.listbox_sink.set_selection_mode(Gtk.SelectionMode.NONE)
+		self.listbox_sink.connect("row-activated", self.on_selected_sink)
 		scroll.add(self.listbox_sink)
 		left_box.pack_start(scroll, True, True, 0)
 
@@ -811,9 +604,12 @@ class RestoreDbUI(Gtk.Window):
 		scroll = Gtk.ScrolledWindow()
 		self.listbox_source = Gtk.ListBox()
 		self.listbox_source.set_selection_mode(Gtk.SelectionMode.NONE)
+		self.listbox_source.connect("row-activated", self.on_selected_source)
 		scroll.add(self.listbox_source)
 		left_box.pack_start(scroll, True, True, 0)
 
+		# device name -> row, for each list
+		self.device_rows = {'sink': {}, 'source': {}}
 		self.refresh_listbox_sink()
 		self.refresh_listbox_source()
 
@@ -831,8 +627,9 @@ class RestoreDbUI(Gtk.Window):
 
 		right_box.pack_start(Gtk.Label(label="Available Ports", xalign=0.5), False, False, 0)
 		scroll = Gtk.ScrolledWindow()
-		self.listbox_available_ports = Gtk.ListBox()
-		scroll.add(self.listbox_available_ports)
+		self.device_ports_view = DevicePortsView()
+		self.device_ports_view.connect("refresh", self.on_refreshed_device_port_listbox)
+		scroll.add(self.device_ports_view)
 		right_box.pack_start(scroll, True, True, 0)
 
 		device_button_edit_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
@@ -842,11 +639,27 @@ class RestoreDbUI(Gtk.Window):
 		set_as_default_device_button.connect("clicked", self.set_default_device_clicked)
 		delete_device_button = Gtk.Button(label="🗑")
 		delete_device_button.connect("clicked", self.delete_device_clicked)
+		resync_devices_button = Gtk.Button(label="Resync")
+		resync_devices_button.connect("clicked", self.resync_devices_clicked)
 		device_button_edit_box.pack_start(add_new_port_button, True, True, 0)
 		device_button_edit_box.pack_start(set_as_default_device_button, False, True, 0)
 		device_button_edit_box.pack_start(delete_device_button, False, True, 0)
+		device_button_edit_box.pack_start(resync_devices_button, False, True, 0)
 		right_box.pack_start(device_button_edit_box, False, True, 0)
 
+		pending_changes_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+		stage_changes_button = Gtk.CheckButton(label="Stage changes")
+		stage_changes_button.connect("toggled", self.stage_changes_toggled)
+		self.apply_changes_button = Gtk.Button(label="Apply 0 pending changes")
+		self.apply_changes_button.connect("clicked", self.apply_changes_clicked)
+		self.discard_changes_button = Gtk.Button(label="Discard")
+		self.discard_changes_button.connect("clicked", self.discard_changes_clicked)
+		pending_changes_box.pack_start(stage_changes_button, False, True, 0)
+		pending_changes_box.pack_start(self.apply_changes_button, True, True, 0)
+		pending_changes_box.pack_start(self.discard_changes_button, False, True, 0)
+		right_box.pack_start(pending_changes_box, False, True, 0)
+		self.update_pending_changes()
+
 		# Stream Restoration
 
 		self.currently_select_map_label = Gtk.Label(label="", xalign=0.5)
@@ -862,8 +675,6 @@ class RestoreDbUI(Gtk.Window):
 		box_streams.pack_start(paned, True, True, 10)
 		left_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
 		left_pane_scroll.add(left_box)
-		self.right_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
-		right_pane_scroll.add(self.right_box)
 
 		add_new_rule_button = Gtk.Button(label="New Routing Rule")
 		add_new_rule_button.connect("clicked", self.on_add_new_rule_clicked)
@@ -884,8 +695,9 @@ class RestoreDbUI(Gtk.Window):
 		left_box.pack_start(listbox_source_output, True, True, 0)
 
 
-		self.right_listbox = Gtk.ListBox()
-		self.right_box.pack_start(self.right_listbox, True, True, 0)
+		self.stream_rules_view = StreamRulesView()
+		self.stream_rules_view.connect("refresh", self.on_refreshed_listbox)
+		right_pane_scroll.add(self.stream_rules_view)
 
 		listbox_sink_input.add(ListBoxRowWithData("sink-input-by-media-role"))
 		listbox_sink_input.add(ListBoxRowWithData("sink-input-by-application-name"))
@@ -899,30 +711,49 @@ class RestoreDbUI(Gtk.Window):
 		listbox_source_output.add(ListBoxRowWithData("source-output-by-media-name"))
 		listbox_source_output.connect("row-activated", self.restore_db_sub_selection)
 
+		self.watcher = restore_files_watcher()
+		GLib.timeout_add_seconds(1, self.on_watch_timeout)
+
+	def on_watch_timeout(self):
+		# the check reads the DB, leave it for the next tick when it would
+		# wait behind other work
+		if not worker.busy:
+			# a copy, device_map_hashes is patched here meanwhile
+			worker.submit(self.watcher.poll, device_map_hashes.copy(), on_done=self.on_watch_checked)
+		return True
+
+	@instrument.timed('gui.on_watch_checked')
+	def on_watch_checked(self, result):
+		global currently_selected_device
+		global currently_selected_device_type
+		(changed_keys, defaults_changed) = self.watcher.apply(result)
+		if len(changed_keys) == 0 and not defaults_changed:
+			return
+		self.search_index.update_device_keys(changed_keys)
+		self.refresh_listbox_sink()
+		self.refresh_listbox_source()
+		changed_names = [key.decode().split(":")[1] for key in changed_keys]
+		if currently_selected_device != '' and (defaults_changed or currently_selected_device in changed_names):
+			self.show_selected_device(
+				currently_selected_device,
+				device_map[currently_selected_device_type].get(currently_selected_device),
+				currently_selected_device_type)
+
 	def restore_db_sub_selection(self, listbox_widget, row):
-		children = self.right_listbox.get_children()
-		for child in children:
-			self.right_listbox.remove(child)
 		self.match_right_pane_to_data(row.data)
 
-	def on_refreshed_listbox(self, listbox_widget):
+	# restore_map was already patched by submit_stream_rules()
+	def on_refreshed_listbox(self, listbox_widget, diff=None):
 		global currently_selected_map
-		refresh_restore_map()
-		children = self.right_listbox.get_children()
-		for child in children:
-			self.right_listbox.remove(child)
+		if diff != None:
+			self.search_index.update_stream_rules(diff)
 		self.match_right_pane_to_data(currently_selected_map)
 
 	def match_right_pane_to_data(self, selected_map):
 		global currently_selected_map
 		currently_selected_map = selected_map
 		self.currently_select_map_label.set_label(selected_map)
-		for key in restore_map[selected_map]:
-			resto_info_listbox = ListBoxRestorationInfo(str(key), restore_map[selected_map][key])
-			self.right_listbox.add(resto_info_listbox)
-			resto_info_listbox.connect("refresh", self.on_refreshed_listbox)
-
-		self.right_listbox.show_all()
+		self.stream_rules_view.show_map(selected_map)
 
 	def on_add_new_rule_clicked(self, widget):
 		dialog = DialogNewRoutingRule(self)
@@ -941,38 +772,42 @@ class RestoreDbUI(Gtk.Window):
 					mute=muted,
 					channel_list=['front-left', 'front-right']
 			)
-			pulse.stream_restore_write(new_rule, mode='replace')
-			self.on_refreshed_listbox(None)
+			desired = current_stream_rules([rule_type])
+			desired[new_rule.name] = new_rule
+			submit_stream_rules(desired.values(), [rule_type],
+				lambda diff: self.on_refreshed_listbox(None, diff))
 
 		dialog.destroy()
 
 	def refresh_listbox_sink(self):
-		global device_map
-		children = self.listbox_sink.get_children()
-		for child in children:
-			self.listbox_sink.remove(child)
-
-		for name in device_map['sink'].keys():
-			if device_map['sink'][name]['is_default_device']:
-				self.listbox_sink.add(ListBoxRowWithData(name, "<b>"+name+"</b>"))
-			else:
-				self.listbox_sink.add(ListBoxRowWithData(name))
-		self.listbox_sink.connect("row-activated", self.on_selected_sink)
-		self.listbox_sink.show_all()
+		self.refresh_device_listbox(self.listbox_sink, 'sink')
 
 	def refresh_listbox_source(self):
-		global device_map
-		children = self.listbox_source.get_children()
-		for child in children:
-			self.listbox_source.remove(child)
+		self.refresh_device_listbox(self.listbox_source, 'source')
 
-		for name in device_map['source'].keys():
-			if device_map['source'][name]['is_default_device']:
-				self.listbox_source.add(ListBoxRowWithData(name, "<b>"+name+"</b>"))
+	# add, remove or relabel only the rows of the devices that changed
+	@instrument.timed('gui.refresh_device_listbox')
+	def refresh_device_listbox(self, listbox, device_type):
+		global device_map
+		rows = self.device_rows[device_type]
+		new_rows = {}
+		for name in device_map[device_type].keys():
+			if device_map[device_type][name]['is_default_device']:
+				new_rows[name] = "<b>"+GLib.markup_escape_text(name)+"</b>"
 			else:
-				self.listbox_source.add(ListBoxRowWithData(name))
-		self.listbox_source.connect("row-activated", self.on_selected_source)
-		self.listbox_source.show_all()
+				new_rows[name] = None
+			if pending_device_changes.is_deleted(device_type+":"+name):
+				new_rows[name] = "<s>"+(new_rows[name] or GLib.markup_escape_text(name))+"</s>"
+		old_rows = {name: row.extra for name, row in rows.items()}
+		(removed, changed, added) = keyed_diff(old_rows, new_rows)
+		for name in removed:
+			listbox.remove(rows.pop(name))
+		for name in changed:
+			rows[name].set_extra(new_rows[name])
+		for name in added:
+			rows[name] = ListBoxRowWithData(name, new_rows[name])
+			listbox.add(rows[name])
+			rows[name].show_all()
 
 	def on_selected_sink(self, widget, row):
 		global device_map
@@ -988,29 +823,18 @@ class RestoreDbUI(Gtk.Window):
 		currently_selected_device = name
 		currently_selected_device_type = device_type
 		self.selected_device_label.set_label(name)
-
-		children = self.listbox_available_ports.get_children()
-		for child in children:
-			self.listbox_available_ports.remove(child)
+		self.device_ports_view.show_device(name, device_type, device)
 
 		if device == None:
 			return
 
-		default_port = device['default_port']['port']
+		default_port = device['default_port']['port'] if device['default_port'] else None
 		if default_port:
 			self.default_port_entry.set_text(default_port)
 		else:
 			self.default_port_entry.set_text("null")
 
-		ports = device['ports']
-		for i in ports.keys():
-			device_port_listbox = ListBoxDevicePortInfo(name, device_type, i, ports[i])
-			self.listbox_available_ports.add(device_port_listbox)
-			device_port_listbox.connect("refresh", self.on_refreshed_device_port_listbox)
-		self.listbox_available_ports.show_all()
-
 	def save_default_port_clicked(self, widget):
-		global db
 		global currently_selected_device
 		global currently_selected_device_type
 		if currently_selected_device == '':
@@ -1018,51 +842,42 @@ class RestoreDbUI(Gtk.Window):
 		new_default_port = self.default_port_entry.get_text()
 		if new_default_port == "null":
 			new_default_port = None
-		current_default_port = device_map[currently_selected_device_type][currently_selected_device]['default_port'].port
+		device = device_map[currently_selected_device_type][currently_selected_device]
+		entry = device['default_port']
+		current_default_port = entry.port if entry else None
 		if new_default_port == current_default_port:
 			return
 
+		key_of_default = currently_selected_device_type+":"+currently_selected_device
+		if entry == None:
+			# the device has no default port record yet, it gets one
+			entry = per_port_entry.from_dict(key_of_default, {})
+			device['default_port'] = entry
 		if new_default_port == None:
-			device_map[currently_selected_device_type][currently_selected_device]['default_port'].port = None
-			device_map[currently_selected_device_type][currently_selected_device]['default_port'].port_valid = False
+			entry.port = None
+			entry.port_valid = False
 		else:
-			device_map[currently_selected_device_type][currently_selected_device]['default_port'].port = new_default_port
-			device_map[currently_selected_device_type][currently_selected_device]['default_port'].port_valid = True
-
-		key_of_default = (currently_selected_device_type+":"+currently_selected_device).encode()
-		to_replace = bytes(device_map[currently_selected_device_type][currently_selected_device]['default_port'].encode())
-		db.store(key_of_default, to_replace, tdb.REPLACE)
+			entry.port = new_default_port
+			entry.port_valid = True
 
-		refresh_device_map()
-		self.show_selected_device(
-			currently_selected_device,
-			device_map[currently_selected_device_type][currently_selected_device],
-			currently_selected_device_type)
+		key_of_default = key_of_default.encode()
+		to_replace = bytes(entry.encode())
+		pending_device_changes.store(key_of_default, to_replace)
+		self.update_pending_changes()
+		write_device_changes(lambda keys: self.on_refreshed_device_port_listbox(None, keys))
 
 	def set_default_device_clicked(self, widget):
-		global pulse
-		global machine_id
 		global currently_selected_device
 		global currently_selected_device_type
 		if currently_selected_device == '' or currently_selected_device == None:
 			return
-		if currently_selected_device_type == 'sink':
-			pulse.sink_default_set(currently_selected_device)
-			open(os.environ['HOME']+'/.config/pulse/'+machine_id+'-default-sink','w').write(currently_selected_device)
-		else:
-			pulse.source_default_set(currently_selected_device)
-			open(os.environ['HOME']+'/.config/pulse/'+machine_id+'-default-source','w').write(currently_selected_device)
-
-		refresh_device_map()
-		self.refresh_listbox_sink()
-		self.refresh_listbox_source()
-		self.show_selected_device(
-			currently_selected_device,
-			device_map[currently_selected_device_type][currently_selected_device],
-			currently_selected_device_type)
+		def on_done(defaults):
+			apply_default_devices(defaults)
+			self.on_refreshed_device_port_listbox(None)
+		worker.submit(write_default_device, currently_selected_device_type, currently_selected_device,
+			on_done=on_done)
 
 	def delete_device_clicked(self, widget):
-		global db
 		global device_map
 		global currently_selected_device
 		global currently_selected_device_type
@@ -1072,19 +887,18 @@ class RestoreDbUI(Gtk.Window):
 
 		if response == Gtk.ResponseType.OK:
 			# for the default port rule
-			db.delete(full_device_name.encode())
+			pending_device_changes.delete(full_device_name)
 			# for individual ports
 			for port in device_map[currently_selected_device_type][currently_selected_device]['ports'].keys():
-				db.delete((full_device_name+":"+port).encode())
-			refresh_device_map()
-			self.refresh_listbox_sink()
-			self.refresh_listbox_source()
+				pending_device_changes.delete(full_device_name+":"+port)
 			self.show_selected_device("", None, "")
+			# all in one transaction, never a half deleted device
+			write_device_changes(lambda keys: self.on_refreshed_device_port_listbox(None, keys))
+			self.update_pending_changes()
 
 		dialog.destroy()
 
 	def add_new_port_clicked(self, widget):
-		global db
 		global device_map
 		global currently_selected_device
 		global currently_selected_device_type
@@ -1114,27 +928,119 @@ class RestoreDbUI(Gtk.Window):
 
 			key_of_entry = (full_device_name+":"+new_port_name).encode()
 			to_replace = bytes(port_row.encode())
-			db.store(key_of_entry, to_replace, tdb.REPLACE)
-			self.on_refreshed_device_port_listbox(None)
+			pending_device_changes.store(key_of_entry, to_replace)
+			write_device_changes(lambda keys: self.on_refreshed_device_port_listbox(None, keys))
+			self.update_pending_changes()
 
 		dialog.destroy()
 
 
-	def on_refreshed_device_port_listbox(self, listbox_widget):
+	# device_map was already patched by whoever emitted the refresh, keys
+	# are the ones that changed
+	def on_refreshed_device_port_listbox(self, listbox_widget, keys=None):
 		global currently_selected_device
 		global currently_selected_device_type
-		refresh_device_map()
+		if keys != None:
+			self.search_index.update_device_keys(keys)
+		self.update_pending_changes()
 		self.refresh_listbox_sink()
 		self.refresh_listbox_source()
-		self.show_selected_device(
-			currently_selected_device,
-			device_map[currently_selected_device_type][currently_selected_device],
-			currently_selected_device_type)
-
-
-
-win = RestoreDbUI()
-win.connect("destroy", Gtk.main_quit)
-win.show_all()
-Gtk.main()
+		if currently_selected_device != '':
+			self.show_selected_device(
+				currently_selected_device,
+				device_map[currently_selected_device_type].get(currently_selected_device),
+				currently_selected_device_type)
+
+	def update_pending_changes(self):
+		self.apply_changes_button.set_label("Apply "+str(len(pending_device_changes))+" pending changes")
+		self.apply_changes_button.set_sensitive(len(pending_device_changes) > 0)
+		self.discard_changes_button.set_sensitive(len(pending_device_changes) > 0)
+
+	def stage_changes_toggled(self, widget):
+		pending_device_changes.staging = widget.get_active()
+		if not pending_device_changes.staging:
+			self.apply_changes_clicked(None)
+
+	def apply_changes_clicked(self, widget):
+		def on_error(e):
+			# the transaction was cancelled and the changes dropped
+			show_error(self, "Could not apply the pending changes", e)
+		submit_device_changes(lambda keys: self.on_refreshed_device_port_listbox(None, keys),
+			on_error=on_error)
+
+	def discard_changes_clicked(self, widget):
+		keys = pending_device_changes.drop()
+		# entries might have been edited in place, read them back
+		def on_done(entries):
+			pending_device_changes.patch_map(entries)
+			self.on_refreshed_device_port_listbox(None, keys)
+		worker.submit(pending_device_changes.read_back, keys, on_done=on_done)
+
+	def resync_devices_clicked(self, widget):
+		def on_done(result):
+			apply_device_map(result)
+			self.search_index.rebuild()
+			self.on_refreshed_device_port_listbox(None)
+		worker.submit(read_device_map, on_done=on_done)
+
+	@instrument.timed('gui.search')
+	def on_search_changed(self, entry):
+		self.search_view.set_model(None)
+		self.search_store.clear()
+		for (kind, key) in self.search_index.search(entry.get_text(), SEARCH_LIMIT):
+			if kind == 'stream':
+				name = key
+			else:
+				name = key.split(":", 1)[1]
+			self.search_store.append([kind, name, kind, key])
+		self.search_view.set_model(self.search_store)
+		if entry.get_text() != '':
+			self.notebook.set_current_page(self.search_page)
+
+	# go to the rule, device or port of the result
+	def on_search_result_activated(self, widget, path, column):
+		(kind, key) = (self.search_store[path][2], self.search_store[path][3])
+		parts = key.split(":")
+		if kind == 'stream':
+			self.match_right_pane_to_data(parts[0])
+			self.notebook.set_current_page(0)
+			self.stream_rules_view.select_key(key[len(parts[0])+1:])
+			return
+		self.show_selected_device(parts[1], device_map[parts[0]].get(parts[1]), parts[0])
+		self.notebook.set_current_page(1)
+		if kind == 'port':
+			self.device_ports_view.select_key(":".join(parts[2:]))
+
+	def on_busy(self, busy):
+		if busy:
+			self.spinner.start()
+		else:
+			self.spinner.stop()
+
+	def on_io_error(self, error):
+		show_error(self, "PulseAudio or the restoration DB failed", error)
+		# a failed write drops its changes, the panes show the DB again
+		self.on_refreshed_device_port_listbox(None)
+
+
+
+def main():
+	if '--timings' in sys.argv:
+		# summary on exit and on SIGUSR1, see pa_resto/instrument.py
+		instrument.enable(os.environ.get('PA_RESTO_CPROFILE'))
+	refresh_device_map()
+	#print(json.dumps(clean_nones(device_map)))
+	#sys.exit(0)
+	refresh_restore_map()
+
+	win = RestoreDbUI()
+	win.connect("destroy", Gtk.main_quit)
+	win.show_all()
+	if '--exit-after-startup' in sys.argv:
+		# used by benchmarks/bench_startup.py
+		GLib.idle_add(Gtk.main_quit)
+	Gtk.main()
+
+if __name__ == '__main__':
+	main()
 
@@ -0,0 +1,48 @@
+# Library side of pa-resto-edit: the restoration DB codecs and the maps built
+# from them, importable without connecting to PulseAudio or opening any file.
+from .device_restore import per_port_entry
+from .stream_restore import stream_restore_entry, read_stream_rules, write_stream_rules
+from .card_restore import card_restore_entry
+from .restore_db import (
+	get_pulse,
+	get_db,
+	device_volumes_db,
+	stream_volumes_db,
+	get_stream_db,
+	card_database_db,
+	get_card_db,
+	default_sink_file,
+	default_source_file,
+	device_map,
+	device_map_hashes,
+	device_cache,
+	refresh_device_map,
+	read_device_map,
+	apply_device_map,
+	refresh_default_devices,
+	apply_default_devices,
+	set_default_device,
+	write_default_device,
+	update_device_map,
+	read_device_entries,
+	apply_device_entries,
+	changed_device_keys,
+	restore_files_watcher,
+	device_db_changes,
+	pending_device_changes,
+	store_entries,
+	card_map,
+	card_cache,
+	refresh_card_map,
+	update_card_map,
+	changed_card_keys,
+	card_db_changes,
+	file_db_changes,
+	pending_card_changes,
+	store_card_entries,
+	restore_map,
+	restore_map_empty,
+	refresh_restore_map,
+	stream_rule_to_dict,
+	clean_nones,
+)
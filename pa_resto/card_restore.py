@@ -0,0 +1,125 @@
+import re
+import struct
+
+from . import tagstruct
+
+# The module-card-restore entries, in <machine-id>-card-database.tdb, they
+# are what sets the profile of a card, and the latency offsets of its ports,
+# when it shows up again, a dock or a USB headset for example.
+# Structure: https://gitlab.freedesktop.org/pulseaudio/pulseaudio/-/blob/master/src/modules/module-card-restore.c
+# entry_write(), the key is the card name without its NUL:
+# 'B' version, 't' profile or 'N', 'L' number of ports, then for every port
+# 't' name, 'r' latency offset in usec, 't' profile or 'N' (version 3),
+# 't' preferred input port or 'N', 't' preferred output port or 'N'
+# (version 4), profile_is_sticky (version 5)
+
+# Example:
+# alsa_card.usb-Lenovo_ThinkPad_Thunderbolt_3_Dock_USB_Audio_000000000000-00
+# 4205 74 6f75747075743a616e616c6f672d73746572656f00 4c00000001
+# 74 616e616c6f672d6f757470757400 72 0000000000000000 4e 4e 4e 31
+
+class card_restore_entry:
+	# the version module-card-restore writes, entries of a later version are
+	# refused by it
+	ENTRY_VERSION = 5
+	# fields exposed through the dict view, this is what gets exported
+	FIELDS = ('name', 'version', 'profile', 'ports', 'preferred_input_port',
+		'preferred_output_port', 'profile_is_sticky')
+	# tags of an entry of each version, as tagstruct.read() returns them
+	ENTRY = {
+		1: re.compile(rb'B[tN]'),
+		2: re.compile(rb'B[tN]L(?:tr)*'),
+		3: re.compile(rb'B[tN]L(?:tr[tN])*'),
+		4: re.compile(rb'B[tN]L(?:tr[tN])*[tN][tN]'),
+		5: re.compile(rb'B[tN]L(?:tr[tN])*[tN][tN][01]'),
+	}
+	__slots__ = ('name', 'version', 'is_valid', 'profile', 'ports',
+		'preferred_input_port', 'preferred_output_port', 'profile_is_sticky')
+
+	def __init__(self, name, binary):
+		self.name = name
+		self.version = self.ENTRY_VERSION
+		self.is_valid = False
+		self.profile = None
+		# port name -> {'offset': latency offset in usec, 'profile': profile
+		# the port was last used with or None}
+		self.ports = {}
+		self.preferred_input_port = None
+		self.preferred_output_port = None
+		self.profile_is_sticky = False
+		self.decode(binary)
+
+	def __getitem__(self, key):
+		if key not in self.FIELDS:
+			raise KeyError(key)
+		return getattr(self, key)
+
+	def to_dict(self):
+		return {key: getattr(self, key) for key in self.FIELDS}
+
+	@classmethod
+	def from_dict(cls, name, fields):
+		entry = cls(name, None)
+		for field in cls.FIELDS:
+			if field != 'name' and field in fields:
+				setattr(entry, field, fields[field])
+		entry.is_valid = True
+		return entry
+
+	@property
+	def key(self):
+		return self.name
+
+	@property
+	def hex(self):
+		return bytes(self.encode()).hex() if self.is_valid else ''
+
+	def decode(self, binary):
+		if not binary:
+			return
+		try:
+			(tags, values) = tagstruct.read(binary)
+		except (IndexError, ValueError, struct.error):
+			# truncated or garbled
+			return
+		if len(values) == 0:
+			return
+		version = values[0]
+		layout = self.ENTRY.get(version)
+		if layout is None or not layout.fullmatch(tags):
+			# of the legacy format or of a later version
+			return
+		self.version = version
+		self.profile = values[1]
+		ports = {}
+		offset = 2
+		if version >= 2:
+			step = 3 if version >= 3 else 2
+			count = values[2]
+			offset = 3 + count*step
+			if offset > len(values):
+				return
+			for i in range(3, offset, step):
+				ports[values[i]] = {'offset': values[i+1],
+					'profile': values[i+2] if step == 3 else None}
+		self.ports = ports
+		if version >= 4:
+			(self.preferred_input_port, self.preferred_output_port) = values[offset:offset+2]
+		if version >= 5:
+			self.profile_is_sticky = values[offset+2]
+		if len(values) != offset + (3 if version >= 5 else 2 if version >= 4 else 0):
+			# more ports than counted
+			return
+		self.is_valid = True
+
+	# always written in the layout of ENTRY_VERSION, like the module does
+	# when it saves an entry it read from an older version
+	def encode(self):
+		tags = bytearray(b'BtL')
+		values = [self.ENTRY_VERSION, self.profile, len(self.ports)]
+		for port, info in self.ports.items():
+			tags += b'trt'
+			values += (port, info['offset'], info.get('profile'))
+		tags += b'tt1'
+		values += (self.preferred_input_port, self.preferred_output_port, self.profile_is_sticky)
+		return tagstruct.write(tags, values)
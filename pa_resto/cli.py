@@ -0,0 +1,569 @@
+#!/usr/bin/env python3
+# Command line access to the stream and device restore rules, for scripts and
+# remote seats where opening the GUI isn't an option.
+#
+#   python3 -m pa_resto stream list [map]
+#   python3 -m pa_resto stream set sink-input-by-media-role:music --volume 60
+#   python3 -m pa_resto device set sink:alsa_output.foo:analog-output --mute on
+#   python3 -m pa_resto device delete sink:alsa_output.foo
+#   python3 -m pa_resto card set alsa_card.usb-dock --profile output:analog-stereo
+#   python3 -m pa_resto batch < operations
+#   python3 -m pa_resto export > state.ndjson
+#   python3 -m pa_resto import < state.ndjson
+#   python3 -m pa_resto sync --dry-run < rules.ndjson
+#   python3 -m pa_resto --offline stream list
+#   python3 -m pa_resto --timings export > /dev/null
+#   python3 -m pa_resto --config-dir /home/bob/.config/pulse --machine-id <id> device list
+#   python3 -m pa_resto audit --jobs 8 /home/* > fleet.ndjson
+#   python3 -m pa_resto policy --dry-run headsets.json
+#   python3 -m pa_resto policy --jobs 8 headsets.json /home/* > applied.ndjson
+#   python3 -m pa_resto snapshot take --label "before the policy"
+#   python3 -m pa_resto snapshot restore --dry-run 1
+#   python3 -m pa_resto gc --dry-run --max-age 30
+#
+# A batch has one operation per line, written like the command line without
+# the program name, blank lines and lines starting with # are ignored. All
+# the lines are checked before anything is written. Then they share a single
+# pulse connection, the stream rule changes are sent in one write and one
+# delete call, and the device and card changes go in one TDB transaction
+# each. Reads in a batch see the changes of the lines before them.
+# sync makes the stream rules match the stream records read from stdin, the
+# ones from export --streams-only, rules missing from it are deleted. It
+# prints the diff, + added, ~ changed, - removed, and with --dry-run only
+# prints it.
+# With --offline the stream rules are read and written straight from the
+# stream-restore DB, for when PulseAudio isn't running, it would overwrite
+# them otherwise.
+# --timings writes how long the DB and pulse calls took to stderr on exit,
+# see instrument.py.
+# audit decodes the device DBs of many homes or DB paths in parallel, see
+# fleet.py, and prints a record per seat and a summary of all of them.
+# policy applies the rules of a JSON policy file, see policy.py, to this seat
+# and prints the changes, or with paths to the DBs of every seat found there.
+# snapshot takes, lists and restores snapshots of the device entries and the
+# stream rules, see snapshot.py.
+# gc purges the devices that aren't live sinks or sources from the device
+# DB and repacks it, see device_gc.py.
+import argparse
+import json
+import os
+import shlex
+import sys
+
+from .device_restore import per_port_entry
+from .card_restore import card_restore_entry
+from . import stream_restore
+from . import ndjson
+from . import instrument
+from . import fleet
+from . import policy
+from . import snapshot
+from . import device_gc
+from . import restore_db
+from .stream_sync import sync_stream_rules
+from .restore_db import (
+	get_pulse,
+	get_db,
+	get_stream_db,
+	get_card_db,
+	refresh_restore_map,
+	device_db_changes,
+	card_db_changes,
+	restore_map_empty,
+	stream_rule_to_dict,
+)
+
+# front-left, front-right
+DEFAULT_CHANNEL_MAP = [1, 2]
+
+class batch_session:
+	def __init__(self, out, offline=False):
+		self.out = out
+		self.offline = offline
+		self.device_changes = device_db_changes()
+		self.card_changes = card_db_changes()
+		# name -> rule to write, names to delete
+		self.stream_writes = {}
+		self.stream_deletes = []
+		self.stream_rules = None
+
+	def print(self, value):
+		self.out.write(json.dumps(value)+"\n")
+
+	def read_stream_rules(self):
+		if self.stream_rules is None:
+			self.stream_rules = {}
+			if self.offline:
+				rules = stream_restore.read_stream_rules(get_stream_db())
+			else:
+				rules = get_pulse().stream_restore_read()
+			for rule in rules:
+				if self.offline and not rule.is_valid:
+					continue
+				self.stream_rules[rule.name] = rule
+		return self.stream_rules
+
+	def get_stream_rule(self, name):
+		if name in self.stream_writes:
+			return self.stream_writes[name]
+		if name in self.stream_deletes:
+			return None
+		return self.read_stream_rules().get(name)
+
+	def write_stream_rule(self, rule):
+		if rule.name in self.stream_deletes:
+			self.stream_deletes.remove(rule.name)
+		self.stream_writes[rule.name] = rule
+
+	def delete_stream_rule(self, name):
+		self.stream_writes.pop(name, None)
+		if name not in self.stream_deletes:
+			self.stream_deletes.append(name)
+
+	def get_device_entry(self, key):
+		key = key.encode()
+		if key in self.device_changes.changes:
+			return self.device_changes.changes[key]
+		return get_db().get(key)
+
+	def device_keys(self):
+		keys = set(get_db().keys())
+		for key, value in self.device_changes.changes.items():
+			if value == None:
+				keys.discard(key)
+			else:
+				keys.add(key)
+		return sorted(keys)
+
+	def get_card_entry(self, name):
+		key = name.encode()
+		if key in self.card_changes.changes:
+			return self.card_changes.changes[key]
+		return get_card_db().get(key)
+
+	def card_keys(self):
+		keys = set(get_card_db().keys())
+		for key, value in self.card_changes.changes.items():
+			if value == None:
+				keys.discard(key)
+			else:
+				keys.add(key)
+		return sorted(keys)
+
+	def commit(self):
+		if self.offline:
+			if len(self.stream_writes) > 0 or len(self.stream_deletes) > 0:
+				stream_restore.write_stream_rules(get_stream_db(),
+					self.stream_writes.values(), self.stream_deletes)
+		else:
+			if len(self.stream_writes) > 0:
+				get_pulse().stream_restore_write(list(self.stream_writes.values()), mode='replace')
+			if len(self.stream_deletes) > 0:
+				get_pulse().stream_restore_delete(self.stream_deletes)
+		self.stream_writes = {}
+		self.stream_deletes = []
+		self.device_changes.apply()
+		self.card_changes.apply()
+
+def parse_switch(value):
+	if value in ('on', 'true', 'yes', '1'):
+		return True
+	if value in ('off', 'false', 'no', '0'):
+		return False
+	raise argparse.ArgumentTypeError("expected on or off, got "+value)
+
+def parse_port_offset(value):
+	(port, separator, offset) = value.rpartition('=')
+	try:
+		if separator == '' or port == '':
+			raise ValueError()
+		return (port, int(offset))
+	except ValueError:
+		raise argparse.ArgumentTypeError("expected <port>=<latency offset in usec>, got "+value)
+
+def parse_channel_map(value):
+	if value.strip() == '':
+		return []
+	try:
+		return [int(element) for element in value.split(',')]
+	except ValueError:
+		raise argparse.ArgumentTypeError("expected comma separated channel positions, got "+value)
+
+def check_stream_name(name):
+	if name.split(":")[0] not in restore_map_empty.keys() or name.find(":") < 0:
+		raise ValueError("stream rule names look like <map>:<name> with map one of "+", ".join(restore_map_empty.keys())+", got "+name)
+
+def check_device_key(key):
+	parts = key.split(":")
+	if parts[0] not in ('sink', 'source') or len(parts) < 2 or parts[1] == '':
+		raise ValueError("device keys look like sink|source:<device>[:<port>], got "+key)
+
+def stream_list(session, args):
+	for name in sorted(session.read_stream_rules().keys() | session.stream_writes.keys()):
+		if args.map != None and name.split(":")[0] != args.map:
+			continue
+		rule = session.get_stream_rule(name)
+		if rule != None:
+			session.print(stream_rule_to_dict(rule))
+
+def stream_get(session, args):
+	check_stream_name(args.name)
+	rule = session.get_stream_rule(args.name)
+	if rule == None:
+		raise KeyError("no stream rule "+args.name)
+	session.print(stream_rule_to_dict(rule))
+
+def stream_set(session, args):
+	check_stream_name(args.name)
+	rule = session.get_stream_rule(args.name)
+	if rule == None:
+		# same defaults as a new rule from the GUI
+		volume = 0.8 if args.volume == None else args.volume/100.0
+		rule = ndjson.stream_rule_from_record({
+			'name': args.name,
+			'device': None,
+			'volume': [volume, volume],
+			'mute': False,
+			'channel_list': ['front-left', 'front-right']
+		}, session.offline)
+	elif args.volume != None:
+		if len(rule.volume.values) == 0:
+			# nothing to set the volume on, front-left front-right as for a
+			# new rule unless the rule has a channel map of its own
+			if rule.channel_count == 0:
+				rule.channel_list = ['front-left', 'front-right']
+				rule.channel_count = 2
+			rule.volume = type(rule.volume)([0.0] * len(rule.channel_list))
+		for i in range(len(rule.volume.values)):
+			rule.volume.values[i] = args.volume/100.0
+	if args.device != None:
+		rule.device = None if args.device == 'None' else args.device
+	if args.mute != None:
+		rule.mute = 1 if args.mute else 0
+	session.write_stream_rule(rule)
+
+def stream_delete(session, args):
+	check_stream_name(args.name)
+	if session.get_stream_rule(args.name) == None:
+		raise KeyError("no stream rule "+args.name)
+	session.delete_stream_rule(args.name)
+
+def device_entry_to_dict(key, value):
+	entry = per_port_entry(key.decode(), value)
+	result = ndjson.device_entry_to_json(entry)
+	result['key'] = key.decode()
+	result['is_valid'] = entry.is_valid
+	return result
+
+def device_list(session, args):
+	for key in session.device_keys():
+		if args.type != None and key.decode().split(":")[0] != args.type:
+			continue
+		session.print(device_entry_to_dict(key, session.get_device_entry(key.decode())))
+
+def device_get(session, args):
+	check_device_key(args.key)
+	value = session.get_device_entry(args.key)
+	if value == None:
+		raise KeyError("no device entry "+args.key)
+	session.print(device_entry_to_dict(args.key.encode(), value))
+
+def device_set(session, args):
+	check_device_key(args.key)
+	entry = per_port_entry(args.key, session.get_device_entry(args.key))
+	is_default_entry = len(args.key.split(":")) == 2
+	if is_default_entry:
+		if args.port == None:
+			raise ValueError("--port is needed to set the default port of "+args.key)
+		if args.volume != None or args.mute != None or args.channels != None:
+			raise ValueError("--volume, --mute and --channels only apply to sink|source:<device>:<port> keys")
+		entry.is_port_format = True
+		entry.port = None if args.port == 'null' else args.port
+		entry.port_valid = entry.port != None
+	else:
+		if args.port != None:
+			raise ValueError("--port only applies to sink|source:<device> keys")
+		if args.channels != None:
+			entry.channel_map = {'channels': len(args.channels), 'map': args.channels}
+		elif entry.channel_map['channels'] == 0 and args.volume != None:
+			entry.channel_map = {'channels': len(DEFAULT_CHANNEL_MAP), 'map': list(DEFAULT_CHANNEL_MAP)}
+		if args.volume != None:
+			volume = args.volume/100.0
+			entry.volume_valid = True
+		elif len(entry.volume['values']) > 0:
+			volume = sum(entry.volume['values'])/len(entry.volume['values'])
+		else:
+			volume = 0.0
+		channels = entry.channel_map['channels']
+		if args.volume != None or len(entry.volume['values']) != channels:
+			entry.volume = {'channels': channels, 'values': [volume for i in range(channels)]}
+		if args.mute != None:
+			entry.muted_valid = True
+			entry.muted = args.mute
+	session.device_changes.store(args.key, entry.encode())
+
+def device_delete(session, args):
+	check_device_key(args.key)
+	if len(args.key.split(":")) == 2:
+		# the whole device, its default port entry and every port
+		prefix = (args.key+":").encode()
+		keys = [key for key in session.device_keys() if key.startswith(prefix) or key == args.key.encode()]
+	else:
+		keys = [args.key.encode()] if session.get_device_entry(args.key) != None else []
+	if len(keys) == 0:
+		raise KeyError("no device entry "+args.key)
+	for key in keys:
+		session.device_changes.delete(key)
+
+def card_entry_to_dict(key, value):
+	entry = card_restore_entry(key.decode(), value)
+	result = entry.to_dict()
+	result['is_valid'] = entry.is_valid
+	return result
+
+def card_list(session, args):
+	for key in session.card_keys():
+		session.print(card_entry_to_dict(key, session.get_card_entry(key.decode())))
+
+def card_get(session, args):
+	value = session.get_card_entry(args.name)
+	if value == None:
+		raise KeyError("no card entry "+args.name)
+	session.print(card_entry_to_dict(args.name.encode(), value))
+
+def card_set(session, args):
+	entry = card_restore_entry(args.name, session.get_card_entry(args.name))
+	if args.profile != None:
+		entry.profile = None if args.profile == 'null' else args.profile
+	if args.sticky != None:
+		entry.profile_is_sticky = args.sticky
+	if args.input_port != None:
+		entry.preferred_input_port = None if args.input_port == 'null' else args.input_port
+	if args.output_port != None:
+		entry.preferred_output_port = None if args.output_port == 'null' else args.output_port
+	for (port, offset) in args.port_offset or []:
+		entry.ports.setdefault(port, {'offset': 0, 'profile': None})['offset'] = offset
+	session.card_changes.store(args.name, entry.encode())
+
+def card_delete(session, args):
+	if session.get_card_entry(args.name) == None:
+		raise KeyError("no card entry "+args.name)
+	session.card_changes.delete(args.name)
+
+def make_parser(batch_line=False):
+	parser = argparse.ArgumentParser(prog='python3 -m pa_resto',
+		description="Read and edit the PulseAudio restoration rules without the GUI")
+	if not batch_line:
+		parser.add_argument('--offline', action='store_true',
+			help="read and write the stream rules in the stream-restore DB, PulseAudio must not be running")
+		parser.add_argument('--config-dir', help="pulse config dir holding the DBs, $HOME/.config/pulse by default")
+		parser.add_argument('--machine-id', help="machine-id prefixing the DB names, the one of /etc/machine-id by default")
+		parser.add_argument('--timings', action='store_true',
+			help="write the time taken by the DB and pulse calls to stderr on exit, PA_RESTO_CPROFILE=<file> also dumps cProfile stats")
+	commands = parser.add_subparsers(dest='command', required=True)
+
+	stream = commands.add_parser('stream', help="module-stream-restore rules, through pulse")
+	stream_commands = stream.add_subparsers(dest='action', required=True)
+	sub = stream_commands.add_parser('list')
+	sub.add_argument('map', nargs='?', choices=list(restore_map_empty.keys()))
+	sub.set_defaults(run=stream_list)
+	sub = stream_commands.add_parser('get')
+	sub.add_argument('name', help="<map>:<name>")
+	sub.set_defaults(run=stream_get)
+	sub = stream_commands.add_parser('set')
+	sub.add_argument('name', help="<map>:<name>")
+	sub.add_argument('--volume', type=float, help="flat volume in percent")
+	sub.add_argument('--mute', type=parse_switch, help="on or off")
+	sub.add_argument('--device', help="device to route to, None to unset")
+	sub.set_defaults(run=stream_set)
+	sub = stream_commands.add_parser('delete')
+	sub.add_argument('name', help="<map>:<name>")
+	sub.set_defaults(run=stream_delete)
+
+	device = commands.add_parser('device', help="module-device-restore entries, through the TDB")
+	device_commands = device.add_subparsers(dest='action', required=True)
+	sub = device_commands.add_parser('list')
+	sub.add_argument('type', nargs='?', choices=['sink', 'source'])
+	sub.set_defaults(run=device_list)
+	sub = device_commands.add_parser('get')
+	sub.add_argument('key', help="sink|source:<device>[:<port>]")
+	sub.set_defaults(run=device_get)
+	sub = device_commands.add_parser('set')
+	sub.add_argument('key', help="sink|source:<device>[:<port>]")
+	sub.add_argument('--volume', type=float, help="flat volume in percent")
+	sub.add_argument('--mute', type=parse_switch, help="on or off")
+	sub.add_argument('--channels', type=parse_channel_map, help="comma separated channel map")
+	sub.add_argument('--port', help="default port of a sink|source:<device> key, null to unset")
+	sub.set_defaults(run=device_set)
+	sub = device_commands.add_parser('delete')
+	sub.add_argument('key', help="sink|source:<device>[:<port>], a device key deletes all its ports")
+	sub.set_defaults(run=device_delete)
+
+	card = commands.add_parser('card', help="module-card-restore entries, through the TDB")
+	card_commands = card.add_subparsers(dest='action', required=True)
+	sub = card_commands.add_parser('list')
+	sub.set_defaults(run=card_list)
+	sub = card_commands.add_parser('get')
+	sub.add_argument('name', help="card name")
+	sub.set_defaults(run=card_get)
+	sub = card_commands.add_parser('set')
+	sub.add_argument('name', help="card name")
+	sub.add_argument('--profile', help="profile to restore, null to unset")
+	sub.add_argument('--sticky', type=parse_switch, help="on or off, keep the profile even when it becomes unavailable")
+	sub.add_argument('--input-port', help="preferred input port, null to unset")
+	sub.add_argument('--output-port', help="preferred output port, null to unset")
+	sub.add_argument('--port-offset', type=parse_port_offset, action='append',
+		help="<port>=<latency offset in usec>, can be repeated")
+	sub.set_defaults(run=card_set)
+	sub = card_commands.add_parser('delete')
+	sub.add_argument('name', help="card name")
+	sub.set_defaults(run=card_delete)
+
+	if not batch_line:
+		sub = commands.add_parser('batch', help="read operations from stdin, one per line")
+		sub = commands.add_parser('export', help="write every stream and device rule to stdout as NDJSON")
+		sub.add_argument('--streams-only', action='store_true')
+		sub.add_argument('--devices-only', action='store_true')
+		sub = commands.add_parser('import', help="apply the NDJSON records read from stdin")
+		sub.add_argument('--batch-size', type=int, default=ndjson.DEFAULT_BATCH_SIZE,
+			help="records written per stream write and per TDB transaction")
+		sub = commands.add_parser('audit', help="decode the device DBs of many homes in parallel and print a report as NDJSON")
+		sub.add_argument('paths', nargs='*', help="homes, pulse config dirs or device-volumes DBs, read from stdin when none")
+		sub.add_argument('--jobs', type=int, help="worker processes, one per CPU by default")
+		sub.add_argument('--summary-only', action='store_true', help="only print the merged summary")
+		sub = commands.add_parser('policy', help="apply the rules of a JSON policy file and print what changed")
+		sub.add_argument('file', help="the policy, a JSON list of rules")
+		sub.add_argument('paths', nargs='*', help="homes, pulse config dirs or device-volumes DBs to apply it to instead of this seat")
+		sub.add_argument('--dry-run', action='store_true', help="only print what would change")
+		sub.add_argument('--jobs', type=int, help="worker processes with paths, one per CPU by default")
+		snapshots = commands.add_parser('snapshot', help="snapshots of the device entries and the stream rules")
+		snapshots.add_argument('--directory', help="where the snapshots are kept, <config dir>/pa-resto-snapshots by default")
+		snapshot_commands = snapshots.add_subparsers(dest='action', required=True)
+		sub = snapshot_commands.add_parser('take')
+		sub.add_argument('--label', help="what the snapshot is for")
+		sub = snapshot_commands.add_parser('list')
+		sub = snapshot_commands.add_parser('restore')
+		sub.add_argument('id', type=int)
+		sub.add_argument('--dry-run', action='store_true', help="only print the keys that would be rewritten")
+		sub = commands.add_parser('gc', help="purge the devices that aren't live from the device DB and repack it")
+		sub.add_argument('--dry-run', action='store_true', help="only list the stale devices")
+		sub.add_argument('--max-age', type=float, help="days a device has to be gone for before it is purged")
+		sub.add_argument('--no-history', action='store_true', help="don't read or update the last-seen times")
+		sub = commands.add_parser('sync', help="make the stream rules match the NDJSON stream records read from stdin")
+		sub.add_argument('--dry-run', action='store_true', help="only print what would change")
+		sub.add_argument('--map', action='append', choices=list(restore_map_empty.keys()),
+			help="only sync this map, can be repeated, all maps by default")
+	return parser
+
+def read_batch(lines):
+	parser = make_parser(batch_line=True)
+	operations = []
+	for number, line in enumerate(lines, 1):
+		line = line.strip()
+		if line == '' or line.startswith('#'):
+			continue
+		try:
+			operations.append(parser.parse_args(shlex.split(line)))
+		except SystemExit:
+			raise ValueError("invalid operation on line "+str(number)+": "+line)
+	return operations
+
+def main(argv=None, stdin=None, stdout=None):
+	stdin = stdin or sys.stdin
+	args = make_parser().parse_args(argv)
+	if args.timings:
+		instrument.enable(os.environ.get('PA_RESTO_CPROFILE'))
+	if args.config_dir:
+		restore_db.config_dir = args.config_dir
+	if args.machine_id:
+		restore_db.machine_id = args.machine_id
+	session = batch_session(stdout or sys.stdout, args.offline)
+	try:
+		if args.command == 'export':
+			ndjson.write_ndjson(session.out, ndjson.export_records(
+				streams=not args.devices_only, devices=not args.streams_only, offline=args.offline))
+			return 0
+		if args.command == 'import':
+			if args.batch_size < 1:
+				raise ValueError("--batch-size must be at least 1")
+			(streams, devices) = ndjson.import_records(ndjson.read_ndjson(stdin), args.batch_size, args.offline)
+			sys.stderr.write("imported "+str(streams)+" stream rules and "+str(devices)+" device entries\n")
+			return 0
+		if args.command == 'audit':
+			paths = args.paths or [line.strip() for line in stdin if line.strip() != '']
+			if args.jobs is not None and args.jobs < 1:
+				raise ValueError("--jobs must be at least 1")
+			(seats, summary) = fleet.audit(paths, args.jobs)
+			if not args.summary_only:
+				ndjson.write_ndjson(session.out, seats)
+			session.print(summary)
+			return 0
+		if args.command == 'policy':
+			if args.jobs is not None and args.jobs < 1:
+				raise ValueError("--jobs must be at least 1")
+			if args.paths:
+				with open(args.file) as f:
+					rules = json.load(f)
+				(seats, summary) = policy.apply_policy_fleet(rules, args.paths, args.dry_run, args.jobs)
+				ndjson.write_ndjson(session.out, seats)
+				session.print(summary)
+				return 0
+			if args.offline:
+				refresh_restore_map(offline=True)
+			diff = policy.apply_policy(policy.read_policy(args.file), args.dry_run, args.offline)
+			for line in diff.lines():
+				session.out.write(line+"\n")
+			return 0
+		if args.command == 'snapshot':
+			store = snapshot.snapshot_store(args.directory)
+			if args.action == 'take':
+				session.print({'id': store.take(args.label, args.offline)})
+			elif args.action == 'list':
+				for entry in store.list():
+					session.print(entry)
+			else:
+				for line in store.restore(args.id, args.dry_run, args.offline):
+					session.out.write(line+"\n")
+			return 0
+		if args.command == 'gc':
+			if args.max_age is not None and args.no_history:
+				raise ValueError("--max-age needs the last-seen history, drop --no-history")
+			max_age = args.max_age * 86400 if args.max_age is not None else None
+			report = device_gc.collect_garbage(args.dry_run, max_age, history=not args.no_history)
+			counts = {}
+			for key in report['keys']:
+				parts = key.split(":")
+				counts[parts[0]+":"+parts[1]] = counts.get(parts[0]+":"+parts[1], 0) + 1
+			for full_name in report['stale']:
+				session.out.write("- "+full_name+" ("+str(counts.get(full_name, 0))+" keys)\n")
+			if not args.dry_run:
+				sys.stderr.write("purged "+str(len(report['stale']))+" devices, "+str(len(report['keys']))+" keys, "
+					+str(report['size_before'])+" -> "+str(report['size_after'])+" bytes\n")
+			return 0
+		if args.command == 'sync':
+			if args.offline:
+				refresh_restore_map(offline=True)
+			desired = [ndjson.stream_rule_from_record(record, args.offline)
+				for record in ndjson.read_ndjson(stdin) if record['kind'] == 'stream']
+			diff = sync_stream_rules(desired, args.map, dry_run=args.dry_run, offline=args.offline)
+			for line in diff.lines():
+				session.out.write(line+"\n")
+			return 0
+		if args.command == 'batch':
+			operations = read_batch(stdin)
+		else:
+			operations = [args]
+		for operation in operations:
+			operation.run(session, operation)
+		session.commit()
+	except (ValueError, KeyError) as e:
+		sys.stderr.write("error: "+(e.args[0] if e.args else str(e))+"\n")
+		return 1
+	except OSError as e:
+		# a DB that is missing or can't be opened
+		sys.stderr.write("error: "+str(e)+"\n")
+		return 1
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,69 @@
+import collections
+import hashlib
+import threading
+
+# Bounded LRU cache of decoded DB entries, so that a refresh only decodes the
+# entries whose raw value changed since the last one, the rest are handed
+# back as they were decoded. An entry is looked up by its key and a digest
+# of its raw value, one digest is kept per key, a new value replaces the
+# previous one.
+#
+# The entries are shared with whatever holds them, device_map for example,
+# and edited in place before being stored. The writers forget() the keys
+# they store so that an edited entry isn't handed back for the old bytes,
+# after a discard for example. The GUI looks entries up on its I/O thread
+# while the writers forget() keys on the main one, a lock guards the LRU.
+
+# digest of a raw value, the one the cache is keyed on, the map refreshes
+# keep it too to find the keys that changed
+def value_digest(value):
+	return hashlib.blake2b(value, digest_size=16).digest()
+
+class decode_cache:
+	def __init__(self, decode, size=65536):
+		# called as decode(key, raw value) on a miss
+		self.decode = decode
+		self.size = size
+		# key -> (digest, entry), least recently used first
+		self.entries = collections.OrderedDict()
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def __len__(self):
+		return len(self.entries)
+
+	# digest is value_digest(value), computed here when not given
+	def get(self, key, value, digest=None):
+		if digest is None:
+			digest = value_digest(value)
+		with self.lock:
+			cached = self.entries.get(key)
+			if cached is not None and cached[0] == digest:
+				self.hits += 1
+				self.entries.move_to_end(key)
+				return cached[1]
+			self.misses += 1
+		# decoded outside of the lock, a key forgotten meanwhile is stored
+		# again with the digest of what was read, which is what the DB holds
+		entry = self.decode(key, value)
+		with self.lock:
+			self.entries[key] = (digest, entry)
+			self.entries.move_to_end(key)
+			if len(self.entries) > self.size:
+				self.entries.popitem(last=False)
+				self.evictions += 1
+		return entry
+
+	def forget(self, key):
+		with self.lock:
+			self.entries.pop(key, None)
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+
+	def stats(self):
+		return {'entries': len(self.entries), 'size': self.size, 'hits': self.hits,
+			'misses': self.misses, 'evictions': self.evictions}
@@ -0,0 +1,118 @@
+# Garbage collection of the device-volumes DB: module-device-restore keeps
+# the entries of every device ever plugged in, USB dongles and HDMI monitors
+# included, and never drops them. A device that isn't a live sink or source,
+# and isn't the default one, is stale, its type:device key and all its
+# type:device:port keys are deleted in one transaction and the TDB is
+# repacked so that the file and its traversal shrink.
+#
+#   report = collect_garbage(dry_run=True)
+#   report['stale']   # type:device of the devices that would be purged
+#
+# With max_age, in seconds, a device is only stale once it hasn't been live
+# for that long. The last time every device was seen live is kept in
+# <config dir>/<machine-id>-pa-resto-last-seen.json, updated on every run
+# that isn't a dry run. A device that isn't in there yet is given the time
+# of the run, it is kept for max_age from then.
+import json
+import os
+import time
+
+from . import restore_db
+from .restore_db import (
+	get_pulse,
+	get_db,
+	get_config_dir,
+	get_machine_id,
+	device_volumes_db,
+	device_db_changes,
+)
+
+def last_seen_file():
+	return get_config_dir()+'/'+get_machine_id()+'-pa-resto-last-seen.json'
+
+# {type:device: time it was last seen live}
+def read_last_seen(path=None):
+	try:
+		with open(path or last_seen_file()) as f:
+			return json.load(f)
+	except FileNotFoundError:
+		return {}
+
+def write_last_seen(last_seen, path=None):
+	path = path or last_seen_file()
+	with open(path+'.tmp', 'w') as f:
+		json.dump(last_seen, f)
+	os.replace(path+'.tmp', path)
+
+# type:device of the sinks and sources pulse has right now
+def live_devices():
+	pulse = get_pulse()
+	live = set('sink:'+sink.name for sink in pulse.sink_list())
+	live.update('source:'+source.name for source in pulse.source_list())
+	return live
+
+# The devices, as type:device, that are stale, see above. last_seen is
+# updated with the live devices and the new ones.
+def find_stale(devices, live, last_seen=None, max_age=None, now=None):
+	if now is None:
+		now = time.time()
+	restore_db.refresh_default_devices()
+	defaults = ('sink:'+restore_db.default_sink, 'source:'+restore_db.default_source)
+	stale = []
+	for full_name in sorted(devices):
+		if full_name in live:
+			if last_seen is not None:
+				last_seen[full_name] = now
+			continue
+		if full_name in defaults:
+			continue
+		if max_age is not None and last_seen is not None:
+			seen = last_seen.setdefault(full_name, now)
+			if now - seen < max_age:
+				continue
+		stale.append(full_name)
+	return stale
+
+# type:device -> its keys, from the DB rather than device_map so that a
+# device whose entries can't be decoded is there too
+def device_keys(db):
+	devices = {}
+	for key in db.keys():
+		parts = key.split(b":")
+		if len(parts) >= 2:
+			devices.setdefault((parts[0]+b":"+parts[1]).decode('utf-8', 'replace'), []).append(key)
+	return devices
+
+# Purge the stale devices and repack the DB, or with dry_run only list
+# them. live is taken from pulse unless given. Returns
+# {'stale': [type:device], 'keys': [keys deleted], 'size_before', 'size_after'}
+def collect_garbage(dry_run=False, max_age=None, live=None, history=True):
+	if max_age is not None and not history:
+		# the age is taken from the history, without it every device that is
+		# gone would be purged
+		raise ValueError("max_age needs the last-seen history")
+	if live is None:
+		live = live_devices()
+	last_seen = read_last_seen() if history else None
+	db = get_db()
+	devices = device_keys(db)
+	stale = find_stale(devices.keys(), live, last_seen, max_age)
+	keys = sorted(key for full_name in stale for key in devices[full_name])
+	size = os.path.getsize(device_volumes_db())
+	report = {'stale': stale, 'keys': [key.decode('utf-8', 'replace') for key in keys],
+		'size_before': size, 'size_after': size}
+	if dry_run:
+		return report
+	if len(keys) > 0:
+		# one transaction, device_map is patched if it was loaded
+		changes = device_db_changes()
+		for key in keys:
+			changes.delete(key)
+		changes.apply()
+		db.repack()
+		report['size_after'] = os.path.getsize(device_volumes_db())
+	if last_seen is not None:
+		for full_name in stale:
+			last_seen.pop(full_name, None)
+		write_last_seen(last_seen)
+	return report
@@ -0,0 +1,151 @@
+import re
+import struct
+import sys
+
+from . import tagstruct
+
+# This covers the stream maps, not the devices volume restoration information.
+# It would be good to add these too
+# However, currently it is not possible to check these values or update it
+# There is nothing in the native protocol extension that allows this similar to;
+# inspire by: https://gitlab.freedesktop.org/pulseaudio/pulseaudio/-/blob/master/src/pulse/ext-stream-restore.c#L156
+# Here it only allows editing the device formats
+# https://gitlab.freedesktop.org/pulseaudio/pulseaudio/-/blob/master/src/pulse/ext-device-restore.c#L233
+# What can be done instead is manipulate the TDB directly
+# interpreting the format manually
+# Structure: https://gitlab.freedesktop.org/pulseaudio/pulseaudio/-/blob/master/src/modules/module-device-restore.c#L363
+# The list of tags is found here:
+# https://gitlab.freedesktop.org/pulseaudio/pulseaudio/-/blob/master/src/pulsecore/tagstruct.h
+# Helper methods:
+# https://gitlab.freedesktop.org/pulseaudio/pulseaudio/-/blob/master/src/pulsecore/tagstruct.c
+
+# Examples:
+# version 1 - volume not valid (skip rest)
+# 42 01 30 4e
+#  x = db.get(b'sink:alsa_output.usb-C-Media_Electronics_Inc._Microsoft_LifeChat_LX-3000-00.iec958-stereo:iec958-stereo-output')
+# bytes(x).hex()
+# version 1 - volume valid yes - channel map 'm' - volume 'v' - muted valid yes - muted no - number of format 1
+# format: tag format 'f' - encoding 01 - proplist 'P' - value
+# '4201 31 6d020102 760200004a3d00004a3d 31 30 4201
+# 66 4201 504e'
+# mapping of device with port
+# '4201 31 746d756c74696368616e6e656c2d696e70757400')
+
+class per_port_entry:
+	PA_VOLUME_NORM = 0x10000
+	# fields exposed through the dict view, this is what gets exported
+	FIELDS = ('type', 'port', 'version', 'volume_valid', 'channel_map',
+		'volume', 'muted_valid', 'muted', 'number_of_formats', 'formats',
+		'port_valid')
+	# tags of the two kinds of entries, as tagstruct.read() returns them
+	PORT_ENTRY = re.compile(rb'B[01][tN]')
+	VOLUME_ENTRY = re.compile(rb'B[01]mv[01][01]Bf*')
+	# one of these is kept for every key of the DB, no per instance __dict__
+	# and no copy of the raw binary, the dict view and hex dump are computed
+	# when asked for
+	__slots__ = ('type', 'name', 'port', 'version', 'is_valid',
+		'is_port_format', 'volume_valid', 'channel_map', 'volume',
+		'muted_valid', 'muted', 'number_of_formats', 'formats', 'port_valid')
+
+	def __init__(self, name, binary):
+		parts = name.split(":")
+		self.type = sys.intern(parts[0])
+		self.name = parts[1]
+		self.port = parts[2] if len(parts) >= 3 else None
+		self.version = 1
+		self.is_valid = False
+		self.is_port_format = False
+		self.volume_valid = None
+		self.channel_map = {'channels':0, 'map':[]}
+		self.volume = {'channels':0, 'values':[]}
+		self.muted_valid = None
+		self.muted = None
+		self.number_of_formats = 1
+		self.formats = [{'encoding': 1 }]
+		self.port_valid = None
+		self.decode(binary)
+
+	# compatibility with the time this was a dict subclass
+	def __getitem__(self, key):
+		if key not in self.FIELDS:
+			raise KeyError(key)
+		return getattr(self, key)
+
+	def __contains__(self, key):
+		return key in self.FIELDS
+
+	def keys(self):
+		return self.FIELDS
+
+	def get(self, key, default=None):
+		return getattr(self, key) if key in self.FIELDS else default
+
+	def to_dict(self):
+		return {key: getattr(self, key) for key in self.FIELDS}
+
+	# the reverse of to_dict(), type:device keys hold the default port and
+	# type:device:port keys the port volumes
+	@classmethod
+	def from_dict(cls, key, fields):
+		entry = cls(key, None)
+		for field in cls.FIELDS:
+			if field != 'type' and field in fields:
+				setattr(entry, field, fields[field])
+		entry.is_port_format = len(key.split(":")) == 2
+		entry.is_valid = True
+		return entry
+
+	@property
+	def full_name(self):
+		if self.port is None or self.is_port_format:
+			return self.name
+		return self.name+":"+self.port
+
+	@property
+	def hex(self):
+		return bytes(self.encode()).hex() if self.is_valid else ''
+
+	def decode(self, binary):
+		if not binary:
+			return
+		try:
+			(tags, values) = tagstruct.read(binary)
+		except (IndexError, ValueError, struct.error):
+			# truncated or garbled entry
+			return
+		if self.PORT_ENTRY.fullmatch(tags):
+			self.is_port_format = True
+			(self.version, self.port_valid, self.port) = values
+		elif self.VOLUME_ENTRY.fullmatch(tags) and values[6] == len(values) - 7:
+			(self.version, self.volume_valid, channel_map, volume,
+				self.muted_valid, self.muted, self.number_of_formats) = values[:7]
+			self.channel_map = {'channels': len(channel_map), 'map': channel_map}
+			norm = float(self.PA_VOLUME_NORM)
+			self.volume = {'channels': len(volume), 'values': [val/norm for val in volume]}
+			self.formats = [{'encoding': encoding, 'plist': plist} for (encoding, plist) in values[7:]]
+		else:
+			return
+		self.is_valid = True
+
+	@property
+	def key(self):
+		if self.is_port_format or self.port is None:
+			return self.type+":"+self.name
+		return self.type+":"+self.name+":"+self.port
+
+	def encode(self):
+		if self.is_port_format:
+			return tagstruct.write(b'B1t', (self.version, self.port_valid,
+				self.port if self.port_valid else None))
+		norm = self.PA_VOLUME_NORM
+		values = [self.version, self.volume_valid, self.channel_map['map'],
+			[int(i * norm) for i in self.volume['values']],
+			self.muted_valid, self.muted, len(self.formats)]
+		values += [(i['encoding'], i.get('plist')) for i in self.formats]
+		return tagstruct.write(b'B1mv11B' + b'f'*len(self.formats), values)
+
+	def set_bool(self, val):
+		if val:
+			return 0x31
+		else:
+			return 0x30
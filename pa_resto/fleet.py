@@ -0,0 +1,186 @@
+# Audit of the device restore DBs of many seats at once, for shops where
+# every home directory, local or shared, has its own DBs.
+#
+#   report = audit(['/home/alice', '/srv/homes/bob/.config/pulse/<id>-device-volumes.tdb'])
+#
+# Every path is either a device-volumes TDB or a directory, a home or a
+# pulse config dir, holding one or more of them, one per machine-id. The DBs
+# are decoded in parallel in a pool of processes, each one is opened read
+# only along with the default-sink and default-source files next to it, the
+# globals of restore_db are left alone. The result is one seat record per DB,
+# in the order of the paths, and a summary merged from all of them.
+import collections
+import concurrent.futures
+import glob
+import os
+
+from .device_restore import per_port_entry
+from .restore_db import read_default_file, db_items, add_device_entry
+
+DB_SUFFIX = '-device-volumes.tdb'
+
+# the device-volumes DBs at path, or an error message
+def find_dbs(path):
+	if os.path.isfile(path):
+		return [path]
+	if not os.path.isdir(path):
+		return "no such file or directory"
+	found = []
+	for directory in (os.path.join(path, '.config', 'pulse'), path):
+		found += sorted(glob.glob(os.path.join(glob.escape(directory), '*'+DB_SUFFIX)))
+	if len(found) == 0:
+		return "no device-volumes DB found"
+	return found
+
+def new_seat(path, db_path):
+	return {
+		'kind': 'seat',
+		'path': path,
+		'db': db_path,
+		'machine_id': None,
+		'default_sink': None,
+		'default_source': None,
+		# type:device -> {'default_port', 'is_default_device', 'ports'}
+		'devices': {},
+		'corrupted': [],
+		'error': None,
+	}
+
+# Decode one DB, runs in the worker processes
+def audit_db(path, db_path):
+	import tdb
+	seat = new_seat(path, db_path)
+	config_dir = os.path.dirname(db_path)
+	name = os.path.basename(db_path)
+	if name.endswith(DB_SUFFIX):
+		seat['machine_id'] = name[:-len(DB_SUFFIX)]
+		prefix = os.path.join(config_dir, seat['machine_id'])
+		try:
+			seat['default_sink'] = read_default_file(prefix+'-default-sink')
+			seat['default_source'] = read_default_file(prefix+'-default-source')
+		except OSError as e:
+			seat['error'] = "can't read the default devices of "+db_path+": "+str(e)
+			return seat
+	try:
+		db = tdb.open(db_path, 0, tdb.DEFAULT, os.O_RDONLY)
+	except (OSError, RuntimeError) as e:
+		seat['error'] = "can't open "+db_path+": "+str(e)
+		return seat
+	defaults = (seat['default_sink'], seat['default_source'])
+	device_map = {}
+	try:
+		for (key, value) in db_items(db):
+			key = key.decode('utf-8', 'replace')
+			if len(key.split(":")) < 2:
+				seat['corrupted'].append(key)
+				continue
+			entry = per_port_entry(key, value)
+			if not entry.is_valid:
+				seat['corrupted'].append(key)
+				continue
+			add_device_entry(device_map, entry, defaults)
+	except (OSError, RuntimeError) as e:
+		seat['error'] = "can't read "+db_path+": "+str(e)
+	finally:
+		db.close()
+	seat['devices'] = seat_devices(device_map)
+	return seat
+
+# The devices of a seat record out of a device_map shaped dict, by
+# type:device and with the fields of the entries rather than the entries
+def seat_devices(device_map):
+	devices = {}
+	for device_type, names in device_map.items():
+		for name, device in names.items():
+			default_port = device['default_port']
+			devices[device_type+":"+name] = {
+				'default_port': default_port.port if default_port is not None and default_port.port_valid else None,
+				'is_default_device': device['is_default_device'],
+				'ports': {port: {
+					'volume': entry.volume['values'] if entry.volume_valid else None,
+					'muted': entry.muted if entry.muted_valid else None,
+					'channel_map': entry.channel_map['map'],
+				} for port, entry in device['ports'].items()},
+			}
+	return devices
+
+def audit_task(task):
+	return audit_db(*task)
+
+# Merge the seat records into fleet wide counts
+def summarize(seats):
+	summary = {
+		'kind': 'summary',
+		'seats': len(seats),
+		'errors': 0,
+		'corrupted': 0,
+		'devices': 0,
+		'ports': 0,
+		'muted_ports': 0,
+		# how many seats have them
+		'default_sinks': collections.Counter(),
+		'default_sources': collections.Counter(),
+		'device_names': collections.Counter(),
+		'port_names': collections.Counter(),
+	}
+	for seat in seats:
+		if seat['error'] is not None:
+			summary['errors'] += 1
+		summary['corrupted'] += len(seat['corrupted'])
+		if seat['default_sink']:
+			summary['default_sinks'][seat['default_sink']] += 1
+		if seat['default_source']:
+			summary['default_sources'][seat['default_source']] += 1
+		summary['devices'] += len(seat['devices'])
+		for full_name, device in seat['devices'].items():
+			summary['device_names'][full_name] += 1
+			summary['ports'] += len(device['ports'])
+			for port, info in device['ports'].items():
+				summary['port_names'][port] += 1
+				if info['muted']:
+					summary['muted_ports'] += 1
+	for key in ('default_sinks', 'default_sources', 'device_names', 'port_names'):
+		summary[key] = dict(summary[key].most_common())
+	return summary
+
+# (path, DB path, None) for every DB found at paths and (path, None, error
+# message) for the paths without any, in the order of the paths
+def find_all_dbs(paths):
+	found = []
+	for path in paths:
+		dbs = find_dbs(path)
+		if isinstance(dbs, str):
+			found.append((path, None, path+": "+dbs))
+			continue
+		for db_path in dbs:
+			found.append((path, db_path, None))
+	return found
+
+# [func(task) for task in tasks] with jobs processes, as many as there are
+# CPUs by default, 1 does it all in this process. func has to be a module
+# level function for the workers to find it.
+def map_tasks(func, tasks, jobs=None):
+	if jobs is None:
+		jobs = os.cpu_count() or 1
+	if jobs <= 1 or len(tasks) <= 1:
+		return [func(task) for task in tasks]
+	# a few chunks per process, the DBs are small so one task each would be
+	# mostly pickling
+	chunksize = max(1, len(tasks) // (jobs * 4))
+	with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+		return list(pool.map(func, tasks, chunksize=chunksize))
+
+# Audit every DB found at paths with jobs processes, see map_tasks().
+# Returns the seat records and the summary.
+def audit(paths, jobs=None):
+	found = find_all_dbs(paths)
+	results = iter(map_tasks(audit_task, [(path, db_path) for (path, db_path, error) in found if error is None], jobs))
+	seats = []
+	for (path, db_path, error) in found:
+		if error is None:
+			seats.append(next(results))
+		else:
+			seat = new_seat(path, None)
+			seat['error'] = error
+			seats.append(seat)
+	return (seats, summarize(seats))
@@ -0,0 +1,143 @@
+# Opt-in timings of what makes the editor slow or fast: the map refreshes,
+# every call on the TDBs and on the pulse connection, and the GUI rebuilds.
+#
+# Turned on with PA_RESTO_TIMINGS=1 in the environment, or with --timings on
+# the command line of the GUI and of python3 -m pa_resto. A summary of the
+# calls, their count, total, mean and max time, is written to stderr on exit
+# and on SIGUSR1. With PA_RESTO_CPROFILE=<file> cProfile runs as well and
+# its stats are dumped to <file> at the same times, to be read with
+# python3 -m pstats <file>.
+#
+# Turned off, a timed function costs one check of a global per call and the
+# DBs and the pulse connection are used as they are.
+import atexit
+import functools
+import os
+import signal
+import sys
+import threading
+import time
+
+enabled = False
+profiler = None
+profile_file = None
+# name -> [calls, total seconds, max seconds]
+stats = {}
+# the io_worker thread records too
+lock = threading.Lock()
+
+def enable(profile=None):
+	global enabled
+	global profiler
+	global profile_file
+	if enabled:
+		return
+	enabled = True
+	if profile:
+		import cProfile
+		profile_file = profile
+		profiler = cProfile.Profile()
+		profiler.enable()
+	atexit.register(dump)
+	if hasattr(signal, 'SIGUSR1') and threading.current_thread() is threading.main_thread():
+		signal.signal(signal.SIGUSR1, lambda signum, frame: dump())
+
+def record(name, elapsed, calls=1):
+	with lock:
+		stat = stats.get(name)
+		if stat is None:
+			stats[name] = [calls, elapsed, elapsed]
+			return
+		stat[0] += calls
+		stat[1] += elapsed
+		if calls and elapsed > stat[2]:
+			stat[2] = elapsed
+
+# decorator recording the calls of a function under name
+def timed(name):
+	def decorator(func):
+		@functools.wraps(func)
+		def wrapper(*args, **kwargs):
+			if not enabled:
+				return func(*args, **kwargs)
+			start = time.perf_counter()
+			try:
+				return func(*args, **kwargs)
+			finally:
+				record(name, time.perf_counter() - start)
+		return wrapper
+	return decorator
+
+class timed_iterator:
+	"""
+	The time spent walking an iterator returned by a traced call, such as
+	the keys of a TDB, is added to the total time of that call, not to its
+	max.
+	"""
+	__slots__ = ('name', 'iterator')
+
+	def __init__(self, name, iterator):
+		self.name = name
+		self.iterator = iterator
+
+	def __iter__(self):
+		return self
+
+	def __next__(self):
+		start = time.perf_counter()
+		try:
+			return next(self.iterator)
+		finally:
+			record(self.name, time.perf_counter() - start, 0)
+
+class traced:
+	"""
+	Stands in front of a TDB or a pulsectl.Pulse and records every method
+	call made on it as <name>.<method>.
+	"""
+	def __init__(self, target, name):
+		# not target and name, those could be attributes of the target
+		self.traced_target = target
+		self.traced_name = name
+
+	def __getattr__(self, attr):
+		value = getattr(self.traced_target, attr)
+		if not callable(value):
+			return value
+		name = self.traced_name+"."+attr
+		def call(*args, **kwargs):
+			start = time.perf_counter()
+			try:
+				result = value(*args, **kwargs)
+			finally:
+				record(name, time.perf_counter() - start)
+			if hasattr(result, '__next__'):
+				return timed_iterator(name, result)
+			return result
+		return call
+
+# target itself unless the timings are on
+def trace(target, name):
+	if not enabled:
+		return target
+	return traced(target, name)
+
+def summary():
+	with lock:
+		rows = sorted(stats.items(), key=lambda item: item[1][1], reverse=True)
+	lines = ["%-40s %8s %11s %10s %10s" % ("timings", "calls", "total ms", "mean ms", "max ms")]
+	for name, (calls, total, longest) in rows:
+		lines.append("%-40s %8d %11.2f %10.3f %10.3f" % (name, calls, total*1000,
+			total*1000/calls if calls else 0, longest*1000))
+	return "\n".join(lines)+"\n"
+
+def dump():
+	sys.stderr.write(summary())
+	if profiler is not None:
+		# dump_stats() stops the profiler, it goes on for the next dump
+		profiler.dump_stats(profile_file)
+		profiler.enable()
+		sys.stderr.write("cProfile stats written to "+profile_file+"\n")
+
+if os.environ.get('PA_RESTO_TIMINGS') or os.environ.get('PA_RESTO_CPROFILE'):
+	enable(os.environ.get('PA_RESTO_CPROFILE'))
@@ -0,0 +1,89 @@
+# Runs the pulse and TDB calls on a dedicated thread so that a busy
+# PulseAudio or a TDB locked by the daemon doesn't freeze whoever asked for
+# them, the GUI's main loop in particular.
+# There is a single thread and the jobs run one at a time in the order they
+# were submitted, writes can't overtake each other. Once it is started the
+# pulse connection and the TDB handles are only used by its jobs.
+# Nothing makes device_map, restore_map and the other maps safe to share
+# between threads: a job only reads and writes pulse and the DBs and hands
+# back what it decoded, the maps are patched from on_done, on the thread
+# that reads them.
+#
+#   worker = io_worker(dispatch=GLib.idle_add)
+#   worker.submit(pending_device_changes.commit,
+#       on_done=lambda result: refresh_panes(pending_device_changes.patch(result)))
+import queue
+import sys
+import threading
+import traceback
+
+class io_worker:
+	def __init__(self, dispatch=None, on_busy=None, on_error=None):
+		# dispatch(callback, *args) has to run callback on the caller's
+		# thread, GLib.idle_add for GTK, without it the callbacks run on the
+		# worker thread
+		self.dispatch = dispatch
+		# on_busy(True) when a job is submitted to an idle worker and
+		# on_busy(False) once the last one is done, through dispatch
+		self.on_busy = on_busy
+		# called with the exception of the jobs that have no on_error
+		self.on_error = on_error
+		self.jobs = queue.Queue()
+		self.lock = threading.Lock()
+		self.pending = 0
+		self.thread = threading.Thread(target=self.run, name='pa-resto-io', daemon=True)
+		self.thread.start()
+
+	@property
+	def busy(self):
+		return self.pending > 0
+
+	# run func(*args) on the worker, on_done gets its result and on_error
+	# the exception it raised, both on the caller's thread
+	def submit(self, func, *args, on_done=None, on_error=None):
+		with self.lock:
+			self.pending += 1
+			started = self.pending == 1
+		if started and self.on_busy:
+			self.on_busy(True)
+		self.jobs.put((func, args, on_done, on_error or self.on_error))
+
+	def run(self):
+		while True:
+			job = self.jobs.get()
+			if job is None:
+				return
+			(func, args, on_done, on_error) = job
+			try:
+				result = func(*args)
+			except Exception as e:
+				self.deliver(on_error or self.print_error, e)
+			else:
+				self.deliver(on_done, result)
+
+	def deliver(self, callback, value):
+		if self.dispatch:
+			self.dispatch(self.finish, callback, value)
+		else:
+			self.finish(callback, value)
+
+	def finish(self, callback, value):
+		with self.lock:
+			self.pending -= 1
+			stopped = self.pending == 0
+		try:
+			if callback:
+				callback(value)
+		finally:
+			if stopped and self.on_busy:
+				self.on_busy(False)
+		# not to be called again by GLib.idle_add
+		return False
+
+	def print_error(self, error):
+		traceback.print_exception(type(error), error, error.__traceback__, file=sys.stderr)
+
+	# let the queued jobs finish and stop the thread
+	def stop(self):
+		self.jobs.put(None)
+		self.thread.join()
@@ -0,0 +1,155 @@
+# Export and import of the whole restoration state as NDJSON, one record per
+# line:
+#
+#   {"kind": "stream", "name": "sink-input-by-media-role:music", "device": ...}
+#   {"kind": "device", "key": "sink:alsa_output.foo:analog-output", "entry": {...}}
+#   {"kind": "device", "key": "sink:alsa_output.bar", "hex": "4201..."}
+#
+# Everything is a generator, records are decoded, written, read and applied
+# one at a time so memory stays flat whatever the size of the DB. Device
+# entries that can't be decoded are carried over as their raw hex, and the
+# format proplist values that aren't strings as {"type": "bytes", "hex": ...}.
+# Note that the native protocol hands over all the stream rules in a single
+# reply, those are only as streamed as pulsectl allows. With offline the
+# stream rules are read from and written to the stream-restore DB instead,
+# while PulseAudio isn't running.
+import json
+
+from .device_restore import per_port_entry
+from .stream_restore import stream_restore_entry, stream_volume, read_stream_rules, write_stream_rules
+from .restore_db import (
+	get_pulse,
+	get_db,
+	get_stream_db,
+	db_items,
+	device_db_changes,
+	stream_rule_to_dict,
+)
+
+DEFAULT_BATCH_SIZE = 500
+
+def export_stream_records(offline=False):
+	if offline:
+		rules = (rule for rule in read_stream_rules(get_stream_db()) if rule.is_valid)
+	else:
+		rules = get_pulse().stream_restore_read()
+	for rule in rules:
+		record = stream_rule_to_dict(rule)
+		record['kind'] = 'stream'
+		yield record
+
+# the format proplists of the entry fields, with the bytes values tagged
+def device_entry_to_json(entry):
+	fields = entry.to_dict()
+	if fields.get('formats'):
+		fields['formats'] = [dict(i, plist=plist_to_json(i.get('plist'))) for i in fields['formats']]
+	return fields
+
+def device_entry_from_json(key, fields):
+	if fields.get('formats'):
+		fields = dict(fields, formats=[dict(i, plist=plist_from_json(i.get('plist'))) for i in fields['formats']])
+	return per_port_entry.from_dict(key, fields)
+
+def plist_to_json(plist):
+	if not plist:
+		return plist
+	return {key: {'type': 'bytes', 'hex': value.hex()} if isinstance(value, bytes) else value
+		for key, value in plist.items()}
+
+def plist_from_json(plist):
+	if not plist:
+		return plist
+	return {key: bytes.fromhex(value['hex']) if isinstance(value, dict) and value.get('type') == 'bytes' else value
+		for key, value in plist.items()}
+
+def export_device_records():
+	for (key, value) in db_items(get_db()):
+		entry = per_port_entry(key.decode(), value)
+		if entry.is_valid:
+			yield {'kind': 'device', 'key': key.decode(), 'entry': device_entry_to_json(entry)}
+		else:
+			yield {'kind': 'device', 'key': key.decode(), 'hex': bytes(value).hex()}
+
+def export_records(streams=True, devices=True, offline=False):
+	if streams:
+		yield from export_stream_records(offline)
+	if devices:
+		yield from export_device_records()
+
+def write_ndjson(out, records):
+	count = 0
+	for record in records:
+		out.write(json.dumps(record)+"\n")
+		count += 1
+	return count
+
+def read_ndjson(lines):
+	for number, line in enumerate(lines, 1):
+		line = line.strip()
+		if line == '':
+			continue
+		try:
+			record = json.loads(line)
+		except ValueError as e:
+			raise ValueError("invalid JSON on line "+str(number)+": "+str(e))
+		if record.get('kind') not in ('stream', 'device'):
+			raise ValueError("unknown record kind on line "+str(number))
+		yield record
+
+def stream_rule_from_record(record, offline=False):
+	if offline:
+		entry = stream_restore_entry(record['name'], None)
+		entry.channel_list = record['channel_list']
+		entry.volume = stream_volume(list(record['volume']))
+		entry.mute = record.get('mute', False)
+		entry.device = record.get('device')
+		entry.is_valid = True
+		return entry
+	import pulsectl
+	return pulsectl.PulseExtStreamRestoreInfo(
+		struct_or_name=record['name'],
+		device=record.get('device'),
+		volume=record['volume'],
+		mute=record.get('mute', False),
+		channel_list=record['channel_list']
+	)
+
+def device_value_from_record(record):
+	if 'hex' in record:
+		return bytes.fromhex(record['hex'])
+	return device_entry_from_json(record['key'], record['entry']).encode()
+
+# Apply the records, at most batch_size of them are held at once. Each full
+# batch of stream rules is sent in one stream_restore_write and each batch
+# of device entries is written in one TDB transaction.
+# Returns the number of stream and device records applied.
+def import_records(records, batch_size=DEFAULT_BATCH_SIZE, offline=False):
+	stream_rules = []
+	device_changes = device_db_changes()
+	counts = {'stream': 0, 'device': 0}
+
+	def flush_streams():
+		if len(stream_rules) > 0:
+			if offline:
+				write_stream_rules(get_stream_db(), stream_rules)
+			else:
+				get_pulse().stream_restore_write(stream_rules, mode='replace')
+			counts['stream'] += len(stream_rules)
+			del stream_rules[:]
+
+	def flush_devices():
+		counts['device'] += len(device_changes)
+		device_changes.apply()
+
+	for record in records:
+		if record['kind'] == 'stream':
+			stream_rules.append(stream_rule_from_record(record, offline))
+			if len(stream_rules) >= batch_size:
+				flush_streams()
+		else:
+			device_changes.store(record['key'], device_value_from_record(record))
+			if len(device_changes) >= batch_size:
+				flush_devices()
+	flush_streams()
+	flush_devices()
+	return (counts['stream'], counts['device'])
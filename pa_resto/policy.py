@@ -0,0 +1,372 @@
+# Declarative policies over the device entries and the stream rules, a list
+# of rules, usually read from a JSON file:
+#
+#   [
+#     {"match": {"type": "sink", "device": "alsa_output.usb-*", "port": "analog-output*"},
+#      "set": {"volume": 0.6, "muted": false}},
+#     {"match": {"type": "sink", "device": "alsa_output.usb-*"},
+#      "set": {"default_port": "analog-output-headphones"}},
+#     {"match": {"rule": "sink-input-by-media-role:*"},
+#      "set": {"volume": 0.8, "mute": false}}
+#   ]
+#
+# A rule matches with shell-style patterns, a match key that is left out
+# matches anything. Device rules match on type, device and port and set
+# volume, one value for every channel or a list with one per channel, muted
+# and default_port, the port being only set on the devices that have an
+# entry for it. Stream rules match on rule, the <map>:<name> of the rule,
+# and set volume, mute and device. Rules are applied in order, a later rule
+# wins over an earlier one for the same field.
+#
+# The changes are computed against device_map and restore_map, or the DBs of
+# another seat, and only the entries that would encode differently are
+# written, so applying a policy a second time writes nothing. The device
+# entries are written in one transaction, the stream rules in one
+# stream_restore_write or, offline, one transaction. On a seat of the fleet
+# the two DBs are only committed once both transactions are prepared, see
+# write_dbs(). On this seat the stream rules go to PulseAudio after the
+# device transaction is committed, when that fails the device entries stay
+# written.
+import copy
+import fnmatch
+import json
+import os
+import re
+
+from .device_restore import per_port_entry
+from .stream_restore import stream_restore_entry, read_stream_rules
+from .stream_sync import stream_rules_diff, apply_stream_rules_diff, current_stream_rules, stream_rule_state
+from .ndjson import stream_rule_from_record
+from . import fleet
+from .restore_db import (
+	device_map,
+	refresh_device_map,
+	device_db_changes,
+	stream_rule_to_dict,
+	db_items,
+	add_device_entry,
+)
+
+DEVICE_MATCH = ('type', 'device', 'port')
+DEVICE_SET = ('volume', 'muted', 'default_port')
+STREAM_MATCH = ('rule',)
+STREAM_SET = ('volume', 'mute', 'device')
+STREAM_DB_SUFFIX = '-stream-volumes.tdb'
+PA_VOLUME_NORM = 0x10000
+
+class policy_rule:
+	def __init__(self, rule):
+		if not isinstance(rule, dict) or not isinstance(rule.get('set'), dict):
+			raise ValueError("a policy rule needs a set object")
+		match = rule.get('match', {})
+		if not isinstance(match, dict):
+			raise ValueError("the match of a policy rule must be an object")
+		self.is_stream = 'rule' in match
+		(match_keys, set_keys) = (STREAM_MATCH, STREAM_SET) if self.is_stream else (DEVICE_MATCH, DEVICE_SET)
+		for key in match.keys():
+			if key not in match_keys:
+				raise ValueError("unknown match key "+key+", expected one of "+", ".join(match_keys))
+		for key in rule['set'].keys():
+			if key not in set_keys:
+				raise ValueError("unknown set key "+key+", expected one of "+", ".join(set_keys))
+		if 'default_port' in rule['set'] and 'port' in match:
+			raise ValueError("default_port is set on devices, it can't be matched by port")
+		volume = rule['set'].get('volume')
+		if volume is not None and not isinstance(volume, (int, float, list)):
+			raise ValueError("volume must be a number or a list of numbers")
+		# key -> compiled pattern
+		self.match = {key: re.compile(fnmatch.translate(pattern)) for key, pattern in match.items()}
+		self.set = rule['set']
+
+	def matches(self, key, value):
+		pattern = self.match.get(key)
+		return pattern is None or (value is not None and pattern.match(value) is not None)
+
+	def sets_ports(self):
+		return 'volume' in self.set or 'muted' in self.set
+
+# The rules of a policy, a list of dicts as in the example above
+def load_policy(rules):
+	if not isinstance(rules, list):
+		raise ValueError("a policy is a list of rules")
+	return [policy_rule(rule) for rule in rules]
+
+def read_policy(path):
+	with open(path) as f:
+		try:
+			return load_policy(json.load(f))
+		except ValueError as e:
+			raise ValueError(path+": "+str(e))
+
+# one value per channel out of a number or a list
+def volume_values(volume, channels, name):
+	if channels == 0:
+		# the volume isn't valid, there is nothing to set it on
+		return []
+	if isinstance(volume, list):
+		if len(volume) != channels:
+			raise ValueError("the volume of "+name+" has "+str(channels)+" channels, the policy gives "+str(len(volume)))
+		return [float(value) for value in volume]
+	return [float(volume)] * channels
+
+def format_value(value):
+	if isinstance(value, list):
+		return ",".join("%.2f" % v for v in value)
+	return str(value)
+
+# the pa_volume_t the volumes are written as, device entries truncate and
+# stream rules round, two volumes that are written the same are the same
+def device_volume_units(values):
+	return [int(v * PA_VOLUME_NORM) for v in values]
+
+def stream_volume_units(values):
+	return [int(round(v * PA_VOLUME_NORM)) for v in values]
+
+class policy_diff:
+	def __init__(self):
+		# (key, current entry or None, new entry)
+		self.devices = []
+		# (current rule, new rule)
+		self.streams = []
+
+	def __len__(self):
+		return len(self.devices) + len(self.streams)
+
+	# one line per entry, + created, ~ changed with its changed fields
+	def lines(self):
+		for (key, old, new) in self.devices:
+			if old is None:
+				yield "+ "+key+" port "+str(new.port)
+				continue
+			fields = []
+			for (name, before, after, same) in (
+					('volume', old.volume['values'], new.volume['values'],
+						device_volume_units(old.volume['values']) == device_volume_units(new.volume['values'])),
+					('muted', old.muted, new.muted, old.muted == new.muted),
+					('port', old.port, new.port, old.port == new.port)):
+				if not same:
+					fields.append(name+" "+format_value(before)+" -> "+format_value(after))
+			yield "~ "+key+" "+" ".join(fields)
+		for (old, new) in self.streams:
+			fields = []
+			for (name, before, after, same) in (
+					('volume', list(old.volume.values), list(new.volume.values),
+						stream_volume_units(old.volume.values) == stream_volume_units(new.volume.values)),
+					('mute', bool(old.mute), bool(new.mute), bool(old.mute) == bool(new.mute)),
+					('device', old.device or None, new.device or None, (old.device or None) == (new.device or None))):
+				if not same:
+					fields.append(name+" "+format_value(before)+" -> "+format_value(after))
+			yield "~ "+old.name+" "+" ".join(fields)
+
+def copy_entry(entry):
+	return per_port_entry.from_dict(entry.key, copy.deepcopy(entry.to_dict()))
+
+# Changes of the device entries of devices, shaped like device_map, added to
+# diff
+def device_policy_changes(rules, devices, diff):
+	rules = [rule for rule in rules if not rule.is_stream]
+	for device_type in sorted(devices.keys()):
+		type_rules = [rule for rule in rules if rule.matches('type', device_type)]
+		for name in sorted(devices[device_type].keys()):
+			device_rules = [rule for rule in type_rules if rule.matches('device', name)]
+			if len(device_rules) == 0:
+				continue
+			device = devices[device_type][name]
+			for port in sorted(device['ports'].keys()):
+				entry = device['ports'][port]
+				new = None
+				for rule in device_rules:
+					if not rule.sets_ports() or not rule.matches('port', port):
+						continue
+					if new is None:
+						new = copy_entry(entry)
+					if 'volume' in rule.set:
+						channels = len(new.channel_map['map'])
+						if channels > 0:
+							new.volume = {'channels': channels,
+								'values': volume_values(rule.set['volume'], channels, entry.key)}
+							new.volume_valid = True
+					if 'muted' in rule.set:
+						new.muted = bool(rule.set['muted'])
+						new.muted_valid = True
+				if new is not None and new.encode() != entry.encode():
+					diff.devices.append((entry.key, entry, new))
+			default_port = None
+			for rule in device_rules:
+				if rule.set.get('default_port') in device['ports']:
+					default_port = rule.set['default_port']
+			if default_port is None:
+				continue
+			entry = device['default_port']
+			if entry is None:
+				new = per_port_entry.from_dict(device_type+":"+name, {'port_valid': True, 'port': default_port})
+			else:
+				new = copy_entry(entry)
+				new.port_valid = True
+				new.port = default_port
+				if new.encode() == entry.encode():
+					continue
+			diff.devices.append((new.key, entry, new))
+
+# Changes of the stream rules, {<map>:<name>: rule}, added to diff
+def stream_policy_changes(rules, current, diff, offline=False):
+	rules = [rule for rule in rules if rule.is_stream]
+	if len(rules) == 0:
+		return
+	for name in sorted(current.keys()):
+		rule = current[name]
+		record = None
+		for policy in rules:
+			if not policy.matches('rule', name):
+				continue
+			if record is None:
+				record = stream_rule_to_dict(rule)
+			if 'volume' in policy.set:
+				record['volume'] = volume_values(policy.set['volume'], len(record['channel_list']), name)
+			if 'mute' in policy.set:
+				record['mute'] = bool(policy.set['mute'])
+			if 'device' in policy.set:
+				record['device'] = policy.set['device']
+		if record is None:
+			continue
+		new = stream_rule_from_record(record, offline)
+		if isinstance(rule, stream_restore_entry):
+			# not part of the record, carried over as they were
+			(new.card_valid, new.card) = (rule.card_valid, rule.card)
+		if stream_rule_state(new) != stream_rule_state(rule):
+			diff.streams.append((rule, new))
+
+# Apply the policy to this seat, device_map and restore_map are loaded
+# first if they are empty. Returns the diff that was applied, or that would
+# have been with dry_run.
+def apply_policy(rules, dry_run=False, offline=False):
+	diff = policy_diff()
+	if any(not rule.is_stream for rule in rules):
+		if len(device_map) == 0:
+			refresh_device_map()
+		device_policy_changes(rules, device_map, diff)
+	if any(rule.is_stream for rule in rules):
+		stream_policy_changes(rules, current_stream_rules(), diff, offline)
+	if dry_run:
+		return diff
+	changes = device_db_changes()
+	for (key, old, new) in diff.devices:
+		changes.store(key, new.encode())
+	changes.apply()
+	streams = stream_rules_diff()
+	streams.changed = [new for (old, new) in diff.streams]
+	apply_stream_rules_diff(streams, offline)
+	return diff
+
+# device_map shaped dict of the entries of db
+def read_devices(db):
+	devices = {}
+	for (key, value) in db_items(db):
+		if len(key.split(b":")) < 2:
+			continue
+		entry = per_port_entry(key.decode('utf-8', 'replace'), value)
+		if entry.is_valid:
+			add_device_entry(devices, entry)
+	return devices
+
+# Write the values, [(db, [(key, value)])], into several DBs. A transaction
+# is started on each of them and every one is prepared before the first is
+# committed, a failure up to there leaves all of them as they were. Only a
+# commit failing once an earlier one went through leaves them partly
+# written, the error then tells which of names were committed.
+def write_dbs(writes, names):
+	import tdb
+	started = []
+	try:
+		for (db, values) in writes:
+			db.transaction_start()
+			started.append(db)
+			for (key, value) in values:
+				db.store(key, value, tdb.REPLACE)
+	except Exception:
+		for db in started:
+			db.transaction_cancel()
+		raise
+	for i, db in enumerate(started):
+		try:
+			db.transaction_prepare_commit()
+		except Exception:
+			# tdb has cancelled the one that failed
+			for other in started[:i] + started[i+1:]:
+				other.transaction_cancel()
+			raise
+	for i, db in enumerate(started):
+		try:
+			db.transaction_commit()
+		except (OSError, RuntimeError) as e:
+			for other in started[i+1:]:
+				other.transaction_cancel()
+			if i == 0:
+				raise
+			raise RuntimeError(", ".join(names[:i])+" written, not "+", ".join(names[i:])+": "+str(e))
+
+# Apply the policy to the device DB at db_path and the stream-restore DB
+# next to it, if there is one, runs in the worker processes. PulseAudio
+# must not be running on that seat, it would overwrite the changes.
+def apply_policy_db(path, db_path, rules, dry_run=False):
+	import tdb
+	seat = {'kind': 'seat', 'path': path, 'db': db_path, 'changes': [], 'written': 0, 'error': None}
+	rules = load_policy(rules)
+	diff = policy_diff()
+	opened = []
+	try:
+		flags = os.O_RDONLY if dry_run else os.O_RDWR
+		db = tdb.open(db_path, 0, tdb.DEFAULT, flags)
+		opened.append(db)
+		device_policy_changes(rules, read_devices(db), diff)
+		stream_db = None
+		stream_db_path = db_path[:-len(fleet.DB_SUFFIX)]+STREAM_DB_SUFFIX
+		if db_path.endswith(fleet.DB_SUFFIX) and os.path.isfile(stream_db_path) and any(rule.is_stream for rule in rules):
+			stream_db = tdb.open(stream_db_path, 0, tdb.DEFAULT, flags)
+			opened.append(stream_db)
+			current = {rule.name: rule for rule in read_stream_rules(stream_db) if rule.is_valid}
+			stream_policy_changes(rules, current, diff, offline=True)
+		seat['changes'] = list(diff.lines())
+		if not dry_run and len(diff) > 0:
+			# everything is encoded before either DB is touched
+			writes = [(db, [(key.encode(), bytes(new.encode())) for (key, old, new) in diff.devices])]
+			names = [db_path]
+			if len(diff.streams) > 0:
+				writes.append((stream_db, [(new.name.encode(), bytes(new.encode())) for (old, new) in diff.streams]))
+				names.append(stream_db_path)
+			write_dbs(writes, names)
+			seat['written'] = len(diff)
+	except (OSError, RuntimeError, ValueError) as e:
+		seat['error'] = db_path+": "+str(e)
+	finally:
+		for db in opened:
+			db.close()
+	return seat
+
+def apply_policy_task(task):
+	return apply_policy_db(*task)
+
+# Apply the policy, as a list of dicts, to every DB found at paths with
+# jobs processes, see fleet.map_tasks(). Returns the seat records and a
+# summary.
+def apply_policy_fleet(rules, paths, dry_run=False, jobs=None):
+	# checked once here rather than in every worker
+	load_policy(rules)
+	found = fleet.find_all_dbs(paths)
+	tasks = [(path, db_path, rules, dry_run) for (path, db_path, error) in found if error is None]
+	results = iter(fleet.map_tasks(apply_policy_task, tasks, jobs))
+	seats = []
+	for (path, db_path, error) in found:
+		if error is None:
+			seats.append(next(results))
+		else:
+			seats.append({'kind': 'seat', 'path': path, 'db': None, 'changes': [], 'written': 0, 'error': error})
+	summary = {
+		'kind': 'summary',
+		'seats': len(seats),
+		'errors': sum(1 for seat in seats if seat['error'] is not None),
+		'changed_seats': sum(1 for seat in seats if len(seat['changes']) > 0),
+		'changes': sum(len(seat['changes']) for seat in seats),
+		'written': sum(seat['written'] for seat in seats),
+	}
+	return (seats, summary)
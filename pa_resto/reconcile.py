@@ -0,0 +1,16 @@
+# Keyed diff of two row sets, for views that update only the rows whose
+# entry changed instead of being cleared and rebuilt after every change.
+# Rows are {key: values}, values being anything comparable with ==.
+
+# Returns the keys to remove, to update and to add, the added ones in the
+# order of new.
+def keyed_diff(old, new):
+	removed = [key for key in old.keys() if key not in new]
+	changed = []
+	added = []
+	for key, values in new.items():
+		if key not in old:
+			added.append(key)
+		elif old[key] != values:
+			changed.append(key)
+	return (removed, changed, added)
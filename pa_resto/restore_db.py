@@ -0,0 +1,645 @@
+import logging
+import os
+
+from .device_restore import per_port_entry
+from .stream_restore import read_stream_rules
+from .card_restore import card_restore_entry
+from . import instrument
+from .decode_cache import decode_cache, value_digest
+
+log = logging.getLogger(__name__)
+
+# Nothing is opened when this is imported, the pulse connection and the
+# device volumes DB are only opened on first use through get_pulse() and
+# get_db().
+pulse = None
+db = None
+stream_db = None
+card_db = None
+# $HOME/.config/pulse and /etc/machine-id when left to None, set them before
+# first use to work on another user's or machine's files
+config_dir = None
+machine_id = None
+default_sink = ''
+default_source = ''
+
+def get_config_dir():
+	global config_dir
+	if config_dir is None:
+		config_dir = os.environ['HOME']+'/.config/pulse'
+	return config_dir
+
+def get_machine_id():
+	global machine_id
+	if machine_id is None:
+		machine_id = open('/etc/machine-id','r').read().rstrip()
+	return machine_id
+
+def device_volumes_db():
+	return get_config_dir()+'/'+get_machine_id()+'-device-volumes.tdb'
+
+def stream_volumes_db():
+	return get_config_dir()+'/'+get_machine_id()+'-stream-volumes.tdb'
+
+def card_database_db():
+	return get_config_dir()+'/'+get_machine_id()+'-card-database.tdb'
+
+def default_sink_file():
+	return get_config_dir()+'/'+get_machine_id()+'-default-sink'
+
+def default_source_file():
+	return get_config_dir()+'/'+get_machine_id()+'-default-source'
+
+def get_pulse():
+	global pulse
+	if pulse is None or not pulse.connected:
+		import pulsectl
+		pulse = instrument.trace(pulsectl.Pulse('restore_manip'), 'pulse')
+	return pulse
+
+def get_db():
+	global db
+	if db is None:
+		import tdb
+		db = instrument.trace(tdb.open(device_volumes_db()), 'db')
+	return db
+
+# the stream rules DB, only for offline use, with PulseAudio running go
+# through get_pulse()
+def get_stream_db():
+	global stream_db
+	if stream_db is None:
+		import tdb
+		stream_db = instrument.trace(tdb.open(stream_volumes_db()), 'stream_db')
+	return stream_db
+
+# the card-restore DB, written like the device one while PulseAudio runs,
+# the module reads an entry back when its card shows up again
+def get_card_db():
+	global card_db
+	if card_db is None:
+		import tdb
+		card_db = instrument.trace(tdb.open(card_database_db()), 'card_db')
+	return card_db
+
+# (key, value) of every key of db, the keys deleted while walking it are
+# skipped
+def db_items(db):
+	for key in db.keys():
+		value = db.get(key)
+		if value != None:
+			yield (key, value)
+
+device_map = {}
+
+#| sink   | default port
+#|--------|------------------
+#| source | all ports + info
+# device_map {
+#   'sink': {
+#       'devicename': {
+#           'default_port': {default port info }
+#           'is_default_device': based on default sink/source
+#           'ports': {
+#               portname: {
+#                   { port information }
+#                   volume: [0.5,0.5]
+#               }
+#           }
+#       }
+#    }
+# }
+# value_digest() of the raw value of every key currently in device_map, used
+# to find which keys changed when the DB is rewritten behind our back, the
+# same digest device_cache is looked up with
+device_map_hashes = {}
+# decoded entries by key and raw value, a refresh only decodes what changed
+device_cache = decode_cache(per_port_entry)
+
+@instrument.timed('refresh_device_map')
+def refresh_device_map():
+	apply_device_map(read_device_map())
+
+# The reading half of refresh_device_map(), it doesn't touch device_map and
+# can run on another thread: the default devices and the (key, digest,
+# entry) of every key of the DB
+def read_device_map():
+	defaults = read_default_devices()
+	entries = []
+	for (key, value) in db_items(get_db()):
+		digest = value_digest(value)
+		entries.append((key, digest, device_cache.get(key.decode(), value, digest)))
+	return (defaults, entries)
+
+# The other half, on the thread that owns device_map
+def apply_device_map(result):
+	global device_map
+	(defaults, entries) = result
+	device_map.clear()
+	device_map_hashes.clear()
+	device_map['source'] = {}
+	device_map['sink'] = {}
+
+	apply_default_devices(defaults)
+
+	for (key, digest, entry) in entries:
+		device_map_hashes[key] = digest
+		add_to_device_map(entry)
+
+# PulseAudio only writes the file once a default is set, no file is no default
+def read_default_file(path):
+	try:
+		with open(path) as f:
+			return f.read().rstrip()
+	except FileNotFoundError:
+		return ''
+
+@instrument.timed('refresh_default_devices')
+def refresh_default_devices():
+	apply_default_devices(read_default_devices())
+
+# (default sink, default source) from their files
+def read_default_devices():
+	return (read_default_file(default_sink_file()), read_default_file(default_source_file()))
+
+def apply_default_devices(defaults):
+	global default_sink
+	global default_source
+	(default_sink, default_source) = defaults
+	for device_type in device_map.keys():
+		for name in device_map[device_type].keys():
+			device_map[device_type][name]['is_default_device'] = name == default_sink or name == default_source
+
+# Make name the fallback sink or source right away and for the next start,
+# then mark it in device_map
+def set_default_device(device_type, name):
+	apply_default_devices(write_default_device(device_type, name))
+
+# The pulse and file half of set_default_device(), returns the default
+# devices for apply_default_devices()
+def write_default_device(device_type, name):
+	if device_type == 'sink':
+		get_pulse().sink_default_set(name)
+		open(default_sink_file(),'w').write(name)
+	else:
+		get_pulse().source_default_set(name)
+		open(default_source_file(),'w').write(name)
+	return read_default_devices()
+
+def add_to_device_map(ppe):
+	global device_map
+	if not ppe.is_valid:
+		log.warning("corrupted entry %s in restoration DB", ppe.name)
+		return
+	add_device_entry(device_map, ppe, (default_sink, default_source))
+
+# Put a valid entry in devices, a dict shaped like device_map, defaults are
+# the names of the default sink and source
+def add_device_entry(devices, entry, defaults=()):
+	names = devices.setdefault(entry.type, {})
+	device = names.get(entry.name)
+	if device is None:
+		device = names[entry.name] = {
+			'is_default_device': entry.name in defaults,
+			'default_port': None,
+			'ports': {}
+		}
+	if entry.is_port_format:
+		device['default_port'] = entry
+	else:
+		device['ports'][entry.port] = entry
+
+def remove_from_device_map(name):
+	global device_map
+	parts = name.split(":")
+	device_type = parts[0]
+	device_name = parts[1]
+	if device_name not in device_map[device_type].keys():
+		return
+	device = device_map[device_type][device_name]
+	if len(parts) >= 3:
+		device['ports'].pop(parts[2], None)
+	else:
+		device['default_port'] = None
+	if device['default_port'] == None and len(device['ports']) == 0:
+		del device_map[device_type][device_name]
+
+# Patch only the given type:device[:port] keys into device_map, to be called
+# after db.store/db.delete instead of rescanning the whole DB.
+# refresh_device_map() stays the full resync.
+@instrument.timed('update_device_map')
+def update_device_map(keys):
+	apply_device_entries(read_device_entries(keys))
+
+# The reading half of update_device_map(), it doesn't touch device_map and
+# can run on another thread: the (key, digest, entry) of the given keys,
+# (key, None, None) for the ones that are gone
+def read_device_entries(keys):
+	if len(device_map) == 0:
+		# never loaded, by a script that only writes, nothing to patch
+		return []
+	db = get_db()
+	entries = []
+	for key in keys:
+		if isinstance(key, str):
+			key = key.encode()
+		value = db.get(key)
+		if value == None:
+			entries.append((key, None, None))
+		else:
+			digest = value_digest(value)
+			entries.append((key, digest, device_cache.get(key.decode(), value, digest)))
+	return entries
+
+# The other half, on the thread that owns device_map, returns the keys
+def apply_device_entries(entries):
+	for (key, digest, entry) in entries:
+		remove_from_device_map(key.decode())
+		if entry is None:
+			device_map_hashes.pop(key, None)
+		else:
+			device_map_hashes[key] = digest
+			add_to_device_map(entry)
+	return [key for (key, digest, entry) in entries]
+
+# Keys whose raw value differs from what is in device_map, this still walks
+# the DB but only the changed entries get decoded by update_device_map().
+# From another thread, pass a copy of device_map_hashes taken on the thread
+# that owns device_map.
+@instrument.timed('changed_device_keys')
+def changed_device_keys(hashes=None):
+	if hashes is None:
+		hashes = device_map_hashes
+	changed = []
+	seen = set()
+	for (key, value) in db_items(get_db()):
+		seen.add(key)
+		if hashes.get(key) != value_digest(value):
+			changed.append(key)
+	for key in hashes.keys():
+		if key not in seen:
+			changed.append(key)
+	return changed
+
+class restore_files_watcher:
+	"""
+	Notices when the device volumes DB or the default sink/source files are
+	rewritten, by PulseAudio or anyone else, comparing the stat of the files
+	and the TDB sequence number with what they were on the previous check.
+	"""
+	def __init__(self):
+		self.db_file = device_volumes_db()
+		self.sink_file = default_sink_file()
+		self.source_file = default_source_file()
+		self.stamps = {}
+		for path in (self.db_file, self.sink_file, self.source_file):
+			self.stamps[path] = self.stamp(path)
+
+	def stamp(self, path):
+		try:
+			st = os.stat(path)
+		except OSError:
+			return None
+		stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+		if path == self.db_file:
+			# only bumped if the writer opened the DB with TDB_SEQNUM
+			stamp += (getattr(get_db(), 'seqnum', None),)
+		return stamp
+
+	def changed_files(self):
+		changed = []
+		for path in self.stamps.keys():
+			stamp = self.stamp(path)
+			if stamp != self.stamps[path]:
+				self.stamps[path] = stamp
+				changed.append(path)
+		return changed
+
+	# returns the list of changed keys pushed into device_map and whether
+	# the default devices changed, does nothing when no file changed
+	def check(self):
+		return self.apply(self.poll(device_map_hashes))
+
+	# The reading half of check(), it doesn't touch device_map and can run
+	# on another thread given a copy of device_map_hashes: the default
+	# devices, None when their files didn't change, and the (key, digest,
+	# entry) of the keys that changed
+	def poll(self, hashes):
+		changed = self.changed_files()
+		defaults = None
+		entries = []
+		if self.sink_file in changed or self.source_file in changed:
+			defaults = read_default_devices()
+		if self.db_file in changed:
+			entries = read_device_entries(changed_device_keys(hashes))
+		return (defaults, entries)
+
+	# The other half, on the thread that owns device_map
+	def apply(self, result):
+		(defaults, entries) = result
+		defaults_changed = False
+		if defaults is not None:
+			defaults_changed = defaults != (default_sink, default_source)
+			apply_default_devices(defaults)
+		return (apply_device_entries(entries), defaults_changed)
+
+# card name -> card_restore_entry
+card_map = {}
+# value_digest() of the raw value of every key currently in card_map, like
+# device_map_hashes
+card_map_hashes = {}
+card_cache = decode_cache(card_restore_entry)
+
+@instrument.timed('refresh_card_map')
+def refresh_card_map():
+	card_map.clear()
+	card_map_hashes.clear()
+	for (key, value) in db_items(get_card_db()):
+		digest = value_digest(value)
+		card_map_hashes[key] = digest
+		add_to_card_map(card_cache.get(key.decode(), value, digest))
+
+def add_to_card_map(entry):
+	if not entry.is_valid:
+		log.warning("corrupted entry %s in card restoration DB", entry.name)
+		return
+	card_map[entry.name] = entry
+
+# Patch only the given card keys into card_map, the same as
+# update_device_map()
+@instrument.timed('update_card_map')
+def update_card_map(keys):
+	apply_card_entries(read_card_entries(keys))
+
+# The halves of update_card_map(), like read_device_entries() and
+# apply_device_entries()
+def read_card_entries(keys):
+	db = get_card_db()
+	entries = []
+	for key in keys:
+		if isinstance(key, str):
+			key = key.encode()
+		value = db.get(key)
+		if value == None:
+			entries.append((key, None, None))
+		else:
+			digest = value_digest(value)
+			entries.append((key, digest, card_cache.get(key.decode(), value, digest)))
+	return entries
+
+def apply_card_entries(entries):
+	for (key, digest, entry) in entries:
+		card_map.pop(key.decode(), None)
+		if entry is None:
+			card_map_hashes.pop(key, None)
+		else:
+			card_map_hashes[key] = digest
+			add_to_card_map(entry)
+	return [key for (key, digest, entry) in entries]
+
+@instrument.timed('changed_card_keys')
+def changed_card_keys():
+	changed = []
+	seen = set()
+	for (key, value) in db_items(get_card_db()):
+		seen.add(key)
+		if card_map_hashes.get(key) != value_digest(value):
+			changed.append(key)
+	for key in card_map_hashes.keys():
+		if key not in seen:
+			changed.append(key)
+	return changed
+
+# Writes to the device DB go through here, they are collected and then
+# written in a single tdb transaction, either right away or, when staging
+# is turned on, once they are applied.
+class device_db_changes:
+	def __init__(self):
+		# key -> new value, None for a deletion, the last change of a key wins
+		self.changes = {}
+		self.staging = False
+
+	def __len__(self):
+		return len(self.changes)
+
+	def store(self, key, value):
+		if isinstance(key, str):
+			key = key.encode()
+		self.changes[key] = bytes(value)
+		self.forget(key)
+
+	def delete(self, key):
+		if isinstance(key, str):
+			key = key.encode()
+		self.changes[key] = None
+		self.forget(key)
+
+	def apply(self):
+		return self.patch(self.commit())
+
+	# The DB half of apply(), it doesn't touch the map and can run on
+	# another thread: the changes are written in one transaction and read
+	# back. Returns (keys, entries read back, the exception if the
+	# transaction failed) for patch() to take on the thread that owns the
+	# map.
+	def commit(self):
+		if len(self.changes) == 0:
+			return ([], [], None)
+		import tdb
+		# taken out at once, changes made while this is written, from
+		# another thread, are kept for the next apply
+		(changes, self.changes) = (self.changes, {})
+		keys = list(changes.keys())
+		error = None
+		db = self.get_db()
+		db.transaction_start()
+		# dropped on an error rather than left for the next apply to write
+		# behind the caller's back, the entries they edited in place are read
+		# back as they are in the DB
+		try:
+			for key, value in changes.items():
+				if value != None:
+					db.store(key, value, tdb.REPLACE)
+				elif db.get(key) != None:
+					db.delete(key)
+		except Exception as e:
+			db.transaction_cancel()
+			error = e
+		if error is None:
+			try:
+				# a commit that fails is cancelled by tdb itself
+				db.transaction_commit()
+			except Exception as e:
+				error = e
+		try:
+			entries = self.read_back(keys)
+		except Exception:
+			if error is None:
+				raise
+			entries = []
+		return (keys, entries, error)
+
+	# The map half of apply(), raises the error of the transaction once
+	# the map is patched, returns the keys written
+	def patch(self, result):
+		(keys, entries, error) = result
+		self.patch_map(entries)
+		if error is not None:
+			raise error
+		return keys
+
+	def discard(self):
+		keys = self.drop()
+		# entries might have been edited in place, read them back
+		self.patch_map(self.read_back(keys))
+		return keys
+
+	# Take the changes out without writing them, returns their keys
+	def drop(self):
+		(changes, self.changes) = (self.changes, {})
+		return list(changes.keys())
+
+	# whether key is staged for deletion
+	def is_deleted(self, key):
+		if isinstance(key, str):
+			key = key.encode()
+		return key in self.changes and self.changes[key] == None
+
+	# write the changes now unless they are being staged
+	def write(self):
+		if not self.staging:
+			return self.apply()
+		return []
+
+	def get_db(self):
+		return get_db()
+
+	# what the map holds for keys, as it is in the DB now, see
+	# read_device_entries()
+	def read_back(self, keys):
+		return read_device_entries(keys)
+
+	def patch_map(self, entries):
+		apply_device_entries(entries)
+
+	# the entry of key might have been edited in place, it must be decoded
+	# again when read back
+	def forget(self, key):
+		device_cache.forget(key.decode())
+
+pending_device_changes = device_db_changes()
+
+# The same for the card DB, keyed by card name
+class card_db_changes(device_db_changes):
+	def get_db(self):
+		return get_card_db()
+
+	def read_back(self, keys):
+		if len(card_map) == 0:
+			return []
+		return read_card_entries(keys)
+
+	def patch_map(self, entries):
+		apply_card_entries(entries)
+
+	def forget(self, key):
+		card_cache.forget(key.decode())
+
+pending_card_changes = card_db_changes()
+
+# The same for a DB the caller opened, of another seat for example, no map
+# is patched
+class file_db_changes(device_db_changes):
+	def __init__(self, db):
+		device_db_changes.__init__(self)
+		self.db = db
+
+	def get_db(self):
+		return self.db
+
+	def read_back(self, keys):
+		return []
+
+	def patch_map(self, entries):
+		pass
+
+	def forget(self, key):
+		pass
+
+# Stage the encoded entries in changes, pending_device_changes by default,
+# for bulk rewrites such as normalizing volumes over many devices.
+def store_entries(entries, changes=None):
+	if changes is None:
+		changes = pending_device_changes
+	for entry in entries:
+		changes.store(entry.key, entry.encode())
+
+# Stage the card entries in changes, pending_card_changes by default
+def store_card_entries(entries, changes=None):
+	if changes is None:
+		changes = pending_card_changes
+	for entry in entries:
+		changes.store(entry.key, entry.encode())
+
+
+# DEBUG
+def clean_nones(value):
+    """
+    Recursively remove all None values from dictionaries and lists, and returns
+    the result as a new dictionary or list.
+    """
+    if isinstance(value, per_port_entry):
+        return clean_nones(value.to_dict())
+    elif isinstance(value, list):
+        return [clean_nones(x) for x in value if x is not None]
+    elif isinstance(value, dict):
+        return {
+            key: clean_nones(val)
+            for key, val in value.items()
+            if val is not None
+        }
+    else:
+        return value
+
+# pacmd list-clients to find more information
+restore_map_empty = {
+	'source-output-by-media-role': {},
+	'source-output-by-application-name': {},
+	'source-output-by-application-id': {},
+	'source-output-by-media-name': {},
+	'sink-input-by-media-role': {},
+	'sink-input-by-application-name': {},
+	'sink-input-by-application-id': {},
+	'sink-input-by-media-name': {},
+}
+
+restore_map = {}
+
+# offline reads the rules from the stream-restore DB instead of asking
+# PulseAudio, the invalid entries are left out
+@instrument.timed('refresh_restore_map')
+def refresh_restore_map(offline=False):
+	global restore_map
+	if offline:
+		restore_db = [rule for rule in read_stream_rules(get_stream_db()) if rule.is_valid]
+	else:
+		restore_db = get_pulse().stream_restore_read()
+	# filled in place, the maps of rules that were deleted must not linger
+	restore_map.clear()
+	for association_type in restore_map_empty.keys():
+		restore_map[association_type] = {}
+	for a in range(len(restore_db)):
+		association_type = restore_db[a].name.split(":")[0]
+		first_colon_loc = restore_db[a].name.find(":")
+		name = restore_db[a].name[first_colon_loc+1:]
+		restore_map.setdefault(association_type, {})[name] = restore_db[a]
+
+
+def stream_rule_to_dict(rule):
+	return {
+		'name': rule.name,
+		'device': rule.device,
+		'mute': bool(rule.mute),
+		'volume': list(rule.volume.values),
+		'channel_list': list(rule.channel_list),
+	}
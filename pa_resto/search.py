@@ -0,0 +1,137 @@
+# Search over the stream rules and the device entries, by prefix of the
+# words of the rule names, target devices, device names and port names.
+#
+#   index = search_index()
+#   index.rebuild()
+#   index.search("usb ana")  # entries with a word starting with usb and one
+#                            # starting with ana
+#
+# Entries are ('stream', <map>:<name>), ('device', <type>:<device>) and
+# ('port', <type>:<device>:<port>). The index is kept up to date with
+# update_stream_rules() and update_device_keys() after a change instead of
+# being rebuilt.
+import bisect
+import heapq
+import re
+
+from .restore_db import device_map, restore_map
+
+WORD = re.compile(r'[0-9a-z]+')
+
+def words(text):
+	return WORD.findall(text.lower())
+
+class search_index:
+	def __init__(self):
+		# word -> set of entries, and every word sorted for the prefix lookups
+		self.postings = {}
+		self.sorted_words = []
+		# entry -> its words, to take it out again
+		self.entries = {}
+		# type:device -> its port entries
+		self.device_ports = {}
+
+	def __len__(self):
+		return len(self.entries)
+
+	def add(self, entry, texts):
+		self.remove(entry)
+		entry_words = set()
+		for text in texts:
+			if text:
+				entry_words.update(words(text))
+		self.entries[entry] = entry_words
+		for word in entry_words:
+			posting = self.postings.get(word)
+			if posting is None:
+				posting = self.postings[word] = set()
+				bisect.insort(self.sorted_words, word)
+			posting.add(entry)
+
+	def remove(self, entry):
+		entry_words = self.entries.pop(entry, None)
+		if entry_words is None:
+			return
+		for word in entry_words:
+			posting = self.postings[word]
+			posting.discard(entry)
+			if len(posting) == 0:
+				del self.postings[word]
+				del self.sorted_words[bisect.bisect_left(self.sorted_words, word)]
+
+	# entries with a word starting with prefix
+	def prefix_matches(self, prefix):
+		matches = set()
+		start = bisect.bisect_left(self.sorted_words, prefix)
+		for i in range(start, len(self.sorted_words)):
+			word = self.sorted_words[i]
+			if not word.startswith(prefix):
+				break
+			matches.update(self.postings[word])
+		return matches
+
+	# entries matching every word of the query, sorted, at most limit of them
+	def search(self, query, limit=None):
+		result = None
+		# the longest words first, they have the fewest matches
+		for prefix in sorted(set(words(query)), key=len, reverse=True):
+			matches = self.prefix_matches(prefix)
+			result = matches if result is None else result & matches
+			if len(result) == 0:
+				break
+		if result is None:
+			return []
+		if limit is not None and limit < len(result):
+			return heapq.nsmallest(limit, result)
+		return sorted(result)
+
+	def add_stream_rule(self, rule):
+		self.add(('stream', rule.name), (rule.name, rule.device))
+
+	def add_device(self, device_type, name):
+		device = device_map[device_type][name]
+		full_name = device_type+":"+name
+		default_port = device['default_port'].port if device['default_port'] else None
+		self.add(('device', full_name), (full_name, default_port))
+		ports = self.device_ports[full_name] = []
+		for port in device['ports'].keys():
+			ports.append(('port', full_name+":"+port))
+			self.add(ports[-1], (full_name, port))
+
+	def remove_device(self, full_name):
+		self.remove(('device', full_name))
+		for entry in self.device_ports.pop(full_name, []):
+			self.remove(entry)
+
+	def rebuild(self):
+		self.postings.clear()
+		del self.sorted_words[:]
+		self.entries.clear()
+		self.device_ports.clear()
+		for association_type in restore_map.keys():
+			for rule in restore_map[association_type].values():
+				self.add_stream_rule(rule)
+		for device_type in device_map.keys():
+			for name in device_map[device_type].keys():
+				self.add_device(device_type, name)
+
+	# after sync_stream_rules(), with the diff it returned
+	def update_stream_rules(self, diff):
+		for rule in diff.writes:
+			self.add_stream_rule(rule)
+		for name in diff.removed:
+			self.remove(('stream', name))
+
+	# after changes to the device DB got into device_map, with the changed
+	# type:device[:port] keys
+	def update_device_keys(self, keys):
+		devices = set()
+		for key in keys:
+			if isinstance(key, bytes):
+				key = key.decode()
+			parts = key.split(":")
+			devices.add((parts[0], parts[1]))
+		for (device_type, name) in devices:
+			self.remove_device(device_type+":"+name)
+			if name in device_map.get(device_type, {}):
+				self.add_device(device_type, name)
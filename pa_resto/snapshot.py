@@ -0,0 +1,226 @@
+# Snapshots of the restoration state, the raw entries of the device-volumes
+# DB and the stream rules, to roll back edits made with db.store/db.delete
+# or stream_restore_write/delete.
+#
+#   store = snapshot_store()
+#   store.take("before the policy")
+#   ...
+#   store.restore(1)
+#
+# Snapshots are kept as JSON files, <machine-id>-<id>.json in
+# <config dir>/pa-resto-snapshots by default. Only the first one holds every
+# entry in full, every later one holds, for the keys that changed since the
+# one before, a binary diff of the raw value: the length of the bytes it
+# shares at the start and at the end with the previous value and the bytes in
+# between, null for a key that was deleted. A volume change costs a few bytes
+# whatever the number of entries.
+#
+# A restore rebuilds the state of the snapshot and rewrites only the keys
+# that differ from the current one, the device entries in one transaction
+# and the stream rules in one stream_restore_write and one
+# stream_restore_delete, or offline in one transaction. Offline, the raw
+# values are written back as they were, PulseAudio only hands over and
+# takes the rules it can decode.
+import glob
+import json
+import os
+import time
+
+from .stream_restore import stream_restore_entry
+from .stream_sync import stream_rules_diff, apply_stream_rules_diff, patch_restore_map
+from .ndjson import stream_rule_from_record
+from .restore_db import (
+	get_pulse,
+	get_db,
+	get_stream_db,
+	get_config_dir,
+	get_machine_id,
+	db_items,
+	device_db_changes,
+	file_db_changes,
+	stream_rule_to_dict,
+)
+
+# the parts of a snapshot
+PARTS = ('device', 'stream')
+
+# keys are written as text, the ones that aren't UTF-8 survive the round trip
+def key_to_text(key):
+	return key.decode('utf-8', 'surrogateescape')
+
+def text_to_key(text):
+	return text.encode('utf-8', 'surrogateescape')
+
+# [shared prefix length, shared suffix length, hex of the bytes in between]
+def binary_diff(old, new):
+	limit = min(len(old), len(new))
+	prefix = 0
+	while prefix < limit and old[prefix] == new[prefix]:
+		prefix += 1
+	suffix = 0
+	while suffix < limit - prefix and old[-1 - suffix] == new[-1 - suffix]:
+		suffix += 1
+	return [prefix, suffix, new[prefix:len(new) - suffix].hex()]
+
+def apply_binary_diff(old, diff):
+	(prefix, suffix, middle) = diff
+	return old[:prefix] + bytes.fromhex(middle) + old[len(old) - suffix:]
+
+# {key: raw value} of the device-volumes DB
+def device_state():
+	return {key_to_text(key): bytes(value) for (key, value) in db_items(get_db())}
+
+# {rule name: raw value} of the stream rules, what module-stream-restore
+# stores for them, offline straight from the stream-restore DB
+def stream_state(offline=False):
+	if offline:
+		return {key_to_text(key): bytes(value) for (key, value) in db_items(get_stream_db())}
+	return {rule.name: bytes(stream_restore_entry.from_rule(rule).encode())
+		for rule in get_pulse().stream_restore_read()}
+
+# {key: diff or None for a deletion} turning old into new
+def state_diff(old, new):
+	changes = {}
+	for key, value in new.items():
+		previous = old.get(key)
+		if previous != value:
+			changes[key] = binary_diff(previous or b'', value)
+	for key in old.keys():
+		if key not in new:
+			changes[key] = None
+	return changes
+
+def apply_state_diff(state, changes):
+	for key, diff in changes.items():
+		if diff is None:
+			state.pop(key, None)
+		else:
+			state[key] = apply_binary_diff(state.get(key, b''), diff)
+
+class snapshot_store:
+	def __init__(self, directory=None, machine_id=None):
+		if directory is None:
+			directory = os.path.join(get_config_dir(), 'pa-resto-snapshots')
+		self.directory = directory
+		self.machine_id = machine_id or get_machine_id()
+
+	def path(self, snapshot_id):
+		return os.path.join(self.directory, self.machine_id+'-'+str(snapshot_id)+'.json')
+
+	def ids(self):
+		prefix = os.path.join(glob.escape(self.directory), glob.escape(self.machine_id))
+		ids = []
+		for path in glob.glob(prefix+'-*.json'):
+			number = os.path.basename(path)[len(self.machine_id)+1:-len('.json')]
+			if number.isdigit():
+				ids.append(int(number))
+		return sorted(ids)
+
+	def load(self, snapshot_id):
+		try:
+			with open(self.path(snapshot_id)) as f:
+				return json.load(f)
+		except FileNotFoundError:
+			raise ValueError("no snapshot "+str(snapshot_id))
+
+	# id, label, date and the number of keys stored of every snapshot, the
+	# first one is the base
+	def list(self):
+		snapshots = []
+		for snapshot_id in self.ids():
+			snapshot = self.load(snapshot_id)
+			snapshots.append({
+				'id': snapshot['id'],
+				'label': snapshot['label'],
+				'date': snapshot['date'],
+				'changed': {part: len(snapshot[part]) for part in PARTS},
+			})
+		return snapshots
+
+	# {part: {key: raw value}} as it was when the snapshot was taken, the
+	# diffs are replayed from the base
+	def state(self, snapshot_id):
+		ids = self.ids()
+		if snapshot_id not in ids:
+			raise ValueError("no snapshot "+str(snapshot_id))
+		state = {part: {} for part in PARTS}
+		for number in ids[:ids.index(snapshot_id)+1]:
+			snapshot = self.load(number)
+			for part in PARTS:
+				apply_state_diff(state[part], snapshot[part])
+		return state
+
+	# Record the current state, returns the id of the new snapshot
+	def take(self, label=None, offline=False):
+		ids = self.ids()
+		previous = self.state(ids[-1]) if ids else {part: {} for part in PARTS}
+		current = {'device': device_state(), 'stream': stream_state(offline)}
+		snapshot = {
+			'id': ids[-1]+1 if ids else 1,
+			'label': label,
+			'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+		}
+		for part in PARTS:
+			snapshot[part] = state_diff(previous[part], current[part])
+		os.makedirs(self.directory, exist_ok=True)
+		# written aside and renamed, a snapshot is there whole or not at all
+		path = self.path(snapshot['id'])
+		with open(path+'.tmp', 'w') as f:
+			json.dump(snapshot, f)
+		os.replace(path+'.tmp', path)
+		return snapshot['id']
+
+	# Bring the DBs back to the snapshot, returns the lines of what was
+	# rewritten, or would have been with dry_run, + key restored, ~ key
+	# changed back, - key removed
+	def restore(self, snapshot_id, dry_run=False, offline=False):
+		target = self.state(snapshot_id)
+		current = {'device': device_state(), 'stream': stream_state(offline)}
+		changes = {part: state_diff(current[part], target[part]) for part in PARTS}
+		lines = []
+		for part in PARTS:
+			for key in sorted(changes[part].keys()):
+				if changes[part][key] is None:
+					lines.append("- "+part+" "+key)
+				elif key in current[part]:
+					lines.append("~ "+part+" "+key)
+				else:
+					lines.append("+ "+part+" "+key)
+		if dry_run:
+			return lines
+		device_changes = device_db_changes()
+		for key in changes['device'].keys():
+			if key in target['device']:
+				device_changes.store(text_to_key(key), target['device'][key])
+			else:
+				device_changes.delete(text_to_key(key))
+		device_changes.apply()
+		if offline:
+			# the raw values, entries pulse can't decode included
+			stream_changes = file_db_changes(get_stream_db())
+			writes = []
+			removed = []
+			for key in changes['stream'].keys():
+				if key not in target['stream']:
+					stream_changes.delete(text_to_key(key))
+					removed.append(key)
+					continue
+				stream_changes.store(text_to_key(key), target['stream'][key])
+				rule = stream_restore_entry(key, target['stream'][key])
+				if rule.is_valid:
+					writes.append(rule)
+				else:
+					removed.append(key)
+			stream_changes.apply()
+			patch_restore_map(writes, removed)
+			return lines
+		streams = stream_rules_diff()
+		for key in changes['stream'].keys():
+			if key not in target['stream']:
+				streams.removed.append(key)
+				continue
+			rule = stream_restore_entry(key, target['stream'][key])
+			if rule.is_valid:
+				streams.changed.append(stream_rule_from_record(stream_rule_to_dict(rule)))
+		apply_stream_rules_diff(streams)
+		return lines
@@ -0,0 +1,179 @@
+import re
+import struct
+
+from . import tagstruct
+
+# Offline access to the module-stream-restore rules, straight from
+# <machine-id>-stream-volumes.tdb, for when PulseAudio isn't running or the
+# rules of many users have to be read. Writing it while PulseAudio runs
+# isn't safe, the daemon doesn't notice and would overwrite the changes.
+# Structure: https://gitlab.freedesktop.org/pulseaudio/pulseaudio/-/blob/master/src/modules/module-stream-restore.c
+# entry_write(), the key is the rule name without its NUL:
+# 'B' version, volume_valid, 'm' channel map, 'v' volume, muted_valid,
+# muted, device_valid, 't' device or 'N', card_valid, 't' card or 'N'
+
+# Example:
+# sink-input-by-media-role:event
+# 4201 31 6d020102 760200010000 00010000 31 30 30 4e 30 4e
+
+# pa_channel_position_to_string(), by position
+CHANNEL_POSITIONS = (['mono', 'front-left', 'front-right', 'front-center',
+	'rear-center', 'rear-left', 'rear-right', 'lfe', 'front-left-of-center',
+	'front-right-of-center', 'side-left', 'side-right'] +
+	['aux%d' % i for i in range(32)] +
+	['top-center', 'top-front-left', 'top-front-right', 'top-front-center',
+	'top-rear-left', 'top-rear-right', 'top-rear-center'])
+CHANNEL_POSITION_NUMBERS = {name: i for i, name in enumerate(CHANNEL_POSITIONS)}
+
+# stands for pulsectl.PulseVolumeInfo without needing libpulse
+class stream_volume:
+	__slots__ = ('values',)
+
+	def __init__(self, values):
+		self.values = values
+
+	@property
+	def value_flat(self):
+		return (sum(self.values) / float(len(self.values))) if self.values else 0
+
+	@value_flat.setter
+	def value_flat(self, value):
+		self.values = [value] * len(self.values)
+
+class stream_restore_entry:
+	"""
+	A rule of the stream-restore DB. It has the attributes of the
+	pulsectl.PulseExtStreamRestoreInfo that stream_restore_read() returns,
+	name, device, mute, volume, channel_list and channel_count, with the
+	same meaning, so it can be put in restore_map. The fields the native
+	protocol hides, the valid flags and the card, are kept as they are.
+	"""
+	PA_VOLUME_NORM = 0x10000
+	# the version module-stream-restore writes, entries of a later version
+	# are refused by it
+	ENTRY_VERSION = 1
+	# tags of an entry, as tagstruct.read() returns them
+	ENTRY = re.compile(rb'B[01]mv[01][01][01][tN][01][tN]')
+	__slots__ = ('name', 'version', 'is_valid', 'volume_valid', 'channel_map',
+		'volume', 'muted_valid', 'muted', 'device_valid', 'stream_device',
+		'card_valid', 'card')
+
+	def __init__(self, name, binary):
+		self.name = name
+		self.version = self.ENTRY_VERSION
+		self.is_valid = False
+		self.volume_valid = False
+		self.channel_map = []
+		self.volume = stream_volume([])
+		self.muted_valid = False
+		self.muted = False
+		self.device_valid = False
+		self.stream_device = None
+		self.card_valid = False
+		self.card = None
+		self.decode(binary)
+
+	# what the native protocol shows of the entry
+
+	@property
+	def mute(self):
+		return 1 if self.muted_valid and self.muted else 0
+
+	@mute.setter
+	def mute(self, value):
+		self.muted = bool(value)
+		self.muted_valid = True
+
+	@property
+	def device(self):
+		return self.stream_device if self.device_valid else None
+
+	@device.setter
+	def device(self, value):
+		self.stream_device = value
+		self.device_valid = bool(value)
+
+	@property
+	def channel_list(self):
+		return [CHANNEL_POSITIONS[i] if i < len(CHANNEL_POSITIONS) else 'invalid' for i in self.channel_map]
+
+	@channel_list.setter
+	def channel_list(self, names):
+		self.channel_map = [CHANNEL_POSITION_NUMBERS[name] for name in names]
+
+	@property
+	def channel_count(self):
+		return len(self.channel_map)
+
+	@channel_count.setter
+	def channel_count(self, value):
+		# follows channel_list, set that instead
+		pass
+
+	@classmethod
+	def from_rule(cls, rule):
+		entry = cls(rule.name, None)
+		entry.channel_list = rule.channel_list
+		entry.volume = stream_volume(list(rule.volume.values))
+		entry.mute = rule.mute
+		entry.device = rule.device
+		entry.is_valid = True
+		return entry
+
+	def decode(self, binary):
+		if not binary:
+			return
+		try:
+			(tags, values) = tagstruct.read(binary)
+		except (IndexError, ValueError, struct.error):
+			# truncated or garbled
+			return
+		if not self.ENTRY.fullmatch(tags):
+			# of the legacy format or unknown
+			return
+		(self.version, self.volume_valid, self.channel_map, volume,
+			self.muted_valid, self.muted, self.device_valid, self.stream_device,
+			self.card_valid, self.card) = values
+		if self.volume_valid:
+			norm = float(self.PA_VOLUME_NORM)
+			self.volume = stream_volume([val/norm for val in volume])
+		# with no valid volume the channel map is kept all the same, it is
+		# written back as it was
+		self.is_valid = True
+
+	def encode(self):
+		values = self.volume.values
+		# like a write over the native protocol, the volume is only valid
+		# when there is one per channel
+		volume_valid = len(values) > 0 and len(values) == len(self.channel_map)
+		return tagstruct.write(b'B1mv111t1t', (self.version, volume_valid,
+			self.channel_map, [int(round(v * self.PA_VOLUME_NORM)) for v in values],
+			self.muted_valid, self.muted, self.device_valid, self.stream_device,
+			self.card_valid, self.card))
+
+# Every rule of the DB, invalid ones included, check is_valid
+def read_stream_rules(db):
+	# restore_db imports this module
+	from .restore_db import db_items
+	for (key, value) in db_items(db):
+		yield stream_restore_entry(key.decode(), value)
+
+# Store and delete rules, by name, in a single transaction. rules can be
+# stream_restore_entry or anything with the attributes of a
+# PulseExtStreamRestoreInfo.
+def write_stream_rules(db, rules=(), deleted=()):
+	import tdb
+	db.transaction_start()
+	try:
+		for rule in rules:
+			if not isinstance(rule, stream_restore_entry):
+				rule = stream_restore_entry.from_rule(rule)
+			db.store(rule.name.encode(), bytes(rule.encode()), tdb.REPLACE)
+		for name in deleted:
+			if db.get(name.encode()) != None:
+				db.delete(name.encode())
+	except Exception:
+		db.transaction_cancel()
+		raise
+	# a commit that fails is cancelled by tdb itself
+	db.transaction_commit()
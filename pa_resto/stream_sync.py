@@ -0,0 +1,141 @@
+# Bring the module-stream-restore rules to a desired set with as little
+# traffic as possible: the desired rules are diffed against restore_map, the
+# new and changed ones go to pulse in one stream_restore_write and the names
+# that disappeared in one stream_restore_delete. restore_map is then patched
+# with the diff instead of being read back whole.
+#
+#   desired = current_stream_rules(['sink-input-by-media-role'])
+#   desired['sink-input-by-media-role:music'] = new_rule
+#   diff = sync_stream_rules(desired.values(), ['sink-input-by-media-role'])
+import copy
+
+from .stream_restore import write_stream_rules
+from .restore_db import (
+	get_pulse,
+	get_stream_db,
+	restore_map,
+	restore_map_empty,
+	refresh_restore_map,
+	stream_rule_to_dict,
+)
+
+PA_VOLUME_NORM = 0x10000
+
+def split_rule_name(name):
+	first_colon_loc = name.find(":")
+	return (name[:first_colon_loc], name[first_colon_loc+1:])
+
+# What pulse would store for the rule, volumes are compared in volume units
+# so that a float that went through the server and back isn't a change.
+def stream_rule_state(rule):
+	state = stream_rule_to_dict(rule)
+	state['volume'] = [int(round(value*PA_VOLUME_NORM)) for value in state['volume']]
+	state['device'] = state['device'] or None
+	return state
+
+# rule name -> rule, from restore_map, for the given maps or all of them
+def current_stream_rules(maps=None):
+	if len(restore_map) == 0:
+		refresh_restore_map()
+	rules = {}
+	for association_type in (maps or restore_map.keys()):
+		for name, rule in restore_map.get(association_type, {}).items():
+			rules[association_type+":"+name] = rule
+	return rules
+
+# a rule that can be edited without touching the one kept in restore_map,
+# which is what it gets diffed against
+def copy_stream_rule(rule):
+	import pulsectl
+	new_rule = copy.copy(rule)
+	new_rule.volume = pulsectl.PulseVolumeInfo(list(rule.volume.values))
+	new_rule.channel_list = list(rule.channel_list)
+	return new_rule
+
+class stream_rules_diff:
+	def __init__(self):
+		# rules for added and changed, names for removed
+		self.added = []
+		self.changed = []
+		self.removed = []
+
+	def __len__(self):
+		return len(self.added) + len(self.changed) + len(self.removed)
+
+	@property
+	def writes(self):
+		return self.added + self.changed
+
+	# one line per rule, + added, ~ changed, - removed, for dry-runs
+	def lines(self):
+		for rule in self.added:
+			yield "+ "+rule.name
+		for rule in self.changed:
+			yield "~ "+rule.name
+		for name in self.removed:
+			yield "- "+name
+
+# Diff the desired rules against restore_map. The desired set is taken as
+# complete for the given maps, all of them by default: a rule of one of those
+# maps that isn't desired is removed, rules of other maps are left alone.
+def diff_stream_rules(desired, maps=None):
+	if maps is None:
+		maps = list(restore_map_empty.keys())
+	current = current_stream_rules(maps)
+	diff = stream_rules_diff()
+	seen = set()
+	for rule in desired:
+		association_type = split_rule_name(rule.name)[0]
+		if association_type not in maps:
+			raise ValueError("rule "+rule.name+" is outside of the maps being synced")
+		if rule.name in seen:
+			raise ValueError("rule "+rule.name+" is desired twice")
+		seen.add(rule.name)
+		existing = current.get(rule.name)
+		if existing is None:
+			diff.added.append(rule)
+		elif stream_rule_state(existing) != stream_rule_state(rule):
+			diff.changed.append(rule)
+	for name in current.keys():
+		if name not in seen:
+			diff.removed.append(name)
+	return diff
+
+# Send the diff to pulse, one write and one delete call at most, or with
+# offline write it to the stream-restore DB in one transaction, and patch
+# restore_map with it.
+def apply_stream_rules_diff(diff, offline=False):
+	write_stream_rules_diff(diff, offline)
+	patch_restore_map(diff.writes, diff.removed)
+
+# The writing half of apply_stream_rules_diff(), it doesn't touch
+# restore_map and can run on another thread, returns the diff
+def write_stream_rules_diff(diff, offline=False):
+	writes = diff.writes
+	if offline:
+		if len(diff) > 0:
+			write_stream_rules(get_stream_db(), writes, diff.removed)
+	else:
+		if len(writes) > 0:
+			get_pulse().stream_restore_write(writes, mode='replace')
+		if len(diff.removed) > 0:
+			get_pulse().stream_restore_delete(diff.removed)
+	return diff
+
+# Put the written rules in restore_map and take the removed names out
+def patch_restore_map(writes, removed):
+	for rule in writes:
+		(association_type, name) = split_rule_name(rule.name)
+		restore_map.setdefault(association_type, {})[name] = rule
+	for full_name in removed:
+		(association_type, name) = split_rule_name(full_name)
+		restore_map.get(association_type, {}).pop(name, None)
+
+# Reconcile the rules of the given maps with desired, returns the diff that
+# was applied, or that would have been with dry_run. For offline,
+# restore_map has to be filled with refresh_restore_map(offline=True).
+def sync_stream_rules(desired, maps=None, dry_run=False, offline=False):
+	diff = diff_stream_rules(desired, maps)
+	if not dry_run:
+		apply_stream_rules_diff(diff, offline)
+	return diff
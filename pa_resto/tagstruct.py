@@ -0,0 +1,236 @@
+import struct
+
+# PulseAudio's tagstruct serialization, used for the entries of the restore
+# modules' DBs, every value is preceded by a one byte tag telling its type.
+# The list of tags is found here:
+# https://gitlab.freedesktop.org/pulseaudio/pulseaudio/-/blob/master/src/pulsecore/tagstruct.h
+# Helper methods:
+# https://gitlab.freedesktop.org/pulseaudio/pulseaudio/-/blob/master/src/pulsecore/tagstruct.c
+#
+# read() decodes every value of an entry in one loop and returns their tags
+# along with them, the codecs of the entries check the tags against the
+# layout they expect with a regex instead of parsing field by field.
+# write() does the reverse from a string of tags and the values.
+#
+# Values by tag:
+#   't' str, 'N' None (a NULL string)
+#   'L' u32, 'V' volume (u32), 'B' u8, 'R' u64, 'r' s64, 'U' usec (u64)
+#   '1' True, '0' False
+#   'a' sample spec (format, channels, rate)
+#   'x' arbitrary data, bytes
+#   'T' timeval (seconds, microseconds)
+#   'm' channel map, list of channel positions
+#   'v' cvolume, list of raw volumes, PA_VOLUME_NORM is 0x10000
+#   'P' proplist, {key: value}, values are str when they hold a NUL
+#       terminated UTF-8 string as set by pa_proplist_sets(), bytes if not
+#   'f' format info (encoding, proplist)
+
+TAG_STRING = 0x74 # 't'
+TAG_STRING_NULL = 0x4e # 'N'
+TAG_U32 = 0x4c # 'L'
+TAG_U8 = 0x42 # 'B'
+TAG_U64 = 0x52 # 'R'
+TAG_S64 = 0x72 # 'r'
+TAG_SAMPLE_SPEC = 0x61 # 'a'
+TAG_ARBITRARY = 0x78 # 'x'
+TAG_BOOLEAN_TRUE = 0x31 # '1'
+TAG_BOOLEAN_FALSE = 0x30 # '0'
+TAG_TIMEVAL = 0x54 # 'T'
+TAG_USEC = 0x55 # 'U'
+TAG_CHANNEL_MAP = 0x6d # 'm'
+TAG_CVOLUME = 0x76 # 'v'
+TAG_PROPLIST = 0x50 # 'P'
+TAG_VOLUME = 0x56 # 'V'
+TAG_FORMAT_INFO = 0x66 # 'f'
+
+u32 = struct.Struct('>I')
+u64 = struct.Struct('>Q')
+s64 = struct.Struct('>q')
+sample_spec = struct.Struct('>BBI')
+timeval = struct.Struct('>II')
+
+# tag -> (struct, value is a tuple), the fixed size values
+FIXED = {
+	TAG_U32: (u32, False),
+	TAG_VOLUME: (u32, False),
+	TAG_U64: (u64, False),
+	TAG_USEC: (u64, False),
+	TAG_S64: (s64, False),
+	TAG_SAMPLE_SPEC: (sample_spec, True),
+	TAG_TIMEVAL: (timeval, True),
+}
+
+def read_string(binary, offset):
+	end = binary.index(b'\x00', offset)
+	return (str(binary[offset:end], 'utf-8'), end + 1)
+
+# str for a NUL terminated UTF-8 string, the data as it is otherwise
+def proplist_value(data):
+	if len(data) > 0 and data[-1] == 0:
+		try:
+			return data[:-1].decode('utf-8')
+		except UnicodeDecodeError:
+			pass
+	return data
+
+def read_proplist(binary, offset):
+	plist = {}
+	while True:
+		tag = binary[offset]
+		if tag == TAG_STRING_NULL:
+			return (plist, offset + 1)
+		if tag != TAG_STRING:
+			raise ValueError("expected a proplist key")
+		(key, offset) = read_string(binary, offset + 1)
+		# the length, then the same length again for the arbitrary data
+		if binary[offset] != TAG_U32 or binary[offset+5] != TAG_ARBITRARY:
+			raise ValueError("expected the length and data of "+key)
+		length = u32.unpack_from(binary, offset + 6)[0]
+		start = offset + 10
+		end = start + length
+		if end > len(binary):
+			raise ValueError("truncated value of "+key)
+		plist[key] = proplist_value(bytes(binary[start:end]))
+		offset = end
+
+# Decode the values from offset to the end of binary, returns the tags as
+# bytes, one per value, and the values. Raises ValueError, IndexError or
+# struct.error on malformed input.
+def read(binary, offset=0):
+	if isinstance(binary, memoryview):
+		binary = binary.tobytes()
+	tags = bytearray()
+	values = []
+	append = values.append
+	length = len(binary)
+	# the tags are literals, not the TAG_ names, global lookups would cost
+	# more than the rest of the loop, and the most common are tested first
+	while offset < length:
+		tag = binary[offset]
+		offset += 1
+		if tag == 0x42: # 'B'
+			append(binary[offset])
+			offset += 1
+		elif tag == 0x74: # 't'
+			end = binary.index(b'\x00', offset)
+			append(binary[offset:end].decode('utf-8'))
+			offset = end + 1
+		elif tag == 0x4e: # 'N'
+			append(None)
+		elif tag == 0x66: # 'f'
+			if binary[offset] != 0x42 or binary[offset+2] != 0x50: # 'B' 'P'
+				raise ValueError("expected the encoding and proplist of a format")
+			encoding = binary[offset+1]
+			if binary[offset+3] == 0x4e: # 'N'
+				# empty proplist, what nearly every format has
+				append((encoding, {}))
+				offset += 4
+			else:
+				(plist, offset) = read_proplist(binary, offset + 3)
+				append((encoding, plist))
+		elif tag == 0x31: # '1'
+			append(True)
+		elif tag == 0x30: # '0'
+			append(False)
+		elif tag == 0x6d: # 'm'
+			channels = binary[offset]
+			offset += 1
+			if offset + channels > length:
+				raise ValueError("truncated channel map")
+			append(list(binary[offset:offset+channels]))
+			offset += channels
+		elif tag == 0x76: # 'v'
+			channels = binary[offset]
+			append(list(struct.unpack_from('>%dI' % channels, binary, offset + 1)))
+			offset += 1 + 4*channels
+		elif tag == 0x72: # 'r'
+			append(s64.unpack_from(binary, offset)[0])
+			offset += 8
+		elif tag == 0x4c: # 'L'
+			append(u32.unpack_from(binary, offset)[0])
+			offset += 4
+		elif tag == 0x50: # 'P'
+			(plist, offset) = read_proplist(binary, offset)
+			append(plist)
+		elif tag == 0x78: # 'x'
+			size = u32.unpack_from(binary, offset)[0]
+			offset += 4
+			if offset + size > length:
+				raise ValueError("truncated arbitrary data")
+			append(binary[offset:offset+size])
+			offset += size
+		elif tag in FIXED:
+			(layout, is_tuple) = FIXED[tag]
+			value = layout.unpack_from(binary, offset)
+			append(value if is_tuple else value[0])
+			offset += layout.size
+		else:
+			raise ValueError("unknown tag 0x%02x" % tag)
+		tags.append(tag)
+	return (bytes(tags), values)
+
+def write_string(output, value):
+	if value is None:
+		output.append(TAG_STRING_NULL)
+	else:
+		output.append(TAG_STRING)
+		output += value.encode('utf-8')
+		output.append(0)
+
+def write_proplist(output, plist):
+	for key, value in plist.items():
+		write_string(output, key)
+		if isinstance(value, str):
+			value = value.encode('utf-8') + b'\x00'
+		output.append(TAG_U32)
+		output += u32.pack(len(value))
+		output.append(TAG_ARBITRARY)
+		output += u32.pack(len(value))
+		output += value
+	output.append(TAG_STRING_NULL)
+
+# Encode the values after the tags, the same as read() returns, where '1'
+# is any boolean, written '1' or '0' from its value, and 't' any string,
+# written 'N' for None. Appends to output when given, returns it.
+def write(tags, values, output=None):
+	if output is None:
+		output = bytearray()
+	if isinstance(tags, str):
+		tags = tags.encode()
+	for (tag, value) in zip(tags, values):
+		if tag == TAG_U8:
+			output.append(TAG_U8)
+			output.append(value)
+		elif tag == TAG_BOOLEAN_TRUE or tag == TAG_BOOLEAN_FALSE:
+			output.append(TAG_BOOLEAN_TRUE if value else TAG_BOOLEAN_FALSE)
+		elif tag == TAG_STRING or tag == TAG_STRING_NULL:
+			write_string(output, value)
+		elif tag == TAG_CHANNEL_MAP:
+			output.append(TAG_CHANNEL_MAP)
+			output.append(len(value))
+			output += bytes(value)
+		elif tag == TAG_CVOLUME:
+			output.append(TAG_CVOLUME)
+			output.append(len(value))
+			output += struct.pack('>%dI' % len(value), *value)
+		elif tag == TAG_FORMAT_INFO:
+			(encoding, plist) = value
+			output.append(TAG_FORMAT_INFO)
+			output.append(TAG_U8)
+			output.append(encoding)
+			output.append(TAG_PROPLIST)
+			write_proplist(output, plist or {})
+		elif tag == TAG_PROPLIST:
+			output.append(TAG_PROPLIST)
+			write_proplist(output, value)
+		elif tag == TAG_ARBITRARY:
+			output.append(TAG_ARBITRARY)
+			output += u32.pack(len(value))
+			output += value
+		elif tag in FIXED:
+			(layout, is_tuple) = FIXED[tag]
+			output.append(tag)
+			output += layout.pack(*value) if is_tuple else layout.pack(value)
+		else:
+			raise ValueError("unknown tag 0x%02x" % tag)
+	return output
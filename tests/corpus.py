@@ -0,0 +1,32 @@
+# Synthetic per_port_entry corpus for the codec tests: default port entries
+# and volume entries of every channel count pulse allows, with one to four
+# formats. Deterministic for a given seed.
+import random
+
+from pa_resto import per_port_entry
+
+def make_corpus(count, seed=0):
+	rand = random.Random(seed)
+	corpus = []
+	for i in range(count):
+		device = 'alsa_output.test-%d' % (i // 4)
+		if i % 4 == 0:
+			entry = per_port_entry('sink:'+device, None)
+			entry.is_port_format = True
+			entry.port_valid = rand.random() < 0.8
+			entry.port = 'analog-output-%d' % i if entry.port_valid else None
+		else:
+			entry = per_port_entry('sink:%s:port-%d' % (device, i), None)
+			channels = rand.choice((0, 1, 2, 6, 8, 32))
+			entry.channel_map = {'channels': channels, 'map': [rand.randrange(51) for c in range(channels)]}
+			# multiples of 1/PA_VOLUME_NORM survive the round trip exactly
+			entry.volume = {'channels': channels,
+				'values': [rand.randrange(0x18000)/entry.PA_VOLUME_NORM for c in range(channels)]}
+			entry.volume_valid = rand.random() < 0.9
+			entry.muted_valid = rand.random() < 0.9
+			entry.muted = rand.random() < 0.2
+			entry.formats = [{'encoding': rand.randrange(1, 12), 'plist': {}} for f in range(rand.choice((1, 1, 2, 4)))]
+			entry.number_of_formats = len(entry.formats)
+		entry.is_valid = True
+		corpus.append(entry)
+	return corpus
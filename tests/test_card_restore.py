@@ -0,0 +1,72 @@
+import unittest
+
+from pa_resto import card_restore_entry, tagstruct
+
+NAME = 'alsa_card.usb-Lenovo_ThinkPad_Thunderbolt_3_Dock_USB_Audio_000000000000-00'
+PORTS = {
+	'analog-output': {'offset': 0, 'profile': 'output:analog-stereo'},
+	'analog-input-mic': {'offset': -1500, 'profile': None},
+}
+
+# an entry as module-card-restore writes it at version, with its fields
+def make_entry(version):
+	tags = b'Bt'
+	values = [version, 'output:analog-stereo+input:mono-fallback']
+	if version >= 2:
+		tags += b'L'
+		values.append(len(PORTS))
+		for port, info in PORTS.items():
+			tags += b'trt' if version >= 3 else b'tr'
+			values += [port, info['offset']]
+			if version >= 3:
+				values.append(info['profile'])
+	if version >= 4:
+		tags += b'tt'
+		values += ['analog-input-mic', None]
+	if version >= 5:
+		tags += b'1'
+		values.append(True)
+	return bytes(tagstruct.write(tags, values))
+
+class card_codec_test(unittest.TestCase):
+	def test_versions(self):
+		for version in range(1, 6):
+			entry = card_restore_entry(NAME, make_entry(version))
+			self.assertTrue(entry.is_valid, version)
+			self.assertEqual(entry.version, version)
+			self.assertEqual(entry.profile, 'output:analog-stereo+input:mono-fallback')
+			if version == 1:
+				self.assertEqual(entry.ports, {})
+			elif version == 2:
+				self.assertEqual(entry.ports, {port: {'offset': info['offset'], 'profile': None}
+					for port, info in PORTS.items()})
+			else:
+				self.assertEqual(entry.ports, PORTS)
+			self.assertEqual(entry.preferred_input_port, 'analog-input-mic' if version >= 4 else None)
+			self.assertEqual(entry.preferred_output_port, None)
+			self.assertEqual(entry.profile_is_sticky, version >= 5)
+
+	def test_written_as_latest(self):
+		for version in range(1, 6):
+			entry = card_restore_entry(NAME, make_entry(version))
+			binary = bytes(entry.encode())
+			decoded = card_restore_entry(NAME, binary)
+			self.assertTrue(decoded.is_valid, version)
+			self.assertEqual(decoded.version, card_restore_entry.ENTRY_VERSION)
+			fields = entry.to_dict()
+			fields['version'] = card_restore_entry.ENTRY_VERSION
+			self.assertEqual(decoded.to_dict(), fields)
+			self.assertEqual(decoded.hex, binary.hex())
+		self.assertEqual(bytes(card_restore_entry(NAME, make_entry(5)).encode()), make_entry(5))
+
+	def test_invalid(self):
+		binary = make_entry(5)
+		# a later version, a truncated entry, a port more than counted
+		for value in (b'\x42\x06' + binary[2:], binary[:-3],
+				make_entry(3) + bytes(tagstruct.write(b'trt', ['extra', 0, None]))):
+			entry = card_restore_entry(NAME, value)
+			self.assertFalse(entry.is_valid)
+			self.assertEqual(entry.hex, '')
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+
+from pa_resto.decode_cache import decode_cache, value_digest
+
+class decode_cache_test(unittest.TestCase):
+	def setUp(self):
+		self.decoded = []
+		self.cache = decode_cache(self.decode, size=3)
+
+	# stands for an entry class, remembers what it decoded
+	def decode(self, key, value):
+		self.decoded.append((key, value))
+		return (key, value)
+
+	def test_hit_and_miss(self):
+		first = self.cache.get('a', b'1')
+		self.assertIs(self.cache.get('a', b'1'), first)
+		self.assertIs(self.cache.get('a', b'1', value_digest(b'1')), first)
+		# a new value of the key is a miss and replaces the old one
+		self.assertEqual(self.cache.get('a', b'2'), ('a', b'2'))
+		self.assertEqual(self.decoded, [('a', b'1'), ('a', b'2')])
+		self.assertEqual(len(self.cache), 1)
+		stats = self.cache.stats()
+		self.assertEqual((stats['hits'], stats['misses']), (2, 2))
+
+	def test_eviction(self):
+		for key in ('a', 'b', 'c'):
+			self.cache.get(key, b'1')
+		# a is now the most recently used, b goes first
+		self.cache.get('a', b'1')
+		self.cache.get('d', b'1')
+		self.assertEqual(len(self.cache), 3)
+		self.assertEqual(self.cache.stats()['evictions'], 1)
+		del self.decoded[:]
+		for key in ('a', 'c', 'd'):
+			self.cache.get(key, b'1')
+		self.assertEqual(self.decoded, [])
+		self.cache.get('b', b'1')
+		self.assertEqual(self.decoded, [('b', b'1')])
+
+	def test_forget(self):
+		first = self.cache.get('a', b'1')
+		self.cache.forget('a')
+		self.cache.forget('missing')
+		self.assertEqual(len(self.cache), 0)
+		again = self.cache.get('a', b'1')
+		self.assertIsNot(again, first)
+		self.assertEqual(len(self.decoded), 2)
+
+	def test_clear(self):
+		self.cache.get('a', b'1')
+		self.cache.get('b', b'1')
+		self.cache.clear()
+		self.assertEqual(len(self.cache), 0)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+
+from corpus import make_corpus
+from pa_resto import per_port_entry
+
+class round_trip_test(unittest.TestCase):
+	def assert_same(self, entry, decoded):
+		self.assertTrue(decoded.is_valid, entry.key)
+		self.assertEqual(decoded.to_dict(), entry.to_dict(), entry.key)
+
+	def test_corpus(self):
+		for entry in make_corpus(2000):
+			binary = bytes(entry.encode())
+			decoded = per_port_entry(entry.key, binary)
+			self.assert_same(entry, decoded)
+			self.assertEqual(bytes(decoded.encode()), binary, entry.key)
+
+	def test_channel_count_mismatch(self):
+		# volume and channel map disagreeing on the channel count are written
+		# as they are rather than refused
+		entry = make_corpus(2)[1]
+		entry.channel_map = {'channels': 2, 'map': [1, 2]}
+		entry.volume = {'channels': 1, 'values': [0.5]}
+		binary = bytes(entry.encode())
+		decoded = per_port_entry(entry.key, binary)
+		self.assertTrue(decoded.is_valid)
+		self.assertEqual(decoded.channel_map, entry.channel_map)
+		self.assertEqual(decoded.volume, entry.volume)
+
+	def test_hex_is_encoding(self):
+		for entry in make_corpus(20):
+			decoded = per_port_entry(entry.key, bytes(entry.encode()))
+			self.assertEqual(decoded.hex, bytes(decoded.encode()).hex(), entry.key)
+		self.assertEqual(per_port_entry(entry.key, b'\x42').hex, '')
+
+if __name__ == '__main__':
+	unittest.main()
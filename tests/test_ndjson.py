@@ -0,0 +1,42 @@
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+from synthetic import memory_db
+from pa_resto import per_port_entry, restore_db
+from pa_resto.ndjson import export_device_records, write_ndjson, read_ndjson, device_value_from_record
+
+class device_records_test(unittest.TestCase):
+	def setUp(self):
+		self.db = memory_db()
+		restore_db.db = self.db
+
+	def tearDown(self):
+		restore_db.db = None
+
+	def test_bytes_proplist_round_trip(self):
+		entry = per_port_entry('sink:alsa_output.test:hdmi-output-0', None)
+		entry.channel_map = {'channels': 2, 'map': [1, 2]}
+		entry.volume = {'channels': 2, 'values': [0.5, 1.0]}
+		entry.volume_valid = True
+		entry.muted_valid = True
+		entry.muted = False
+		# a value without the trailing NUL of pa_proplist_sets() stays bytes
+		entry.formats = [{'encoding': 2, 'plist': {'format.rate': '48000', 'format.raw': b'\x01\xff\x00\x02'}}]
+		entry.number_of_formats = 1
+		entry.is_valid = True
+		value = bytes(entry.encode())
+		self.db.store(entry.key.encode(), value)
+		self.assertIsInstance(per_port_entry(entry.key, value).formats[0]['plist']['format.raw'], bytes)
+
+		out = io.StringIO()
+		self.assertEqual(write_ndjson(out, export_device_records()), 1)
+		records = list(read_ndjson(out.getvalue().splitlines()))
+		self.assertEqual(records[0]['entry']['formats'][0]['plist']['format.raw'],
+			{'type': 'bytes', 'hex': '01ff0002'})
+		self.assertEqual(bytes(device_value_from_record(records[0])), value)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,72 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+from synthetic import memory_db, store_all, make_device_entries, make_stream_rules
+from pa_resto import policy
+from pa_resto.stream_restore import read_stream_rules
+
+# 0.3 isn't a whole pa_volume_t, it reads back as 19660/65536 from a device
+# entry and 19661/65536 from a stream rule
+POLICY = [
+	{'match': {'type': 'sink', 'port': 'analog-output-*'}, 'set': {'volume': 0.3, 'muted': False}},
+	{'match': {'type': 'sink'}, 'set': {'default_port': 'hdmi-output-0'}},
+	{'match': {'rule': 'sink-input-by-*'}, 'set': {'volume': 0.3, 'mute': True}},
+]
+
+# store_all() for stream rules, keyed by name
+def store_all_rules(db, rules):
+	for rule in rules:
+		db.store(rule.name.encode(), bytes(rule.encode()))
+
+class apply_twice_test(unittest.TestCase):
+	def setUp(self):
+		self.devices = memory_db()
+		store_all(self.devices, make_device_entries(devices=12, ports=5, channels=2, formats=1))
+		self.streams = memory_db()
+		store_all_rules(self.streams, make_stream_rules(16))
+		self.rules = policy.load_policy(POLICY)
+
+	def diff(self):
+		diff = policy.policy_diff()
+		policy.device_policy_changes(self.rules, policy.read_devices(self.devices), diff)
+		current = {rule.name: rule for rule in read_stream_rules(self.streams)}
+		policy.stream_policy_changes(self.rules, current, diff, offline=True)
+		return diff
+
+	# what apply_policy() writes, into the memory_dbs
+	def write(self, diff):
+		for (key, old, new) in diff.devices:
+			self.devices.store(key.encode(), new.encode())
+		for (old, new) in diff.streams:
+			self.streams.store(new.name.encode(), new.encode())
+
+	def test_second_run_writes_nothing(self):
+		first = self.diff()
+		self.assertTrue(len(first.devices) > 0)
+		self.assertTrue(len(first.streams) > 0)
+		self.write(first)
+		seqnums = (self.devices.seqnum, self.streams.seqnum)
+		second = self.diff()
+		self.assertEqual(second.devices, [])
+		self.assertEqual(second.streams, [])
+		self.write(second)
+		self.assertEqual((self.devices.seqnum, self.streams.seqnum), seqnums)
+
+	def test_volume_read_back(self):
+		self.write(self.diff())
+		values = [entry.volume['values'] for device in policy.read_devices(self.devices)['sink'].values()
+			for port, entry in device['ports'].items() if port.startswith('analog-output-')]
+		self.assertTrue(len(values) > 0)
+		for value in values:
+			# not 0.3 as a float, the same as 0.3 as a pa_volume_t
+			self.assertNotEqual(value, [0.3, 0.3])
+			self.assertEqual(policy.device_volume_units(value), policy.device_volume_units([0.3, 0.3]))
+		for rule in read_stream_rules(self.streams):
+			if rule.name.startswith('sink-input-by-'):
+				self.assertEqual(policy.stream_volume_units(rule.volume.values),
+					policy.stream_volume_units([0.3, 0.3]))
+
+if __name__ == '__main__':
+	unittest.main()
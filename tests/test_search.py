@@ -0,0 +1,65 @@
+import unittest
+
+from pa_resto import per_port_entry, stream_restore_entry, restore_db
+from pa_resto.search import search_index
+from pa_resto.stream_sync import stream_rules_diff
+
+SINK = 'alsa_output.usb-Generic_USB_Audio-00.analog-stereo'
+
+def port_entry(key):
+	return per_port_entry.from_dict(key, {})
+
+class search_index_test(unittest.TestCase):
+	def setUp(self):
+		self.index = search_index()
+
+	def tearDown(self):
+		restore_db.device_map.clear()
+
+	def test_add_remove(self):
+		self.index.add(('stream', 'a'), ('usb headset', None))
+		self.index.add(('stream', 'b'), ('USB speakers', 'analog'))
+		self.assertEqual(self.index.search('usb'), [('stream', 'a'), ('stream', 'b')])
+		self.assertEqual(self.index.search('usb ana'), [('stream', 'b')])
+		self.assertEqual(self.index.search('usb', limit=1), [('stream', 'a')])
+		# adding again replaces the words of the entry
+		self.index.add(('stream', 'b'), ('hdmi',))
+		self.assertEqual(self.index.search('usb'), [('stream', 'a')])
+		self.index.remove(('stream', 'a'))
+		self.index.remove(('stream', 'missing'))
+		self.assertEqual(self.index.search('usb'), [])
+		self.assertEqual(self.index.sorted_words, ['hdmi'])
+		self.index.remove(('stream', 'b'))
+		self.assertEqual((len(self.index), self.index.postings, self.index.sorted_words), (0, {}, []))
+
+	def test_stream_rules(self):
+		rule = stream_restore_entry('sink-input-by-media-role:music', None)
+		rule.device = SINK
+		diff = stream_rules_diff()
+		diff.added.append(rule)
+		self.index.update_stream_rules(diff)
+		self.assertEqual(self.index.search('music generic'), [('stream', rule.name)])
+		diff = stream_rules_diff()
+		diff.removed.append(rule.name)
+		self.index.update_stream_rules(diff)
+		self.assertEqual(len(self.index), 0)
+
+	def test_device_keys(self):
+		restore_db.device_map.update({'sink': {}, 'source': {}})
+		for key in ('sink:'+SINK, 'sink:'+SINK+':analog-output-speaker', 'sink:'+SINK+':analog-output-headphones'):
+			restore_db.add_device_entry(restore_db.device_map, port_entry(key))
+		self.index.rebuild()
+		self.assertEqual(self.index.search('usb head'), [('port', 'sink:'+SINK+':analog-output-headphones')])
+		self.assertEqual(len(self.index.search('usb')), 3)
+		# a port gone from device_map
+		del restore_db.device_map['sink'][SINK]['ports']['analog-output-headphones']
+		self.index.update_device_keys([('sink:'+SINK+':analog-output-headphones').encode()])
+		self.assertEqual(self.index.search('head'), [])
+		self.assertEqual(len(self.index.search('usb')), 2)
+		# the whole device gone
+		del restore_db.device_map['sink'][SINK]
+		self.index.update_device_keys(['sink:'+SINK])
+		self.assertEqual(len(self.index), 0)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,66 @@
+import json
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+from synthetic import make_device_entries
+from pa_resto.snapshot import binary_diff, apply_binary_diff, state_diff, apply_state_diff
+
+# states one after the other, as snapshots would see them: empty, filled,
+# the same again, entries changed, added and removed, then empty again
+def make_states(seed=0):
+	rand = random.Random(seed)
+	state = {entry.key: bytes(entry.encode()) for entry in make_device_entries(devices=6, ports=3, channels=2, formats=1)}
+	states = [{}, dict(state), dict(state)]
+	for step in range(8):
+		state = dict(state)
+		for key in rand.sample(sorted(state.keys()), 3):
+			value = bytearray(state[key] or b'\x00')
+			value[rand.randrange(len(value))] ^= 0xff
+			state[key] = bytes(value)
+		state['sink:added-%d:port' % step] = bytes(rand.randrange(256) for i in range(rand.randrange(40)))
+		del state[rand.choice(sorted(state.keys()))]
+		states.append(state)
+	states.append({})
+	return states
+
+class binary_diff_test(unittest.TestCase):
+	def test_values(self):
+		values = [b'', b'a', b'abc', b'abxc', b'xbc', b'ab', b'abcabc', b'', b'\x00\x00', b'\x00']
+		for old in values:
+			for new in values:
+				self.assertEqual(apply_binary_diff(old, binary_diff(old, new)), new, (old, new))
+
+	def test_same(self):
+		self.assertEqual(binary_diff(b'abc', b'abc'), [3, 0, ''])
+
+class state_diff_test(unittest.TestCase):
+	def test_replay(self):
+		states = make_states()
+		state = {}
+		for old, new in zip(states, states[1:]):
+			# as stored in a snapshot file
+			changes = json.loads(json.dumps(state_diff(old, new)))
+			apply_state_diff(state, changes)
+			self.assertEqual(state, new)
+		self.assertEqual(state, {})
+
+	def test_identical(self):
+		state = make_states()[1]
+		self.assertEqual(state_diff(state, dict(state)), {})
+		self.assertEqual(state_diff({}, {}), {})
+
+	def test_empty(self):
+		state = make_states()[1]
+		restored = {}
+		apply_state_diff(restored, state_diff({}, state))
+		self.assertEqual(restored, state)
+		changes = state_diff(state, {})
+		self.assertEqual(changes, dict.fromkeys(state.keys()))
+		apply_state_diff(restored, changes)
+		self.assertEqual(restored, {})
+
+if __name__ == '__main__':
+	unittest.main()
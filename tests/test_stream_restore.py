@@ -0,0 +1,18 @@
+import unittest
+
+from pa_resto import stream_restore_entry
+
+class stream_restore_entry_test(unittest.TestCase):
+	def test_channel_map_kept_without_volume(self):
+		# version 1, no valid volume, front-left front-right, empty volume,
+		# muted, no device, no card
+		binary = bytes.fromhex('4201' '30' '6d020102' '7600' '31 31 30 4e 30 4e'.replace(' ', ''))
+		entry = stream_restore_entry('sink-input-by-media-role:event', binary)
+		self.assertTrue(entry.is_valid)
+		self.assertFalse(entry.volume_valid)
+		self.assertEqual(entry.channel_list, ['front-left', 'front-right'])
+		self.assertEqual(entry.volume.values, [])
+		self.assertEqual(bytes(entry.encode()), binary)
+
+if __name__ == '__main__':
+	unittest.main()
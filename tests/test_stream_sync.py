@@ -0,0 +1,68 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+from synthetic import memory_db, make_stream_rules
+from pa_resto import restore_db, stream_restore_entry
+from pa_resto.stream_restore import stream_volume
+from pa_resto.stream_sync import diff_stream_rules, current_stream_rules
+
+class diff_stream_rules_test(unittest.TestCase):
+	def setUp(self):
+		self.db = memory_db()
+		for rule in make_stream_rules(16):
+			self.db.store(rule.name.encode(), bytes(rule.encode()))
+		restore_db.stream_db = self.db
+		restore_db.refresh_restore_map(offline=True)
+
+	def tearDown(self):
+		restore_db.stream_db = None
+		restore_db.restore_map.clear()
+
+	# the current rules as copies that can be edited
+	def desired(self, maps=None):
+		return {name: stream_restore_entry(name, bytes(rule.encode()))
+			for name, rule in current_stream_rules(maps).items()}
+
+	def test_same(self):
+		self.assertEqual(len(diff_stream_rules(self.desired().values())), 0)
+
+	def test_added_removed_changed(self):
+		desired = self.desired()
+		names = sorted(desired.keys())
+		added = stream_restore_entry('sink-input-by-media-role:added', None)
+		added.channel_list = ['front-left', 'front-right']
+		added.volume = stream_volume([0.5, 0.5])
+		added.is_valid = True
+		desired[added.name] = added
+		del desired[names[0]]
+		desired[names[1]].mute = not desired[names[1]].mute
+		desired[names[2]].volume = stream_volume([0.25] * len(desired[names[2]].volume.values))
+		diff = diff_stream_rules([desired[name] for name in sorted(desired.keys())])
+		self.assertEqual([rule.name for rule in diff.added], [added.name])
+		self.assertEqual(diff.removed, [names[0]])
+		self.assertEqual(sorted(rule.name for rule in diff.changed), names[1:3])
+		self.assertEqual(list(diff.lines()), ["+ "+added.name, "~ "+names[1], "~ "+names[2], "- "+names[0]])
+
+	def test_volume_units(self):
+		# a volume that only differs below a pa_volume_t isn't a change
+		desired = self.desired()
+		for rule in desired.values():
+			rule.volume = stream_volume([value + 1e-7 for value in rule.volume.values])
+		self.assertEqual(len(diff_stream_rules(desired.values())), 0)
+
+	def test_other_maps_left_alone(self):
+		maps = ['sink-input-by-media-role']
+		diff = diff_stream_rules([], maps)
+		self.assertEqual(sorted(diff.removed), sorted(current_stream_rules(maps).keys()))
+		self.assertTrue(all(name.startswith('sink-input-by-media-role:') for name in diff.removed))
+		rule = stream_restore_entry('sink-input-by-media-name:x', None)
+		self.assertRaises(ValueError, diff_stream_rules, [rule], maps)
+
+	def test_twice(self):
+		rule = next(iter(self.desired().values()))
+		self.assertRaises(ValueError, diff_stream_rules, [rule, rule])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+
+from pa_resto import tagstruct
+
+# tag -> values written with it, and read back the same
+VALUES = {
+	'B': [0, 1, 255],
+	'L': [0, 1, 0xffffffff],
+	'R': [0, 1 << 40, 0xffffffffffffffff],
+	'r': [0, -1, -(1 << 63), (1 << 63) - 1],
+	'U': [0, 1000000, 0xffffffffffffffff],
+	'V': [0, 0x10000, 0xffffffff],
+	't': ['', 'analog-output-speaker', 'café'],
+	'N': [None],
+	'1': [True],
+	'0': [False],
+	'a': [(3, 2, 44100), (1, 1, 48000)],
+	'x': [b'', b'\x00\x01\xff'],
+	'T': [(0, 0), (1700000000, 999999)],
+	'm': [[], [1, 2], list(range(32))],
+	'v': [[], [0x10000, 0x8000], [0xffffffff]],
+	'f': [(1, {}), (2, {'format.rate': '48000', 'format.raw': b'\x01\xff\x00\x02'})],
+	'P': [{}, {'device.description': 'Speakers', 'data': b'\x00\x01'}],
+}
+
+class round_trip_test(unittest.TestCase):
+	def assert_round_trip(self, tag, value, binary):
+		(tags, values) = tagstruct.read(binary)
+		self.assertEqual(tags, tag.encode(), (tag, value))
+		self.assertEqual(values, [value], (tag, value))
+
+	def test_every_tag(self):
+		for tag, values in VALUES.items():
+			for value in values:
+				binary = bytes(tagstruct.write(tag, [value]))
+				self.assertEqual(binary[0], ord(tag))
+				self.assert_round_trip(tag, value, binary)
+
+	def test_memoryview(self):
+		for tag, values in VALUES.items():
+			for value in values:
+				binary = tagstruct.write(tag, [value])
+				self.assert_round_trip(tag, value, memoryview(binary))
+
+	def test_all_in_one(self):
+		tags = ''.join(tag for tag, values in VALUES.items() for value in values)
+		values = [value for tag, values in VALUES.items() for value in values]
+		binary = tagstruct.write(tags, values)
+		self.assertEqual(tagstruct.read(memoryview(binary)), (tags.encode(), values))
+
+	def test_written_tags(self):
+		# '1' is any boolean and 't' any string, None included
+		self.assertEqual(tagstruct.read(tagstruct.write(b'11tt', [True, False, 'a', None]))[0], b'10tN')
+
+	def test_unknown_tag(self):
+		self.assertRaises(ValueError, tagstruct.read, b'Z\x00')
+		self.assertRaises(ValueError, tagstruct.write, b'Z', [0])
+
+if __name__ == '__main__':
+	unittest.main()